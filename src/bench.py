@@ -0,0 +1,306 @@
+#!/usr/bin/env python3
+#
+# Benchmarks for the data-race detectors.
+#
+#   python3 bench.py mem [SZ]             bytes of shadow state per tracked variable,
+#                                         traced and as accounted by footprint.py
+#   python3 bench.py run [options]        throughput, peak RSS and VC entries of
+#                                         each detector on synthetic workloads
+#   python3 bench.py clocks TRACE [--full]  time of each vector clock backend
+#                                         on the sync events of a recorded trace
+#   python3 bench.py compare [TRACE]      FT and Djit+ side by side: cost per op,
+#                                         shadow memory and differing verdicts
+#
+# `run` appends one JSON object per (workload, detector) pair to the file
+# given by --out, so that results can be tracked over time.
+
+'''
+@author:    Daniel S. Fava
+@email:     danielsf@ifi.uio.no
+@contact:   www.danielfava.com
+@copyright: CC BY 4.0, https://creativecommons.org/licenses/by/4.0/
+@date:      April 2020
+
+See https://github.com/dfava/paper.go.mm.drd
+'''
+
+import os
+import sys
+import json
+import time
+import resource
+import argparse
+import subprocess
+import tracemalloc
+import multiprocessing
+
+import synth
+import sortnp
+import rdtrace
+from ft import *
+from djit import Djit, shadowEntries
+from footprint import Footprint
+from treeclock import TreeClock
+
+DETECTORS = {'ft'       : lambda: FT(stats_interval=None),
+             'ft-tree'  : lambda: FT(stats_interval=None, vc=TreeClock),
+             'djit'     : lambda: Djit(stats_interval=None),
+            }
+
+CLOCKS = {'VC' : VC, 'TreeClock' : TreeClock}
+
+# Workloads of the default suite, as overrides of synth.DEFAULTS
+SUITE = {'base'       : {},
+         'procs64'    : {'procs' : 64},
+         'locks64'    : {'locks' : 64},
+         'shared'     : {'sharing' : 0.5},
+         'readmostly' : {'reads' : 0.98},
+         'footprint'  : {'footprint' : 1 << 24},
+         'deep'       : {'depth' : 8, 'procs' : 32},
+        }
+
+
+def memory(mkrd, evs):
+  '''Bytes allocated by a detector while consuming the event list evs'''
+  tracemalloc.start()
+  try:
+    before = tracemalloc.get_traced_memory()[0]
+    rd = sortnp.run(mkrd(), evs)
+    after = tracemalloc.get_traced_memory()[0]
+  finally:
+    tracemalloc.stop()
+  return (rd, after - before)
+
+
+def mem(sz):
+  evs = list(sortnp.events(sz))
+  print("sortnp sz=%d, events=%d" % (sz, len(evs)))
+  for (name, vc) in CLOCKS.items():
+    (rd, nbytes) = memory(lambda: FT(stats_interval=None, vc=vc), evs)
+    fp = Footprint().measure(rd)
+    print("%-8s vars=%d, procs=%d, locks=%d, bytes=%d, bytes/var=%.1f, accounted=%d (vars=%d, clocks=%d)" % (\
+        name, len(rd.vars), len(rd.procs), len(rd.locks), nbytes, nbytes / len(rd.vars),\
+        fp['fp_total'], fp['fp_vars'] + fp['fp_reads'], fp['fp_procs'] + fp['fp_locks']))
+
+
+def pack(evs):
+  '''Packs (name, args...) event tuples into Event records'''
+  ops = {'read' : Event.READ, 'write' : Event.WRITE, 'acq' : Event.ACQ,
+         'rel' : Event.REL, 'rem' : Event.REM, 'rea' : Event.REA,
+         'fork' : Event.FORK, 'join' : Event.JOIN}
+  buf = bytearray()
+  for ev in evs:
+    if ev[0] == 'end':
+      buf += Event.pack(Event.END, ev[1])
+    else:
+      buf += Event.pack(ops[ev[0]], *ev[1:])
+  return bytes(buf)
+
+
+def measure(args):
+  '''Runs one detector on one workload; meant to run in its own process,
+  so that ru_maxrss is the peak of this run alone'''
+  (rdname, params) = args
+  buf = pack(synth.events(**params))
+  rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+  rd = DETECTORS[rdname]()
+  start = time.perf_counter()
+  races = rd.process_batch(buf)
+  secs = time.perf_counter() - start
+  nevents = len(buf) // Event.size
+  ret = {'detector'   : rdname,
+         'params'     : params,
+         'events'     : nevents,
+         'races'      : len(races),
+         'secs'       : secs,
+         'ops_per_sec': nevents / secs,
+         'rss_kb'     : resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+         'rss_run_kb' : resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - rss,
+        }
+  if isinstance(rd, FT):
+    ret.update({'vars'      : len(rd.vars),
+                'vc_procs'  : Stats.getNumVcEntries(rd, 'procs'),
+                'vc_locks'  : Stats.getNumVcEntries(rd, 'locks'),
+               })
+  return ret
+
+
+def syncEvents(fname):
+  '''The sync events of a trace, which alone update the clocks of procs
+  and locks, as one buffer of Event records'''
+  buf = bytearray()
+  with rdtrace.Trace(fname) as trace:
+    for batch in trace.batches():
+      for rec in Event.unpack(batch):
+        if rec[0] >= Event.ACQ:
+          buf += Event.pack(*rec)
+  return bytes(buf)
+
+
+def clocks(fname, full=False):
+  '''Times FT with each clock backend on the sync events of a trace and,
+  with full, on the whole trace'''
+  sync = syncEvents(fname)
+  print("%s: sync events=%d" % (fname, len(sync) // Event.size))
+  for (name, vc) in CLOCKS.items():
+    rd = FT(stats_interval=None, vc=vc)
+    start = time.perf_counter()
+    rd.process_batch(sync)
+    secs = time.perf_counter() - start
+    line = "%-9s sync secs=%.3f, sync ops/sec=%d, vc procs=%d, vc locks=%d" % (name, secs, \
+        len(sync) // Event.size / secs, Stats.getNumVcEntries(rd, 'procs'), Stats.getNumVcEntries(rd, 'locks'))
+    if full:
+      rd = FT(stats_interval=None, vc=vc)
+      rd.race = False
+      start = time.perf_counter()
+      (count, races) = rdtrace.replay(fname, rd)
+      line += ", full secs=%.2f, races=%d" % (time.perf_counter() - start, len(races))
+    print(line)
+
+
+def calls(recs):
+  '''(name, args...) tuples, as taken by sortnp.run(), for Event records'''
+  for (op, tid, addr, size) in recs:
+    if op <= Event.WRITE:
+      yield (Event.names[op], tid, addr)
+    elif op <= Event.WRITE_RANGE:
+      yield ('range', tid, addr, size, op - Event.READ_RANGE)
+    elif op == Event.FORK:
+      yield ('fork', tid, addr, size)
+    elif op == Event.END:
+      yield ('end', tid)
+    elif op == Event.FREE:
+      yield ('free', addr, size)
+    else:
+      yield (Event.names[op], tid, addr)
+
+
+def verdict(ret):
+  '''The kinds of the races an op returned'''
+  if ret is None:
+    return ()
+  if type(ret) == list:
+    return tuple([race.drType for race in ret])
+  return (ret.drType,)
+
+
+def compare(evs, mem=False, show=10):
+  '''Runs FT and Djit+ in lockstep over the event list evs, timing every
+  call.  Prints, and returns, the mean cost of each op, the shadow memory
+  of each detector and the events on which their verdicts differ, the
+  first show of them in full.  With mem, also the bytes each allocates
+  over a separate run.'''
+  mkrds = {'FT' : lambda: FT(stats_interval=None), 'Djit' : lambda: Djit(stats_interval=None)}
+  rds = {name : mk() for (name, mk) in mkrds.items()}
+  for rd in rds.values():
+    rd.race = False
+  ops = {} # op : {name : [calls, ns]}
+  diffs = []
+  clock = time.perf_counter_ns
+  orders = [list(rds.keys()), list(reversed(rds.keys()))] # Neither always goes first
+  for (i, ev) in enumerate(evs):
+    got = {}
+    cost = ops.setdefault(ev[0], {name : [0, 0] for name in rds})
+    for name in orders[i & 1]:
+      f = getattr(rds[name], ev[0])
+      start = clock()
+      ret = f(*ev[1:])
+      ns = clock() - start
+      cost[name][0] += 1
+      cost[name][1] += ns
+      got[name] = verdict(ret)
+    if got['FT'] != got['Djit']:
+      diffs.append((i, ev, got))
+  print("events=%d, differing verdicts=%d" % (len(evs), len(diffs)))
+  print("%-6s %9s %11s %11s %7s" % ('op', 'calls', 'FT ns/op', 'Djit ns/op', 'ratio'))
+  for (op, cost) in ops.items():
+    (n, ft, djit) = (cost['FT'][0], cost['FT'][1] / cost['FT'][0], cost['Djit'][1] / cost['Djit'][0])
+    print("%-6s %9d %11.0f %11.0f %7.2f" % (op, n, ft, djit, djit / ft if ft else 0))
+  shadow = {}
+  for (name, rd) in rds.items():
+    shadow[name] = {'vars' : len(rd.vars), 'entries' : shadowEntries(rd)}
+    if mem:
+      shadow[name]['bytes'] = memory(mkrds[name], evs)[1]
+    print("%-6s vars=%d, shadow entries=%d%s, races=%d, unique=%d" % (name, shadow[name]['vars'], \
+        shadow[name]['entries'], ", bytes=%d" % shadow[name]['bytes'] if mem else '', \
+        rd.reporter.total, len(rd.reporter.races)))
+  for (i, ev, got) in diffs[:show]:
+    print("  #%d %s: FT=%s, Djit=%s" % (i, ' '.join([ev[0]] + [str(arg) for arg in ev[1:]]), \
+        ','.join(got['FT']) or '-', ','.join(got['Djit']) or '-'))
+  return {'ops' : ops, 'shadow' : shadow, 'diffs' : diffs}
+
+
+def revision():
+  try:
+    return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                          text=True, cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+  except OSError:
+    return None
+
+
+def run(workloads, detectors, out=None):
+  '''Measures every detector on every workload, each in a fresh process.
+  Appends the results as JSON lines to out, and returns them.'''
+  ctx = multiprocessing.get_context('spawn')
+  results = []
+  stamp = time.strftime('%Y-%m-%dT%H:%M:%S')
+  rev = revision()
+  for (wname, params) in workloads.items():
+    for rdname in detectors:
+      with ctx.Pool(1) as pool:
+        ret = pool.apply(measure, ((rdname, synth.params(**params)),))
+      ret.update({'workload' : wname, 'time' : stamp, 'rev' : rev})
+      results.append(ret)
+      print("%-10s %-9s events=%d, ops/sec=%d, rss=%dKB, vc procs=%s, vc locks=%s" % (\
+          wname, rdname, ret['events'], ret['ops_per_sec'], ret['rss_kb'],\
+          ret.get('vc_procs'), ret.get('vc_locks')))
+      if out != None:
+        with open(out, 'a') as fhandle:
+          fhandle.write(json.dumps(ret, sort_keys=True) + '\n')
+  return results
+
+
+def main(argv):
+  parser = argparse.ArgumentParser(prog=argv[0])
+  sub = parser.add_subparsers(dest='cmd', required=True)
+  p = sub.add_parser('mem', help='bytes per tracked variable on sortnp')
+  p.add_argument('sz', type=int, nargs='?', default=1000)
+  p = sub.add_parser('clocks', help='vector clock backends on a recorded trace')
+  p.add_argument('trace', help='e.g. from rdtrace.py sortnp')
+  p.add_argument('--full', action='store_true', help='also replay the whole trace')
+  p = sub.add_parser('compare', help='FT and Djit+ on the same events')
+  p.add_argument('trace', nargs='?', help='a recorded trace; by default sortnp')
+  p.add_argument('--sz', type=int, default=1000, help='size of sortnp without a trace')
+  p.add_argument('--fix', action='store_true', help='sortnp with rea')
+  p.add_argument('--mem', action='store_true', help='also bytes allocated, from separate runs')
+  p = sub.add_parser('run', help='throughput on synthetic workloads')
+  p.add_argument('--out', help='append JSON lines to this file')
+  p.add_argument('--rd', default=','.join(DETECTORS.keys()), help='comma-separated detectors')
+  p.add_argument('--workload', default=','.join(SUITE.keys()), help='comma-separated workloads from the suite')
+  for (key, val) in synth.DEFAULTS.items():
+    p.add_argument('--' + key, type=type(val), help='override for every workload (default %s)' % val)
+  args = parser.parse_args(argv[1:])
+
+  if args.cmd == 'mem':
+    mem(args.sz)
+  elif args.cmd == 'clocks':
+    clocks(args.trace, args.full)
+  elif args.cmd == 'compare':
+    if args.trace:
+      with rdtrace.Trace(args.trace) as trace:
+        evs = list(calls(trace.events()))
+    else:
+      evs = list(sortnp.events(args.sz, fix=args.fix))
+    compare(evs, args.mem)
+  elif args.cmd == 'run':
+    overrides = {key : getattr(args, key) for key in synth.DEFAULTS.keys() \
+                  if getattr(args, key) != None}
+    workloads = {}
+    for wname in args.workload.split(','):
+      workloads[wname] = dict(SUITE[wname])
+      workloads[wname].update(overrides)
+    run(workloads, args.rd.split(','), args.out)
+
+
+if __name__ == "__main__":
+  sys.exit(main(sys.argv))
@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+#
+# A Python implementation of the Djit+ data-race detector, see Pozniansky
+# and Schuster, "Efficient On-the-Fly Data Race Detection in Multithreaded
+# C++ Programs", PPoPP'03.
+#
+# Djit+ keeps a full vector clock for the reads and one for the writes of
+# every variable, where FastTrack mostly gets away with an epoch.  It is
+# here as the reference FT is measured against: both find the first race
+# on every variable, and `python3 bench.py compare` runs the two side by
+# side to report the cost of each op, the size of shadow memory and any
+# event on which their verdicts differ.
+#
+# Sync ops, gc, race reporting and sampling are FT's; only the shadow
+# state and the checks of reads and writes differ.
+
+'''
+@author:    Daniel S. Fava
+@email:     danielsf@ifi.uio.no
+@contact:   www.danielfava.com
+@copyright: CC BY 4.0, https://creativecommons.org/licenses/by/4.0/
+@date:      April 2020
+
+See https://github.com/dfava/paper.go.mm.drd
+'''
+
+import sys
+
+from ft import *
+
+
+class DjitVar():
+  '''Write and read state of a variable: the VCs w and r hold, for every
+  proc, the time of its last write and of its last read'''
+  __slots__ = ('w', 'r')
+
+  def __init__(self):
+    self.w = VC()
+    self.r = VC()
+
+  def str(self, var, pids):
+    return "var[%s]: %s %s" % (fmtAddr(var), self.w, self.r)
+
+  def entries(self):
+    return len(self.w.vc) + len(self.r.vc)
+
+
+class Djit(FT):
+  '''Djit+, with FT's sync ops; see the top of this file.  The clocks of
+  variables are plain VCs, whatever the backend of procs and locks.'''
+
+  def initVar(self, var):
+    assert(var not in self.vars)
+    v = DjitVar()
+    self.vars[var] = v
+    return v
+
+  def read(self, pid, var):
+    if __debug__:
+      self.numOps['read'] += 1
+      self.countdown -= 1
+      if not self.countdown:
+        self.stats()
+    if self.verbose:
+      print("%s: %s %s %s" % (self.__class__.__name__, 'rd ', pid, fmtAddr(var)))
+
+    assert(pid in self.procs.keys())
+    p = self.procs[pid]
+    v = self.vars.get(var)
+    if v is None:
+      v = self.initVar(var)
+
+    # Read same epoch
+    c = p.ep >> PID_BITS
+    if v.r[pid] == c:
+      return
+
+    p.dirty = True
+    if self.vcBefore(v.w, p.vc):
+      v.r[pid] = c
+      return
+
+    # Data race
+    return self.dataRace('read', p, var, v)
+
+  def write(self, pid, var):
+    if __debug__:
+      self.numOps['write'] += 1
+      self.countdown -= 1
+      if not self.countdown:
+        self.stats()
+    if self.verbose:
+      print("%s: %s %s %s" % (self.__class__.__name__, 'wr ', pid, fmtAddr(var)))
+
+    assert(pid in self.procs.keys())
+    p = self.procs[pid]
+    v = self.vars.get(var)
+    if v is None:
+      v = self.initVar(var)
+
+    # Write same epoch
+    c = p.ep >> PID_BITS
+    if v.w[pid] == c:
+      return
+
+    p.dirty = True
+    if self.vcBefore(v.w, p.vc) and self.vcBefore(v.r, p.vc):
+      v.w[pid] = c
+      return
+
+    # Data race
+    return self.dataRace('write', p, var, v)
+
+  # One word at a time, as there is no epoch to reuse across words
+  range = RaceDetector.range
+
+  def readAccount(self, r, n):
+    '''Read VCs are not accounted for, see FT.readStats'''
+    pass
+
+  def racingEntry(self, vc, pvc):
+    '''A pid whose entry in vc is not before pvc'''
+    slots = self.pidmap.slots
+    return [pid for (pid, c) in vc.vc.items() if \
+        not (c <= pvc[pid] or slots[pid] in self.retired)][0]
+
+  def dataRace(self, access, p, var, v):
+    '''As FT.dataRace, with the racing access found in the VCs of v'''
+    if access == 'read':
+      (kind, vc) = ('wr', v.w)
+    elif not self.vcBefore(v.w, p.vc):
+      (kind, vc) = ('ww', v.w)
+    else:
+      (kind, vc) = ('rw', v.r)
+    other = self.racingEntry(vc, p.vc)
+    race = self.reporter.repeat((var, other, p.id, kind))
+    if race is not None:
+      return race
+    # As in FT.dataRace, the clocks are copied for the message formatted later
+    vc = self.VC.new(p.vc) if self.VC.inplace else p.vc
+    message = partial(self.raceMessage, access, p.id, vc, var, VC.new(v.w), VC.new(v.r))
+    return self.reporter.add(DataRace(message, kind, var, p.id, other), self.verbose or self.race)
+
+  def raceMessage(self, access, pid, vc, var, w, r):
+    v = DjitVar()
+    (v.w, v.r) = (w, r)
+    message = "%s: (ERR) Data race on %s %s %s\n" % (self.__class__.__name__, access, pid, fmtAddr(var))
+    message += "  proc[%s]: %s\n" % (pid, vc)
+    message += "  %s" % v.str(var, self.pidmap.pids)
+    return message
+
+
+def shadowEntries(rd):
+  '''Epochs and VC entries held in the shadow memory of FT or Djit'''
+  ret = 0
+  for v in rd.vars.values():
+    if type(v) == DjitVar:
+      ret += v.entries()
+    elif type(v.r) == int:
+      ret += 2
+    else:
+      ret += 1 + (len(v.r) if type(v.r) == tuple else len(v.r.vc))
+  return ret
+
+
+def main(argv):
+  '''Runs FT and Djit+ on sortnp, see also `python3 bench.py compare`'''
+  import sortnp
+  sz = int(argv[1]) if len(argv) > 1 else 1000
+  evs = list(sortnp.events(sz))
+  for cls in [FT, Djit]:
+    rd = cls(stats_interval=None)
+    rd.race = False
+    sortnp.run(rd, evs)
+    print("%-4s events=%d, vars=%d, shadow entries=%d" % (cls.__name__, len(evs), len(rd.vars), \
+        shadowEntries(rd)))
+    rd.reporter.printSummary(cls.__name__)
+
+
+if __name__ == "__main__":
+  sys.exit(main(sys.argv))
@@ -0,0 +1,236 @@
+#!/usr/bin/env python3
+#
+# Bytes held by the state of FT, by kind, for its stats records.
+#
+#   procs   Proc objects, with their caches, and their clocks; the final
+#           clocks kept for joins and the tables of ended pids
+#   locks   Lock objects and their clocks
+#   vars    shadow memory: pages, unaligned entries and Var objects
+#   reads   the tuples and VCs of shared reads
+#   races   the races kept by the reporter, one per key
+#
+# Bytes are accounted for rather than measured: the size of a Python
+# object of each kind, taken once with sys.getsizeof, is multiplied by the
+# counts FT already keeps up to date (clock sizes in its Census, entries in
+# its Shadow, shared reads in FT.readStats), so that a record costs time in
+# the number of distinct clock sizes, not in the size of the state.  Only
+# final clocks, no more than the joins still expected, are sized one by
+# one.  Ints are not counted, as pids and most clock entries are small
+# cached ints, but for packed epochs, one per epoch a proc has left in
+# shadow memory or in the table of dead pids.
+#
+# The accounting errs on the high side for clocks: a clock shared by
+# several procs and locks, e.g. after a rel, is counted once for each, and
+# a VCView is counted as a clock of its size, though it adds three slots to
+# a base that some lock usually holds too.  Caches are counted empty, and
+# the texts of race messages are left out, as are all strings.
+#
+# Under python3 -O, FT keeps neither its Census nor readStats nor numOps;
+# measure() then walks the clocks and shadow memory instead, in time
+# linear in the state.
+#
+# With trace, tracemalloc is started and every record also carries the
+# bytes allocated by the detector's modules and still live, as a check on
+# the accounting.  Tracing slows the detector down several times.
+#
+# footprint(spec) parses 'count' or 'trace', e.g. from $FT_FOOTPRINT.
+
+'''
+@author:    Daniel S. Fava
+@email:     danielsf@ifi.uio.no
+@contact:   www.danielfava.com
+@copyright: CC BY 4.0, https://creativecommons.org/licenses/by/4.0/
+@date:      April 2020
+
+See https://github.com/dfava/paper.go.mm.drd
+'''
+
+import sys
+import tracemalloc
+from array import array
+
+import ft
+import shadow
+
+EXACT = 64 # Clock sizes up to this are measured exactly; larger ones in steps
+STEPS = 16 # of 1/STEPS of the power of 2 below them
+
+
+def sizeof(obj, seen=None):
+  '''Bytes of obj and of the containers and objects it refers to.  Ints,
+  strings and None are left out, as are classes.'''
+  seen = set() if seen == None else seen
+  if id(obj) in seen or obj is None or type(obj) in [int, float, str, bool, type]:
+    return 0
+  seen.add(id(obj))
+  ret = sys.getsizeof(obj)
+  if type(obj) == dict:
+    for (key, val) in obj.items():
+      ret += sizeof(key, seen) + sizeof(val, seen)
+  elif type(obj) in [list, tuple, set, frozenset]:
+    for item in obj:
+      ret += sizeof(item, seen)
+  elif type(obj) != array:
+    for cls in type(obj).__mro__:
+      for slot in cls.__dict__.get('__slots__', ()):
+        if hasattr(obj, slot):
+          ret += sizeof(getattr(obj, slot), seen)
+    if hasattr(obj, '__dict__'):
+      ret += sizeof(obj.__dict__, seen)
+  return ret
+
+
+def bucket(n):
+  '''n rounded up to a size that is measured'''
+  if n <= EXACT:
+    return n
+  step = (1 << (n.bit_length() - 1)) // STEPS
+  return (n + step - 1) // step * step
+
+
+class Footprint():
+  '''Accounts for the bytes of the state of an FT; see the top of this file'''
+
+  def __init__(self, trace=False):
+    self.trace = trace
+    self.sizes = {} # (kind, size) : bytes
+    if trace and not tracemalloc.is_tracing():
+      tracemalloc.start()
+
+  def clockBytes(self, vc, n):
+    '''Bytes of a clock of backend vc with n entries'''
+    key = (vc, bucket(n))
+    ret = self.sizes.get(key)
+    if ret is None:
+      sample = vc.bind(ft.PidMap())()
+      for pid in range(key[1]):
+        sample[pid] = 1
+      ret = self.sizes[key] = sizeof(sample)
+    return ret
+
+  def dictBytes(self, n):
+    key = (dict, bucket(n))
+    ret = self.sizes.get(key)
+    if ret is None:
+      ret = self.sizes[key] = sys.getsizeof({i : None for i in range(key[1])})
+    return ret
+
+  def clocks(self, vc, census):
+    return sum([count * self.clockBytes(vc, n) for (n, count) in census.hist.items()])
+
+  def raceBytes(self):
+    '''Bytes of a race kept by a RaceReporter, with its key'''
+    key = (ft.DataRace, 1)
+    ret = self.sizes.get(key)
+    if ret is None:
+      race = ft.DataRace('', 'wr', 0x10, 1, 0)
+      ret = self.sizes[key] = sizeof(race) + sizeof(race.key())
+    return ret
+
+  @staticmethod
+  def walk(rd):
+    '''readStats of rd and the packed epochs in its shadow memory,
+    counted by a walk over it'''
+    stats = {'small' : 0, 'vcs' : 0, 'entries' : 0, 'small_entries' : 0}
+    epochs = set()
+    for (_, v) in rd.vars.items():
+      epochs.add(id(v.w))
+      r = v.r
+      if type(r) == int:
+        epochs.add(id(r))
+      elif type(r) == tuple:
+        epochs.update([id(e) for e in r])
+        stats['small'] += 1
+        stats['small_entries'] += len(r)
+        stats['entries'] += len(r)
+      else:
+        stats['vcs'] += 1
+        stats['entries'] += r.size()
+    return (stats, len(epochs))
+
+  def measure(self, rd):
+    '''Bytes of the procs, locks, vars, shared reads and races of rd, an
+    FT, as stats fields; see the top of this file for what is left out'''
+    census = rd.census
+    if census == None or not __debug__: # Not kept: count the clocks now
+      census = {'procs' : ft.Census(), 'locks' : ft.Census()}
+      for (where, dct) in [('procs', rd.procs), ('locks', rd.locks)]:
+        for obj in dct.values():
+          census[where].add(obj.vc, rd.deleted_pids)
+    epoch = sys.getsizeof(ft.pack(1, 0))
+    proc = sys.getsizeof(ft.Proc.__new__(ft.Proc)) + 2 * sys.getsizeof(set())
+    lock = sys.getsizeof(ft.Lock.__new__(ft.Lock))
+    finals = sum([self.clockBytes(rd.VC, vc.size()) for vc in rd.finals.values()])
+    ended = self.dictBytes(len(rd.finals)) + self.dictBytes(len(rd.joiners)) + \
+        self.dictBytes(len(rd.dead)) + len(rd.dead) * epoch + \
+        sys.getsizeof(rd.deleted_pids) + sys.getsizeof(rd.retired)
+    procs = len(rd.procs) * proc + self.clocks(rd.VC, census['procs']) + self.dictBytes(len(rd.procs)) + \
+        finals + ended
+    locks = len(rd.locks) * lock + self.clocks(rd.VC, census['locks']) + self.dictBytes(len(rd.locks)) + \
+        sys.getsizeof(rd.lockAddrs)
+    vars = rd.vars
+    pages = len(vars.pages)
+    nvars = len(vars)
+    var = sys.getsizeof(ft.Var())
+    if __debug__:
+      stats = rd.readStats
+      # A packed epoch is an int object of its own, shared by the variables
+      # accessed in the epoch: at most one per epoch, and two per variable
+      ticks = rd.numOps['rel'] + rd.numOps['rem'] + rd.numOps['rea'] + 2 * len(rd.pidmap)
+      epochs = min(ticks, 2 * nvars + stats['small_entries'])
+    else:
+      (stats, epochs) = self.walk(rd)
+    vbytes = pages * sys.getsizeof([None] * shadow.PAGE_SLOTS) + self.dictBytes(pages) + \
+        nvars * var + self.dictBytes(len(vars.other)) + sys.getsizeof(vars.odd) + epochs * epoch
+    vcEntries = stats['entries'] - stats['small_entries']
+    reads = stats['small'] * sys.getsizeof(()) + stats['small_entries'] * 8
+    if stats['vcs']:
+      reads += stats['vcs'] * self.clockBytes(rd.VC, round(vcEntries / stats['vcs']))
+    nraces = len(rd.reporter.races)
+    races = self.dictBytes(nraces) + nraces * self.raceBytes()
+    ret = {'fp_procs' : procs,
+           'fp_locks' : locks,
+           'fp_vars'  : vbytes,
+           'fp_reads' : reads,
+           'fp_races' : races,
+           'fp_total' : procs + locks + vbytes + reads + races,
+          }
+    if self.trace:
+      ret['fp_traced'] = self.traced(rd)
+    return ret
+
+  @staticmethod
+  def traced(rd):
+    '''Bytes allocated, and still live, from the modules of rd, its clocks
+    and its shadow memory'''
+    files = set([ft.__file__, shadow.__file__])
+    for cls in [type(rd), rd.VC]:
+      for base in cls.__mro__:
+        module = sys.modules.get(base.__module__)
+        if getattr(module, '__file__', None):
+          files.add(module.__file__)
+    snapshot = tracemalloc.take_snapshot().filter_traces( \
+        [tracemalloc.Filter(True, fname) for fname in files])
+    return sum([stat.size for stat in snapshot.statistics('filename')])
+
+
+def footprint(spec):
+  '''A Footprint for 'count' or 'trace', or None for no spec'''
+  if not spec:
+    return None
+  assert(spec in ['count', 'trace'])
+  return Footprint(trace=spec == 'trace')
+
+
+def main(argv):
+  '''Accounts for, and traces, the footprint of FT on sortnp'''
+  import sortnp
+  sz = int(argv[1]) if len(argv) > 1 else 1000
+  fp = Footprint(trace=True)
+  rd = sortnp.run(ft.FT(stats_interval=None), sortnp.events(sz))
+  for (field, val) in fp.measure(rd).items():
+    print("%-9s %d" % (field, val))
+
+
+if __name__ == "__main__":
+  sys.exit(main(sys.argv))
@@ -17,12 +17,46 @@ See https://github.com/dfava/paper.go.mm.drd
 
 import os
 import sys
-import inspect
+from bisect import bisect_left, insort
+from functools import partial
 
 from race import *
+from shadow import Shadow, WORD_BITS, WORD_MASK
+import sampler as smp
+import statsink
+import footprint as fp
+
+
+# Shadow state keeps epochs packed into a single int, c << PID_BITS | slot,
+# where slot is the pid's index in the detector's PidMap.  Pid 0 always has
+# slot 0, so the initial epoch 0@0 packs to 0.
+PID_BITS = 32
+PID_MASK = (1 << PID_BITS) - 1
+
+# Up to this many concurrent reads of a variable are kept as a tuple of
+# packed epochs; more take a VC
+SMALL_READS = 4
+# Read VCs are pruned once every this many updates, see FT.readShared
+PRUNE_INTERVAL = 256
+# Addresses a proc remembers having read, and written, in its current
+# epoch, see Proc.reads
+CACHE_SIZE = 256
+
+def pack(c, slot):
+  return (c << PID_BITS) | slot
+
+def before(e, vc, pids, retired):
+  '''Packed epoch e happens-before (is <=) vector clock vc.  Epochs of
+  retired pids (slots) happen-before every proc's clock, see FT.gc.'''
+  return e >> PID_BITS <= vc[pids[e & PID_MASK]] or e & PID_MASK in retired
+
+def epochStr(e, pids):
+  return "%s@%s" % (e >> PID_BITS, pids[e & PID_MASK])
 
 
 class Epoch():
+  __slots__ = ('c', 'pid')
+
   def __init__(self, c, pid):
     assert(type(c) == int)
     self.c = c
@@ -32,7 +66,7 @@ class Epoch():
     return isinstance(rhs, Epoch) and self.c == rhs.c and self.pid == rhs.pid
 
   def __le__(self, rhs):
-    assert(type(rhs) in [Epoch, VC])
+    assert(isinstance(rhs, (Epoch, VC)))
     if type(rhs) == Epoch:
       return self.pid == rhs.pid and self.c <= rhs.c
     return self.c <= rhs[self.pid]
@@ -45,6 +79,14 @@ class Epoch():
 
 
 class VC():
+  __slots__ = ('vc',)
+  # FT updates the clocks of procs and locks through join, copy and tick,
+  # and assigns back the clock they return.  VC never mutates a clock
+  # once it is assigned, see VCView; a backend that updates clocks
+  # in place, e.g. TreeClock, sets inplace, and keeps in `fresh` the pids
+  # that the last join or copy into a clock added to it.
+  inplace = False
+
   def __init__(self, *epochs):
     self.vc = {}
     for epoch in epochs:
@@ -59,6 +101,9 @@ class VC():
     except KeyError:
       return 0
 
+  def __setitem__(self, key, c):
+    self.vc[key] = c
+
   def inc(self, pid):
     try:
       self.vc[pid] += 1
@@ -66,44 +111,178 @@ class VC():
       self.vc[pid] = 1
 
   def __le__(self, rhs):
-    assert(type(rhs)==VC)
+    assert(isinstance(rhs, VC))
     for pid in self.vc.keys():
       if self[pid] > rhs[pid]:
         return False
     return True
 
+  def size(self):
+    '''Number of entries'''
+    return len(self.vc)
+
+  def pids(self):
+    '''The pids with an entry'''
+    return self.vc.keys()
+
+  def drop(self, pids):
+    '''Removes the entries of pids; returns how many there were'''
+    ret = 0
+    for pid in pids:
+      if pid in self.vc:
+        del(self.vc[pid])
+        ret += 1
+    return ret
+
   def __str__(self):
     return self.vc.__str__()
 
   def __repr__(self):
     return self.vc.__repr__()
 
+  @classmethod
+  def bind(cls, pidmap=None):
+    '''Returns the class an FT instance should use for its clocks'''
+    return cls
+
   @classmethod
   def new(cls, other):
-    assert(type(other) == VC)
+    assert(isinstance(other, VC))
     ret = VC()
     ret.vc = dict(other.vc)
     return ret
 
+  @classmethod
+  def join(cls, vc, other):
+    '''vc \\cup other, to replace vc, the clock of a proc'''
+    return cls.lub(vc, other)
+
+  @classmethod
+  def copy(cls, vc, other, known=False):
+    '''A clock equal to other, to replace vc; known when vc <= other'''
+    return other
+
+  def tick(self, pid):
+    '''The clock with the entry of pid incremented, to replace it'''
+    return VCView(self, pid, self[pid] + 1)
+
   @classmethod
   def lub(cls, vc1, vc2):
-    assert(type(vc1) == VC)
-    assert(type(vc2) == VC)
+    assert(isinstance(vc1, VC))
+    assert(isinstance(vc2, VC))
+    if type(vc1) == VCView or type(vc2) == VCView:
+      return VCView.lub(VC, vc1, vc2)
     ret = VC()
-    keys = set().union(vc1.vc.keys(), vc2.vc.keys())
-    for item in keys:
-      ret.vc[item] = vc1[item] if vc1[item] > vc2[item] else vc2[item]
+    ret.vc = dict(vc1.vc)
+    for (item, c) in vc2.vc.items():
+      if c > ret[item]:
+        ret.vc[item] = c
     return ret
-      
+
+
+class PidMap():
+  '''Maps pids (e.g. TSan unique_ids) onto dense slots 0, 1, 2, ...'''
+  __slots__ = ('slots', 'pids')
+
+  def __init__(self):
+    self.slots = {}
+    self.pids = []
+
+  def slot(self, pid):
+    try:
+      return self.slots[pid]
+    except KeyError:
+      self.slots[pid] = len(self.pids)
+      self.pids.append(pid)
+      return self.slots[pid]
+
+  def __len__(self):
+    return len(self.pids)
+
+
+class VCView(VC):
+  '''The clock base with the entry of pid set to c.
+
+  FT never mutates a clock once it is assigned to a proc or lock, so
+  clocks can be shared: a release hands the proc's clock to the lock
+  as is.  Proc.inc, the one update of a proc's own clock, makes a new
+  view over the same base instead of copying it.'''
+  __slots__ = ('base', 'pid', 'c')
+
+  def __init__(self, base, pid, c):
+    assert(type(base) != VCView)
+    self.base = base
+    self.pid = pid
+    self.c = c
+
+  @property
+  def vc(self):
+    ret = dict(self.base.vc)
+    ret[self.pid] = self.c
+    return ret
+
+  def __getitem__(self, key):
+    return self.c if key == self.pid else self.base[key]
+
+  def size(self):
+    return self.base.size() + (not self.base[self.pid])
+
+  def pids(self):
+    pids = self.base.pids()
+    return pids if self.base[self.pid] else list(pids) + [self.pid]
+
+  def __setitem__(self, key, c):
+    assert(0) # Immutable
+
+  def inc(self, pid):
+    assert(0) # Immutable
+
+  def drop(self, pids):
+    assert(0) # Immutable
+
+  def tick(self, pid):
+    return VCView(self.base, pid, self[pid] + 1)
+
+  @staticmethod
+  def lub(cls, vc1, vc2):
+    '''cls.lub of vc1 and vc2, either of which may be a view'''
+    a = vc1.base if type(vc1) == VCView else vc1
+    b = vc2.base if type(vc2) == VCView else vc2
+    ret = cls.lub(a, b)
+    for view in (vc1, vc2):
+      if type(view) == VCView and view.c > ret[view.pid]:
+        ret[view.pid] = view.c
+    return ret
+
 
 class Proc():
-  def __init__(self, pid):
+  '''reads and writes cache the addresses whose shadow state already holds
+  the proc's read, or write, in the current epoch: a repeat of the access
+  is then known to be race free and to change nothing, and FT.read and
+  FT.write return without looking up shadow memory.  They are emptied
+  whenever the epoch moves on, and hold up to FT.cacheSize addresses.'''
+  __slots__ = ('id', 'vc', 'slot', 'ep', 'dirty', 'reads', 'writes')
+
+  def __init__(self, pid, vc=VC, slot=0):
     self.id = pid
-    self.vc = VC()
+    self.vc = vc()
+    self.slot = slot
+    self.reads = set()
+    self.writes = set()
     self.inc()  # See FT's "initial analysis state"
 
   def inc(self):
-    self.vc.inc(self.id)
+    self.vc = vc = self.vc.tick(self.id)
+    self.ep = pack(vc[self.id], self.slot) # Current epoch, packed
+    self.dirty = False # Whether shadow state may hold the current epoch
+    if self.reads:
+      self.reads.clear()
+    if self.writes:
+      self.writes.clear()
+
+  def lastEpoch(self):
+    '''Clock of the latest epoch that may appear in shadow state'''
+    return self.vc[self.id] if self.dirty else self.vc[self.id] - 1
 
   def epoch(self):
     return Epoch(self.vc[self.id], self.id)
@@ -113,38 +292,190 @@ class Proc():
 
 
 class Lock():
-  def __init__(self, lid):
+  __slots__ = ('id', 'vc', 'known')
+
+  def __init__(self, lid, vc=VC):
     self.id = lid
-    self.vc = VC()
+    self.vc = vc()
+    # The pids of procs whose clocks are >= self.vc, i.e. that gain nothing
+    # from acquiring the lock; None for all of them, as self.vc is empty
+    self.known = None
 
   def __str__(self):
-    return "lock[%s]: %s" % (self.id, self.vc)
+    return "lock[%s]: %s" % (fmtAddr(self.id), self.vc)
 
 
 class Var():
+  '''Write and read state of a variable; its address is the shadow key.
+  w is a packed epoch.  r is a packed epoch, or when reads are shared, a
+  tuple of up to SMALL_READS packed epochs or a VC.'''
+  __slots__ = ('w', 'r')
+
   # Assume proc 0 is always present and is the initial process
-  def __init__(self, var):
-    self.var = var
-    self.w = Epoch(0,0)
-    self.r = Epoch(0,0)
+  def __init__(self):
+    self.w = 0
+    self.r = 0
+
+  def str(self, var, pids):
+    r = self.r
+    if type(r) == int:
+      r = epochStr(r, pids)
+    elif type(r) == tuple:
+      r = {pids[e & PID_MASK] : e >> PID_BITS for e in r}
+    return "var[%s]: %s %s" % (fmtAddr(var), epochStr(self.w, pids), r)
+
+
+class Census():
+  '''Sizes of the clocks of procs or of locks, kept up to date by FT at
+  every assignment of a clock, so that stats() need not walk them.
+
+  hist maps a clock size to the number of clocks of that size; pids maps
+  a pid to the number of clocks with an entry for it.  Most assignments
+  join a clock into the one replaced, and so can only add the entries of
+  the clock joined in: an update then costs O(1) while the size stays the
+  same, and otherwise a lookup per entry of the clock joined in.  Only a
+  clock replaced by an unrelated one, e.g. a lock released by a proc that
+  did not acquire it, is compared entry by entry.  Proc.inc never changes
+  a size, since a proc's own entry is always set.'''
+  __slots__ = ('hist', 'total', 'pids', 'dead')
+
+  def __init__(self):
+    self.hist = {}  # size : clocks
+    self.total = 0  # Entries over all clocks
+    self.pids = {}  # pid : clocks with an entry for pid
+    self.dead = 0   # Entries of ended pids
+
+  def resize(self, old, new):
+    if old != None:
+      self.hist[old] -= 1
+      if not self.hist[old]:
+        del(self.hist[old])
+      self.total -= old
+    if new != None:
+      self.hist[new] = self.hist.get(new, 0) + 1
+      self.total += new
+
+  def count(self, keys, n, deleted):
+    for pid in keys:
+      c = self.pids.get(pid, 0) + n
+      if c:
+        self.pids[pid] = c
+      else:
+        del(self.pids[pid])
+      if pid in deleted:
+        self.dead += n
+
+  def add(self, vc, deleted):
+    self.resize(None, vc.size())
+    self.count(vc.pids(), 1, deleted)
+
+  def remove(self, vc, deleted):
+    self.resize(vc.size(), None)
+    self.count(vc.pids(), -1, deleted)
+
+  def replace(self, kept, new, deleted, src=None):
+    '''The clock kept by keep() was replaced by new; with src, new is
+    old \\cup src'''
+    (old, m) = kept
+    if new is old and not new.inplace:
+      return
+    if type(new) == VCView and type(old) == VCView and new.base is old.base and \
+        (new.pid == old.pid or (new.base[new.pid] and old.base[old.pid])):
+      return # Views with the same entries, e.g. of a proc releasing again
+    n = new.size()
+    if src is not None:
+      if m == n: # Nothing added, usual for clocks of long-lived procs
+        return
+      self.resize(m, n)
+      # An inplace clock no longer knows what it held
+      added = new.fresh if new is old else [pid for pid in src.pids() if not old[pid]]
+      self.count(added, 1, deleted)
+      return
+    assert(new is not old) # Clocks are only updated in place by joins
+    self.resize(m, n)
+    (old, new) = (set(old.pids()), set(new.pids()))
+    self.count(old - new, -1, deleted)
+    self.count(new - old, 1, deleted)
 
-  def __str__(self):
-    return "var[%s]: %s %s" % (self.var, self.w, self.r)
+  def end(self, pid):
+    '''pid has just been added to the deleted pids'''
+    self.dead += self.pids.get(pid, 0)
+
+  def drop(self, size, dropped):
+    '''A clock of the given size lost dropped entries, all of ended pids'''
+    self.resize(size, size - dropped)
+    self.dead -= dropped
+
+  def forget(self, pids):
+    '''pids were dropped from every clock'''
+    for pid in pids:
+      self.pids.pop(pid, None)
+
+  @staticmethod
+  def keep(vc):
+    '''What replace() needs of vc, before vc is updated: vc and its size'''
+    return (vc, vc.size())
 
 
 class FT(RaceDetector):
 
-  def __init__(self,verbose=False, stats_interval=10000):
+  # TSan constructs FT without arguments, so these defaults can be set from
+  # the environment: FT_STATS names a file for statsink.sink(), and
+  # FT_STATS_INTERVAL is the number of ops between records
+  # FT_STATS_HIST, when set, adds the histograms of clock sizes to the stats,
+  # as sizes_procs and sizes_locks
+  # FT_SAMPLE gives a sampler of reads and writes, see sampler.sampler()
+  # FT_CACHE_SIZE bounds the per-proc caches of accesses, 0 turns them off
+  # FT_FOOTPRINT adds the bytes of the state to the stats, see footprint.py
+  def __init__(self,verbose=False, stats_interval=int(os.environ.get('FT_STATS_INTERVAL', 10000)),\
+                vc=VC, gc_interval=None, gc_threshold=None, stats_sink=None,\
+                stats_hist=bool(os.environ.get('FT_STATS_HIST')), sampler=None,\
+                cache_size=int(os.environ.get('FT_CACHE_SIZE', CACHE_SIZE)), footprint=None):
     assert(type(verbose)==bool)
+    assert(type(stats_hist)==bool)
     assert(stats_interval==None or type(stats_interval)==int)
+    assert(stats_sink==None or isinstance(stats_sink, statsink.Sink))
+    assert(sampler==None or isinstance(sampler, smp.Sampler))
+    assert(issubclass(vc, VC))
+    assert(gc_interval==None or type(gc_interval)==int)
+    assert(gc_threshold==None or type(gc_threshold)==int)
+    assert(type(cache_size)==int and cache_size >= 0)
+    assert(footprint==None or isinstance(footprint, fp.Footprint))
+    self.pidmap = PidMap()
+    self.pidmap.slot(0)
+    self.VC = vc.bind(self.pidmap) # Vector clock backend, e.g. VC or TreeClock
     self.procs = {}
     self.locks = {}
-    self.vars = {}
+    self.lockAddrs = []  # Sorted integer keys of self.locks, for free()
+    self.vars = Shadow() # Keyed by integer address
     self.deleted_pids = set()
-    self.procs[0] = Proc(0) # Proc 0 is always present
+    self.joiners = {}     # pid : joins still expected on pid, see fork()
+    self.finals = {}      # Final clocks of ended pids, see join()
+    self.dead = {}        # Ended pids not yet retired, with their lastEpoch
+    self.retired = set()  # Slots of pids dropped from all clocks by gc()
+    self.gc_interval = gc_interval   # Sync ops between gc() passes
+    self.gc_threshold = gc_threshold # Pending dead pids that force a pass
+    self.gcOn = gc_interval != None or gc_threshold != None
+    self.gcCountdown = gc_interval
+    self.gcStats = {'passes' : 0, 'retired' : 0, 'dropped' : 0}
+    self.procs[0] = Proc(0, self.VC) # Proc 0 is always present
+    # Clock sizes, maintained only when stats are on
+    self.census = None if stats_interval == None else {'procs' : self.mkcensus(), 'locks' : self.mkcensus()}
+    if __debug__:
+      if self.census:
+        self.census['procs'].add(self.procs[0].vc, self.deleted_pids)
+    self.stats_hist = stats_hist
+    # Shared read state: vars with a tuple or VC for r, their entries, and
+    # how many times one shrank; small_entries are the entries of tuples
+    self.readStats = {'small' : 0, 'vcs' : 0, 'entries' : 0, 'shrunk' : 0, 'small_entries' : 0}
+    self.pruneCountdown = PRUNE_INTERVAL
+    self.acqSkipped = 0 # Acquires that needed no lub, see Lock.known
+    self.cacheSize = cache_size # See Proc.reads
+    self.cacheHits = {'read' : 0, 'write' : 0}
     self.verbose = verbose
     self.info = False
-    self.race = True
+    self.race = True # Print races, see RaceReporter
+    self.reporter = RaceReporter()
     self.numOps = {'read'  : 0,
                    'write' : 0,
                    'acq'   : 0,
@@ -153,39 +484,75 @@ class FT(RaceDetector):
                    'rea'   : 0,
                   }
     self.stats_interval = stats_interval
+    # Ops left until the next call to stats().  Never reaches 0 when stats
+    # are off.  The bookkeeping sits in `if __debug__:` blocks, so running
+    # under `python3 -O` (PYTHONOPTIMIZE=1 when embedded in TSan) compiles
+    # it out of the hot paths entirely, together with the asserts.
+    self.countdown = -1 if stats_interval == None else stats_interval
+    if stats_sink == None:
+      stats_sink = statsink.sink(os.environ.get('FT_STATS'))
+    self.sink = stats_sink
+    if footprint == None:
+      footprint = fp.footprint(os.environ.get('FT_FOOTPRINT'))
+    self.footprint = footprint
+    if sampler == None:
+      sampler = smp.sampler(os.environ.get('FT_SAMPLE'))
+    # With a sampler, only the accesses it picks reach the checks; without
+    # one, read, write and range are the checks themselves
+    self.sampler = sampler
+    if sampler != None:
+      (self.checkRead, self.checkWrite, self.checkRange) = (self.read, self.write, self.range)
+      (self.read, self.write, self.range) = (self.sampledRead, self.sampledWrite, self.sampledRange)
 
 
   def getTotalOps(self):
     return sum([self.numOps[i] for i in self.numOps.keys()])
 
 
-  def isTimeToPrintStats(self):
-    return type(self.stats_interval) == int and \
-              self.getTotalOps() % self.stats_interval == 0
-
-
   def stats(self):
-    if self.isTimeToPrintStats():
-      num_ops = self.getTotalOps()
-
-      data = {'procs' : {'all' : None},
-              'locks' : {'all' : None},
-             }
-      for where in data.keys():
-        data[where]['all'] = Stats.getVcEntries(self, where)
-
-      nprocs = len(self.procs.keys())
-      print("%s, ops=%d, procs=%d/%d, locks=%d, VC procs=%d, VC locks=%d" % (\
-          self.__class__.__name__,\
-          num_ops,\
-          nprocs,\
-          nprocs + len(self.deleted_pids),\
-          len(self.locks.keys()),\
-          Stats.countVcEntries(data['procs']['stale']),\
-          Stats.countVcEntries(data['procs']['all']),\
-          Stats.countVcEntries(data['locks']['stale']),\
-          Stats.countVcEntries(data['locks']['all']),\
-          ))
+    '''Called by the operations whenever countdown reaches 0'''
+    self.countdown = self.stats_interval
+    num_ops = self.getTotalOps()
+
+    nprocs = len(self.procs.keys())
+    (procs, locks) = (self.census['procs'], self.census['locks'])
+    rec = {'ops'           : num_ops,
+           'procs'         : nprocs,
+           'procs_all'     : nprocs + len(self.deleted_pids),
+           'locks'         : len(self.locks.keys()),
+           'vc_procs_live' : procs.total - procs.dead,
+           'vc_procs'      : procs.total,
+           'vc_locks_live' : locks.total - locks.dead,
+           'vc_locks'      : locks.total,
+          }
+    if self.gcOn:
+      rec.update({'gc_passes'  : self.gcStats['passes'],
+                  'gc_dead'    : len(self.dead),
+                  'gc_retired' : self.gcStats['retired'],
+                  'gc_dropped' : self.gcStats['dropped'],
+                 })
+    rec.update({'rd_small'   : self.readStats['small'],
+                'rd_vcs'     : self.readStats['vcs'],
+                'rd_entries' : self.readStats['entries'],
+                'rd_shrunk'  : self.readStats['shrunk'],
+               })
+    if self.cacheSize:
+      (reads, writes) = (self.numOps['read'], self.numOps['write'])
+      rec.update({'cache_rd_hits' : self.cacheHits['read'],
+                  'cache_wr_hits' : self.cacheHits['write'],
+                  'cache_rd_rate' : self.cacheHits['read'] / reads if reads else 0.0,
+                  'cache_wr_rate' : self.cacheHits['write'] / writes if writes else 0.0,
+                 })
+    if self.sampler != None:
+      rec.update(self.sampler.stats())
+      rec['smp_races'] = len(self.reporter.races)
+    if self.footprint != None:
+      rec.update(self.footprint.measure(self))
+    if self.stats_hist:
+      rec.update({'sizes_procs' : dict(procs.hist),
+                  'sizes_locks' : dict(locks.hist),
+                 })
+    self.sink.write(self.__class__.__name__, rec)
 
   def printProcs(self, fmt=None):
     assert(fmt==None)
@@ -193,8 +560,8 @@ class FT(RaceDetector):
       print(self.procs[pid])
 
   def printVars(self):
-    for v in self.vars.keys():
-      print(self.vars[v])
+    for (var, v) in self.vars.items():
+      print(v.str(var, self.pidmap.pids))
   
   def printLocks(self):
     for l in self.locks.keys():
@@ -212,130 +579,459 @@ class FT(RaceDetector):
     #print()
 
   def initVar(self, var):
-    assert(var not in self.vars.keys())
-    self.vars[var] = Var(var)
+    assert(var not in self.vars)
+    v = Var()
+    self.vars[var] = v
+    return v
+
+  def mkcensus(self):
+    '''A Census for the clocks of procs or locks'''
+    return Census()
 
   def mklock(self, lid):
     assert(lid not in self.locks.keys())
-    self.locks[lid] = Lock(lid)
+    self.locks[lid] = Lock(lid, self.VC)
+    if __debug__:
+      if self.census:
+        self.census['locks'].add(self.locks[lid].vc, self.deleted_pids)
+    if type(lid) == int:
+      insort(self.lockAddrs, lid)
+
+
+  def dataRace(self, access, p, var, v):
+    '''Reports a race of p's access to var with the earlier access
+    recorded in v.  Repeats of a race only cost a lookup in the reporter;
+    the message of a new one is formatted when first needed.'''
+    pids = self.pidmap.pids
+    if access == 'read':
+      (kind, e) = ('wr', v.w)
+    elif not before(v.w, p.vc, pids, self.retired):
+      (kind, e) = ('ww', v.w)
+    else:
+      (kind, e) = ('rw', self.racingRead(v.r, p.vc))
+    other = pids[e & PID_MASK]
+    race = self.reporter.repeat((var, other, p.id, kind))
+    if race is not None:
+      return race
+    # The message is formatted later: a read VC may be mutated by then, as
+    # may the clock of the proc with an inplace backend, so both are copied
+    r = v.r if type(v.r) in [int, tuple] else self.VC.new(v.r)
+    vc = self.VC.new(p.vc) if self.VC.inplace else p.vc
+    message = partial(self.raceMessage, access, p.id, vc, var, v.w, r)
+    return self.reporter.add(DataRace(message, kind, var, p.id, other), self.verbose or self.race)
+
+
+  def raceMessage(self, access, pid, vc, var, w, r):
+    v = Var()
+    (v.w, v.r) = (w, r)
+    message = "%s: (ERR) Data race on %s %s %s\n" % (self.__class__.__name__, access, pid, fmtAddr(var))
+    message += "  proc[%s]: %s\n" % (pid, vc)
+    message += "  %s" % v.str(var, self.pidmap.pids)
+    return message
+
+
+  def racingRead(self, r, vc):
+    '''A packed epoch of r, the reads of a variable, that is not before vc'''
+    pids = self.pidmap.pids
+    if type(r) == int:
+      return r
+    if type(r) == tuple:
+      return [e for e in r if not before(e, vc, pids, self.retired)][0]
+    slots = self.pidmap.slots
+    return [pack(c, slots[pid]) for (pid, c) in r.vc.items() if \
+        not (c <= vc[pid] or slots[pid] in self.retired)][0]
+
+
+  def vcBefore(self, r, vc):
+    '''Read VC r happens-before vc, ignoring the entries of retired pids'''
+    if r <= vc:
+      return True
+    slots = self.pidmap.slots
+    return bool(self.retired) and \
+        all([c <= vc[pid] or slots[pid] in self.retired for (pid, c) in r.vc.items()])
+
+
+  def readsBefore(self, r, vc):
+    '''Shared reads r, a tuple or a VC, all happen-before vc'''
+    if type(r) == tuple:
+      pids = self.pidmap.pids
+      return all([before(e, vc, pids, self.retired) for e in r])
+    return self.vcBefore(r, vc)
+
+
+  def readShared(self, p, v):
+    '''Adds p's read to the reads of v, which do not all happen-before it.
+
+    A read that happens-before p's read is redundant from here on: a later
+    access is ordered after it whenever it is ordered after p's read.  Such
+    reads are dropped whenever p adds a new entry, so the read state shrinks
+    back to a tuple and then to an epoch as the concurrent readers go away,
+    and only SMALL_READS or more concurrent readers take a VC.  Dropping
+    reads from a VC costs a pass over it, so it is only done once every
+    PRUNE_INTERVAL updates of read VCs.'''
+    r = v.r
+    pids = self.pidmap.pids
+    retired = self.retired
+    vc = p.vc
+    if type(r) == tuple:
+      if p.ep in r:
+        return
+      keep = [e for e in r if e & PID_MASK != p.slot and not before(e, vc, pids, retired)]
+    elif type(r) == int:
+      keep = [r]
+    else:
+      c = r[p.id]
+      self.pruneCountdown -= 1
+      if self.pruneCountdown > 0:
+        if __debug__:
+          self.readStats['entries'] += (c == 0)
+        r[p.id] = vc[p.id]
+        return
+      self.pruneCountdown = PRUNE_INTERVAL
+      slots = self.pidmap.slots
+      items = r.vc.items()
+      keep = [(q, d) for (q, d) in items if q != p.id and \
+          not (d <= vc[q] or slots[q] in retired)]
+      if len(keep) + (c != 0) == len(items):
+        # Nothing to drop: update in place
+        if __debug__:
+          self.readStats['entries'] += (c == 0)
+        r[p.id] = vc[p.id]
+        return
+      keep = [pack(d, slots[q]) for (q, d) in keep]
+    if __debug__:
+      self.readAccount(r, len(keep) + 1)
+    if not keep:
+      v.r = p.ep
+    elif len(keep) < SMALL_READS:
+      v.r = tuple(keep) + (p.ep,)
+    else:
+      rvc = self.VC()
+      for e in keep:
+        rvc[pids[e & PID_MASK]] = e >> PID_BITS
+      rvc[p.id] = vc[p.id]
+      v.r = rvc
+
+
+  def readAccount(self, r, n):
+    '''Accounts for read state r being replaced by one with n entries'''
+    stats = self.readStats
+    if type(r) == tuple:
+      stats['small'] -= 1
+      stats['entries'] -= len(r)
+      stats['small_entries'] -= len(r)
+      old = len(r)
+    elif type(r) != int:
+      stats['vcs'] -= 1
+      old = len(r.vc)
+      stats['entries'] -= old
+    else:
+      old = 1
+    if n > 1:
+      stats['small' if n <= SMALL_READS else 'vcs'] += 1
+      stats['entries'] += n
+      if n <= SMALL_READS:
+        stats['small_entries'] += n
+    if 0 < n < old:
+      stats['shrunk'] += 1
 
 
   def read(self, pid, var):
-    self.numOps[inspect.currentframe().f_code.co_name] += 1
-    var = hex(var) if type(var) == int else var
+    if __debug__:
+      self.numOps['read'] += 1
+      self.countdown -= 1
+      if not self.countdown:
+        self.stats()
     if self.verbose:
-      print("%s: %s %s %s" % (self.__class__.__name__, 'rd ', pid, var))
+      print("%s: %s %s %s" % (self.__class__.__name__, 'rd ', pid, fmtAddr(var)))
 
     assert(pid in self.procs.keys())
-    if var not in self.vars.keys():
-      self.initVar(var)
-    
+    p = self.procs[pid]
+    # Read in this epoch already, see Proc.reads
+    reads = p.reads
+    if var in reads:
+      if __debug__:
+        self.cacheHits['read'] += 1
+      return
+    v = self.vars.get(var)
+    if v is None:
+      v = self.initVar(var)
+    if len(reads) < self.cacheSize:
+      reads.add(var) # Taken back on a race
+
     # Read same epoch
-    if self.vars[var].r == self.procs[pid].epoch():
-      self.stats(); return
-
-    # Read shared
-    if type(self.vars[var].r) == VC and \
-          self.vars[var].w <= self.procs[pid].vc:
-      self.vars[var].r.vc[pid] = self.procs[pid].vc[pid]
-      self.stats(); return
-
-    if type(self.vars[var].r) == Epoch and \
-          self.vars[var].w <= self.procs[pid].vc:
-
-      # Read exclusive
-      if self.vars[var].r <= self.procs[pid].vc:
-        self.vars[var].r = self.procs[pid].epoch()
-        self.stats(); return
-      
-      # Read share
-      self.vars[var].r = VC(self.procs[pid].epoch(), self.vars[var].r)
-      self.stats(); return
-    
+    if v.r == p.ep:
+      return
+
+    p.dirty = True
+    pids = self.pidmap.pids
+    if before(v.w, p.vc, pids, self.retired):
+
+      r = v.r
+      if type(r) == int:
+        # Read exclusive
+        if before(r, p.vc, pids, self.retired):
+          v.r = p.ep
+          return
+
+      # Read shared, by a proc already in the VC
+      elif type(r) != tuple and self.pruneCountdown > 1 and r[pid]:
+        self.pruneCountdown -= 1
+        r[pid] = p.vc[pid]
+        return
+
+      # Read share, read shared
+      self.readShared(p, v)
+      return
+
     # Data race
-    message = "%s: (ERR) Data race on read %s %s\n" % (self.__class__.__name__, pid, var)
-    message += "  %s\n" % self.procs[pid]
-    message += "  %s" % self.vars[var]
-    if self.verbose or self.race:
-      print(message)
-    self.stats(); return DataRace(message)
+    reads.discard(var)
+    return self.dataRace('read', p, var, v)
 
 
   def write(self, pid, var):
-    self.numOps[inspect.currentframe().f_code.co_name] += 1
-    var = hex(var) if type(var) == int else var
+    if __debug__:
+      self.numOps['write'] += 1
+      self.countdown -= 1
+      if not self.countdown:
+        self.stats()
     if self.verbose:
-      print("%s: %s %s %s" % (self.__class__.__name__, 'wr ', pid, var))
+      print("%s: %s %s %s" % (self.__class__.__name__, 'wr ', pid, fmtAddr(var)))
 
     assert(pid in self.procs.keys())
-    if var not in self.vars.keys():
-      self.initVar(var)
+    p = self.procs[pid]
+    # Written in this epoch already, see Proc.reads
+    writes = p.writes
+    if var in writes:
+      if __debug__:
+        self.cacheHits['write'] += 1
+      return
+    v = self.vars.get(var)
+    if v is None:
+      v = self.initVar(var)
+    if len(writes) < self.cacheSize:
+      writes.add(var) # Taken back on a race
 
     # Write same epoch
-    if self.vars[var].w == self.procs[pid].epoch():
-      self.stats(); return
-
-    # Write exclusive
-    if type(self.vars[var].r) == Epoch and \
-          self.vars[var].r <= self.procs[pid].vc and \
-          self.vars[var].w <= self.procs[pid].vc:
-      self.vars[var].w = self.procs[pid].epoch()
-      self.stats(); return
-
-    # Write shared
-    if type(self.vars[var].r) == VC and \
-          self.vars[var].r <= self.procs[pid].vc and \
-          self.vars[var].w <= self.procs[pid].vc:
-      self.vars[var].w = self.procs[pid].epoch()
-      self.vars[var].r = VC()
-      self.stats(); return
+    if v.w == p.ep:
+      return
+
+    p.dirty = True
+    pids = self.pidmap.pids
+    if before(v.w, p.vc, pids, self.retired):
+
+      # Write exclusive
+      if type(v.r) == int:
+        if before(v.r, p.vc, pids, self.retired):
+          v.w = p.ep
+          return
+
+      # Write shared
+      elif self.readsBefore(v.r, p.vc):
+        if __debug__:
+          self.readAccount(v.r, 0)
+        v.w = p.ep
+        v.r = 0
+        p.reads.discard(var) # The read is no longer in shadow state
+        return
 
     # Data race
-    message = "%s: (ERR) Data race on write %s %s\n" % (self.__class__.__name__, pid, var)
-    message += "  %s\n" % self.procs[pid]
-    message += "  %s" % self.vars[var]
-    if self.verbose or self.race:
-      print(message)
-    self.stats(); return DataRace(message)
+    writes.discard(var)
+    return self.dataRace('write', p, var, v)
+
+
+  def range(self, pid, addr, length, access_type):
+    '''Checks and updates the words of [addr, addr+length) in one pass.
+
+    Equivalent to calling read or write once per 8-byte word, as
+    RaceDetector.range does, including the race reports.  Consecutive
+    words tend to carry the same epochs, so the happens-before check of a
+    word's epoch against the proc's VC is reused from the previous word
+    whenever the epoch is unchanged.  Returns the data races found.
+
+    Unaligned ranges, and all ranges when verbose, are checked a word at a
+    time through FT.read and FT.write themselves, and so neither through a
+    sampler nor through the locks of a subclass, which the caller holds.'''
+    assert(access_type in [0,1])
+    if self.verbose or type(addr) != int or addr & WORD_MASK:
+      return RaceDetector.range(self, pid, addr, length, access_type, \
+          partial(FT.read, self), partial(FT.write, self))
+    nwords = (length + WORD_MASK) >> WORD_BITS
+    if __debug__:
+      self.numOps['write' if access_type else 'read'] += nwords
+      left = self.countdown - nwords
+      if self.countdown > 0 and left <= 0:
+        self.stats()
+        self.countdown = self.stats_interval - (-left) % self.stats_interval
+      else:
+        self.countdown = left
+
+    assert(pid in self.procs.keys())
+    p = self.procs[pid]
+    p.dirty = True
+    ep = p.ep
+    vc = p.vc
+    pids = self.pidmap.pids
+    retired = self.retired
+    lw, lwok = None, False # Last write epoch seen, and whether it is <= vc
+    lr, lrok = None, False # Same for read epochs
+    races = []
+    for (base, page, lo, hi) in self.vars.span(addr, addr + length, Var):
+      for i in range(lo, hi):
+        v = page[i]
+        r = v.r
+        if access_type == 0:
+          # Read same epoch
+          if r == ep:
+            continue
+          w = v.w
+          if w != lw:
+            lw, lwok = w, before(w, vc, pids, retired)
+          if lwok:
+            if type(r) == int:
+              if r != lr:
+                lr, lrok = r, before(r, vc, pids, retired)
+              # Read exclusive
+              if lrok:
+                v.r = ep
+                continue
+            # Read share, read shared
+            self.readShared(p, v)
+            continue
+          races.append(self.dataRace('read', p, base + (i << WORD_BITS), v))
+        else:
+          w = v.w
+          # Write same epoch
+          if w == ep:
+            continue
+          if w != lw:
+            lw, lwok = w, before(w, vc, pids, retired)
+          if lwok:
+            # Write exclusive
+            if type(r) == int:
+              if r != lr:
+                lr, lrok = r, before(r, vc, pids, retired)
+              if lrok:
+                v.w = ep
+                continue
+            # Write shared
+            elif self.readsBefore(r, vc):
+              if __debug__:
+                self.readAccount(r, 0)
+              v.w = ep
+              v.r = 0
+              p.reads.discard(base + (i << WORD_BITS))
+              continue
+          races.append(self.dataRace('write', p, base + (i << WORD_BITS), v))
+    return races
+
+
+  def sampledRead(self, pid, var):
+    if self.sampler.sample(pid, var):
+      return self.checkRead(pid, var)
+
+
+  def sampledWrite(self, pid, var):
+    if self.sampler.sample(pid, var):
+      return self.checkWrite(pid, var)
+
+
+  def sampledRange(self, pid, addr, length, access_type):
+    '''Offers every word of the range to the sampler, as separate reads or
+    writes would be, and checks each run of sampled words as a range'''
+    sample = self.sampler.sample
+    end = addr + length
+    races = []
+    start = None # First word of the current run
+    for v in range(addr, end, 1 << WORD_BITS):
+      if sample(pid, v):
+        if start is None:
+          start = v
+      elif start is not None:
+        races += self.checkRange(pid, start, v - start, access_type)
+        start = None
+    if start is not None:
+      races += self.checkRange(pid, start, end - start, access_type)
+    return races
 
 
   def acq(self, pid, lock):
-    self.numOps[inspect.currentframe().f_code.co_name] += 1
-    lock = hex(lock) if type(lock) == int else lock
+    if __debug__:
+      self.numOps['acq'] += 1
+      self.countdown -= 1
+      if not self.countdown:
+        self.stats()
     if self.verbose:
-      print("%s: %s %s %s" % (self.__class__.__name__, 'acq', pid, lock))
+      print("%s: %s %s %s" % (self.__class__.__name__, 'acq', pid, fmtAddr(lock)))
 
     assert(pid in self.procs.keys())
     if lock not in self.locks.keys():
       self.mklock(lock)
-    self.procs[pid].vc = VC.lub(self.procs[pid].vc, self.locks[lock].vc)
-    self.stats(); return
+    (p, l) = (self.procs[pid], self.locks[lock])
+    if l.known is None or pid in l.known:
+      # Already knows everything the lock carries
+      if __debug__:
+        self.acqSkipped += 1
+    else:
+      if __debug__:
+        if self.census:
+          old = Census.keep(p.vc)
+      p.vc = self.VC.join(p.vc, l.vc)
+      if __debug__:
+        if self.census:
+          self.census['procs'].replace(old, p.vc, self.deleted_pids, l.vc)
+      l.known.add(pid)
+    if self.dead and self.gcOn:
+      self.gcTick()
 
 
   def release(self, pid, lock, f='rel'):
     assert(f in ['rel', 'rem', 'rea'])
-    self.numOps[f] += 1
-    lock = hex(lock) if type(lock) == int else lock
+    if __debug__:
+      self.numOps[f] += 1
+      self.countdown -= 1
+      if not self.countdown:
+        self.stats()
     if self.verbose:
-      print("%s: %s %s %s" % (self.__class__.__name__, f, pid, lock))
+      print("%s: %s %s %s" % (self.__class__.__name__, f, pid, fmtAddr(lock)))
 
     assert(pid in self.procs.keys())
     if lock not in self.locks.keys():
       self.mklock(lock)
       if self.info:
-        print("%s: (INFO) Release w/o prior acq: %s %s %s" % (self.__class__.__name__, f, pid, lock))
-    if f == 'rel':
-      self.locks[lock].vc = VC.new(self.procs[pid].vc)
+        print("%s: (INFO) Release w/o prior acq: %s %s %s" % (self.__class__.__name__, f, pid, fmtAddr(lock)))
+    # Clocks are shared rather than copied, see VCView
+    (p, l) = (self.procs[pid], self.locks[lock])
+    (pvc, lvc) = (p.vc, l.vc)
+    if __debug__:
+      if self.census:
+        (pold, lold) = (Census.keep(pvc), Census.keep(lvc))
+    known = l.known is None or pid in l.known
+    if f == 'rel' or (f == 'rem' and known):
+      l.vc = self.VC.copy(lvc, pvc, known)
+      l.known = {pid}
     elif f == 'rem':
-      self.locks[lock].vc = VC.lub(self.procs[pid].vc, self.locks[lock].vc) 
+      l.vc = self.VC.lub(pvc, lvc)
+      l.known = set()
     elif f == 'rea':
-      tmp = VC.new(self.procs[pid].vc)
-      self.procs[pid].vc = VC.lub(self.procs[pid].vc, self.locks[lock].vc)
-      self.locks[lock].vc = tmp
+      # Copies before joining, as the join may update pvc in place
+      l.vc = self.VC.copy(lvc, pvc, known)
+      if not known:
+        p.vc = self.VC.join(pvc, lvc)
+      l.known = {pid}
     else:
       assert(0)
+    if __debug__:
+      if self.census:
+        # Every case but a rel or rea by a proc that did not know the lock
+        # joins pvc into the lock's clock
+        joined = pvc if known or f == 'rem' else None
+        self.census['locks'].replace(lold, l.vc, self.deleted_pids, joined)
+        if f == 'rea':
+          self.census['procs'].replace(pold, p.vc, self.deleted_pids, lvc)
     self.procs[pid].inc()
-    self.stats(); return
+    if self.dead and self.gcOn:
+      self.gcTick()
     
 
   def rel(self, pid, lock):
@@ -353,49 +1049,192 @@ class FT(RaceDetector):
     self.release(pid, lock, f='rea')
 
 
-  def fork(self, pid, oid):
+  def fork(self, pid, oid, joiners=0):
+    '''pid forks oid, which will be joined by that many joins; 0 when the
+    number is not known, e.g. for a wait group, see join()'''
     if self.verbose:
       print("%s: %s %s %s" % (self.__class__.__name__, 'frk', pid, oid))
 
     assert(pid in self.procs.keys())
     assert(oid not in self.procs.keys())
     assert(oid not in self.deleted_pids) # Enforces uniqueness of pids
-    self.procs[oid] = Proc(oid)
-    self.procs[oid].vc = VC.lub(self.procs[oid].vc, self.procs[pid].vc)
+    assert(type(joiners) == int and joiners >= 0)
+    self.procs[oid] = Proc(oid, self.VC, self.pidmap.slot(oid))
+    self.procs[oid].vc = self.VC.join(self.procs[oid].vc, self.procs[pid].vc)
+    if joiners:
+      self.joiners[oid] = joiners
+    if __debug__:
+      if self.census:
+        self.census['procs'].add(self.procs[oid].vc, self.deleted_pids)
     self.procs[pid].inc()
 
   def join(self, pid, oid):
+    '''pid waits for oid to end: (T,U) => (T \\cup U)
+
+    The final clock oid published at end() is shared, not copied.  It is
+    dropped by the last of the joins announced at fork().  Without such a
+    count, it is only kept with gc on, until gc() finds that every proc
+    knows it, and any later join of oid has nothing to add.'''
+    if self.verbose:
+      print("%s: %s %s %s" % (self.__class__.__name__, 'jn ', pid, oid))
+
     assert(pid in self.procs.keys())
-    assert(oid in self.procs.keys())
-    assert(0)
+    final = self.finals.get(oid)
+    if final is None:
+      if oid not in self.deleted_pids:
+        raise ValueError("%s: join of %s, which has not ended" % (self.__class__.__name__, oid))
+      if self.pidmap.slot(oid) in self.retired:
+        return # Known to every proc, see gc()
+      raise ValueError("%s: join of %s, whose final clock was not kept: more joins than its fork " \
+          "announced, or none announced and gc off" % (self.__class__.__name__, oid))
+    p = self.procs[pid]
+    if __debug__:
+      if self.census:
+        old = Census.keep(p.vc)
+    p.vc = self.VC.join(p.vc, final)
+    if __debug__:
+      if self.census:
+        self.census['procs'].replace(old, p.vc, self.deleted_pids, final)
+    if oid in self.joiners:
+      self.joiners[oid] -= 1
+      if not self.joiners[oid]:
+        del(self.joiners[oid])
+        del(self.finals[oid])
+    if self.dead and self.gcOn:
+      self.gcTick()
 
   def end(self, pid):
     if self.verbose:
       print("%s: %s %s" % (self.__class__.__name__, 'end', pid))
 
     assert(pid in self.procs.keys())
+    if self.gcOn:
+      self.dead[pid] = self.procs[pid].lastEpoch()
+    # The final clock is kept for the joins announced at fork() or, with
+    # gc, for joins that were not; otherwise it goes with the proc.  Other
+    # clocks may share the proc's, so an inplace backend's is copied.
+    if pid in self.joiners or self.gcOn:
+      vc = self.procs[pid].vc
+      self.finals[pid] = self.VC.new(vc) if self.VC.inplace else vc
+    if __debug__:
+      if self.census:
+        self.census['procs'].remove(self.procs[pid].vc, self.deleted_pids)
     del(self.procs[pid])
     self.deleted_pids.add(pid)
+    if __debug__:
+      if self.census:
+        for census in self.census.values():
+          census.end(pid)
+
+
+  def gcTick(self):
+    '''Called on sync ops while there are dead pids'''
+    if self.gc_interval != None:
+      self.gcCountdown -= 1
+      if self.gcCountdown <= 0:
+        self.gcCountdown = self.gc_interval
+        self.gc()
+        return
+    if self.gc_threshold != None and len(self.dead) >= self.gc_threshold:
+      self.gc()
+
+
+  def gc(self):
+    '''Compacts the clocks of procs and locks by retiring ended pids.
+
+    An ended pid can be retired once every live proc's clock covers the
+    last epoch the pid may have left in shadow memory.  From then on, any
+    check of one of its epochs against a proc's clock succeeds, and procs
+    forked later inherit that knowledge.  So the pid's entries can be
+    dropped from all clocks, and its slot is recorded in self.retired so
+    that before() and vcBefore() still treat its epochs as known.
+
+    The final clocks of retired pids that were forked without a number of
+    joins are dropped once every proc knows them, see join().
+    Returns the number of VC entries dropped.'''
+    self.gcStats['passes'] += 1
+    procs = self.procs.values()
+    retire = [pid for (pid, c) in self.dead.items() if \
+        all([p.vc[pid] >= c for p in procs])]
+    for pid in retire:
+      del(self.dead[pid])
+      self.retired.add(self.pidmap.slot(pid))
+    for pid in [pid for pid in self.finals if pid not in self.joiners and pid not in self.dead]:
+      if all([self.vcBefore(self.finals[pid], p.vc) for p in procs]):
+        del(self.finals[pid])
+    if not retire:
+      return 0
+    dropped = 0
+    for (where, dct) in [('procs', self.procs), ('locks', self.locks)]:
+      for obj in dct.values():
+        # Clocks may be shared, so entries are dropped from a copy, which
+        # is only published once complete: MTFT readers take no proc lock
+        vc = obj.vc
+        if not any([vc[pid] for pid in retire]):
+          continue
+        if __debug__:
+          if self.census:
+            size = vc.size()
+        vc = self.VC.new(vc)
+        n = vc.drop(retire)
+        obj.vc = vc
+        if __debug__:
+          if self.census and n:
+            self.census[where].drop(size, n)
+        dropped += n
+    for (pid, vc) in self.finals.items():
+      if any([vc[rpid] for rpid in retire]):
+        vc = self.VC.new(vc)
+        dropped += vc.drop(retire)
+        self.finals[pid] = vc
+    if __debug__:
+      if self.census:
+        for census in self.census.values():
+          census.forget(retire)
+    self.gcStats['retired'] += len(retire)
+    self.gcStats['dropped'] += dropped
+    return dropped
 
 
   def free(self, addr, size):
+    '''Forgets the variables and locks in [addr, addr+size)'''
     if self.verbose:
-      print("%s: %s %s" % (self.__class__.__name__, 'free', addr, size))
+      print("%s: %s %s %s" % (self.__class__.__name__, 'free', fmtAddr(addr), hex(size)))
 
-    # Go over self.locks and remove them if addr <= self.locks <= addr+size
-    print("ERR: Implement free")
-    assert(0)
+    if __debug__:
+      self.vars.free(addr, addr + size, lambda v: type(v.r) != int and self.readAccount(v.r, 0))
+    else:
+      self.vars.free(addr, addr + size)
+    for p in self.procs.values():
+      if p.reads or p.writes:
+        p.reads.clear()
+        p.writes.clear()
+    lo = bisect_left(self.lockAddrs, addr)
+    hi = bisect_left(self.lockAddrs, addr + size)
+    for lid in self.lockAddrs[lo:hi]:
+      if __debug__:
+        if self.census:
+          self.census['locks'].remove(self.locks[lid].vc, self.deleted_pids)
+      del(self.locks[lid])
+    del(self.lockAddrs[lo:hi])
 
 
 class Stats():
 
   @classmethod
-  def getVcEntries(cls, ft, where):
+  def getVcEntries(cls, ft, where, live=False):
+    '''Clocks of all procs or locks.  With live=True, only the entries
+    belonging to procs that have not ended are kept.'''
     assert(where in ['locks', 'procs'])
     ret = {}
     dct = ft.procs if where == 'procs' else ft.locks    
     for item in dct.keys():
       ret[item] = dct[item].vc
+      if live:
+        ret[item] = VC()
+        for (pid, c) in dct[item].vc.vc.items():
+          if pid not in ft.deleted_pids:
+            ret[item][pid] = c
     return ret
 
   @classmethod
@@ -0,0 +1,321 @@
+#!/usr/bin/env python3
+#
+# A FastTrack detector that may be called from several threads at once,
+# e.g. by a TSan runtime without its single global lock, or by a batched
+# front end with one queue per goroutine, on a free-threaded Python.
+#
+# Calls for different goroutines proceed in parallel, under:
+#
+#   stripes   NSTRIPES locks over shadow memory, by page: reads, writes
+#             and ranges of different pages do not contend
+#   lock      one mutex per sync object, held by acq/rel/rem/rea on it
+#   proc      one mutex per goroutine, held while its clock is replaced
+#   mutex     the structure of the detector: fork, end, join, free and gc
+#   tables    a leaf lock for unaligned shadow entries and stats
+#
+# Locks are taken in the order mutex, stripes, lock, proc, tables, so no
+# two calls can deadlock.  Calls for one goroutine must not overlap, as
+# in a program.  Sync objects are created under mutex, before their lock
+# is taken.  gc() is deferred to the end of the sync op that made it due,
+# and runs with mutex and every lock and proc mutex held.  Op counts and
+# the stats of shared reads are updated without locks and so are
+# approximate under contention; clock sizes (see Census) and races are
+# exact.
+#
+# run() replays an event stream with a thread per goroutine.
+
+'''
+@author:    Daniel S. Fava
+@email:     danielsf@ifi.uio.no
+@contact:   www.danielfava.com
+@copyright: CC BY 4.0, https://creativecommons.org/licenses/by/4.0/
+@date:      April 2020
+
+See https://github.com/dfava/paper.go.mm.drd
+'''
+
+import sys
+import time
+import threading
+from contextlib import ExitStack
+
+from ft import *
+from shadow import PAGE_BITS, PAGE_SLOTS
+
+STRIPE_BITS = 6
+NSTRIPES = 1 << STRIPE_BITS
+STRIPE_MASK = NSTRIPES - 1
+
+
+class LockedCensus(Census):
+  '''A Census whose updates are atomic'''
+  __slots__ = ('mutex',)
+
+  def __init__(self):
+    Census.__init__(self)
+    self.mutex = threading.Lock()
+
+  def add(self, vc, deleted):
+    with self.mutex:
+      Census.add(self, vc, deleted)
+
+  def remove(self, vc, deleted):
+    with self.mutex:
+      Census.remove(self, vc, deleted)
+
+  def replace(self, old, new, deleted, src=None):
+    with self.mutex:
+      Census.replace(self, old, new, deleted, src)
+
+  def end(self, pid):
+    with self.mutex:
+      Census.end(self, pid)
+
+  def drop(self, size, dropped):
+    with self.mutex:
+      Census.drop(self, size, dropped)
+
+  def forget(self, pids):
+    with self.mutex:
+      Census.forget(self, pids)
+
+
+class LockedShadow(Shadow):
+  '''Shadow memory whose pages are guarded by the callers' stripe locks.
+  Insertions into the shared structures, the dict of unaligned entries and
+  its sorted keys, take the given mutex.  The entry count is not kept, as
+  every stripe would update it; len() counts the entries instead.'''
+
+  def __init__(self, mutex):
+    Shadow.__init__(self)
+    self.mutex = mutex
+
+  @property
+  def size(self):
+    return 0
+
+  @size.setter
+  def size(self, n):
+    pass
+
+  def __setitem__(self, addr, state):
+    with self.mutex:
+      Shadow.__setitem__(self, addr, state)
+
+  def __len__(self):
+    with self.mutex:
+      return sum([PAGE_SLOTS - page.count(None) for page in list(self.pages.values())]) + \
+          len(self.other)
+
+
+class MTFT(FT):
+  '''FT, safe for concurrent callers; see the top of this file'''
+
+  def __init__(self, *args, **kwargs):
+    self.mutex = threading.RLock()
+    self.tables = threading.RLock()
+    self.stripes = [threading.Lock() for i in range(NSTRIPES)]
+    self.lockMutexes = {}
+    self.procMutexes = {0 : threading.Lock()}
+    self.gcDue = False
+    FT.__init__(self, *args, **kwargs)
+    self.vars = LockedShadow(self.tables)
+    self.reports = threading.Lock()
+
+  # Ops decrement countdown without a lock, and two may race past 0; a
+  # negative count then stands for 0 so that stats() still gets called
+  @property
+  def countdown(self):
+    n = self._countdown
+    return 0 if n < 0 and self.stats_interval != None else n
+
+  @countdown.setter
+  def countdown(self, n):
+    self._countdown = n
+
+  def stats(self):
+    with self.tables:
+      if self._countdown <= 0:
+        FT.stats(self)
+
+  def mkcensus(self):
+    return LockedCensus()
+
+  def stripe(self, addr):
+    if type(addr) == int:
+      return self.stripes[(addr >> PAGE_BITS) & STRIPE_MASK]
+    return self.stripes[hash(addr) & STRIPE_MASK]
+
+  def lockMutex(self, lid):
+    mutex = self.lockMutexes.get(lid)
+    if mutex is None:
+      with self.mutex:
+        if lid not in self.locks:
+          self.mklock(lid)
+        mutex = self.lockMutexes.setdefault(lid, threading.Lock())
+    return mutex
+
+  def procMutex(self, pid):
+    mutex = self.procMutexes.get(pid)
+    if mutex is None: # A proc restored from a snapshot
+      with self.mutex:
+        mutex = self.procMutexes.setdefault(pid, threading.Lock())
+    return mutex
+
+  def read(self, pid, var):
+    with self.stripe(var):
+      return FT.read(self, pid, var)
+
+  def write(self, pid, var):
+    with self.stripe(var):
+      return FT.write(self, pid, var)
+
+  def range(self, pid, addr, length, access_type):
+    # Stripe locks are not reentrant: FT.range falls back on FT.read and
+    # FT.write, not on read and write above, for unaligned or verbose ranges
+    first, last = addr >> PAGE_BITS, (addr + length - 1) >> PAGE_BITS
+    stripes = sorted(set([pnum & STRIPE_MASK for pnum in range(first, min(last + 1, first + NSTRIPES))]))
+    with ExitStack() as stack:
+      for i in stripes:
+        stack.enter_context(self.stripes[i])
+      return FT.range(self, pid, addr, length, access_type)
+
+  def dataRace(self, access, p, var, v):
+    with self.reports:
+      return FT.dataRace(self, access, p, var, v)
+
+  def acq(self, pid, lock):
+    with self.lockMutex(lock), self.procMutex(pid):
+      FT.acq(self, pid, lock)
+    if self.gcDue:
+      self.collect()
+
+  def release(self, pid, lock, f='rel'):
+    if self.info and lock not in self.locks:
+      print("%s: (INFO) Release w/o prior acq: %s %s %s" % (self.__class__.__name__, f, pid, fmtAddr(lock)))
+    with self.lockMutex(lock), self.procMutex(pid):
+      FT.release(self, pid, lock, f)
+    if self.gcDue:
+      self.collect()
+
+  def fork(self, pid, oid, joiners=0):
+    with self.mutex:
+      self.procMutexes[oid] = threading.Lock()
+      with self.procMutex(pid):
+        FT.fork(self, pid, oid, joiners)
+
+  def join(self, pid, oid):
+    with self.mutex:
+      with self.procMutex(pid):
+        FT.join(self, pid, oid)
+    if self.gcDue:
+      self.collect()
+
+  def end(self, pid):
+    with self.mutex:
+      with self.procMutex(pid):
+        FT.end(self, pid)
+      del(self.procMutexes[pid])
+
+  def free(self, addr, size):
+    with self.mutex, ExitStack() as stack:
+      for stripe in self.stripes:
+        stack.enter_context(stripe)
+      lo = bisect_left(self.lockAddrs, addr)
+      hi = bisect_left(self.lockAddrs, addr + size)
+      lids = self.lockAddrs[lo:hi]
+      with self.tables:
+        FT.free(self, addr, size)
+      for lid in lids:
+        self.lockMutexes.pop(lid, None)
+
+  def gcTick(self):
+    '''Called under the locks of a sync op, so only marks gc() as due'''
+    self.gcDue = True
+
+  def collect(self):
+    with self.mutex:
+      if not self.gcDue:
+        return
+      self.gcDue = False
+      FT.gcTick(self)
+
+  def gc(self):
+    with self.mutex, ExitStack() as stack:
+      for mutex in list(self.lockMutexes.values()) + list(self.procMutexes.values()):
+        stack.enter_context(mutex)
+      return FT.gc(self)
+
+
+def run(rd, evs, ordered=False):
+  '''Feeds an event stream into rd from a thread per goroutine, started at
+  its fork.  acq and rel also take and release a real lock, and join waits
+  for the goroutine's thread, so the threads synchronize as the goroutines
+  did.  With ordered, each event also waits for its turn in evs, which
+  moves the stream from thread to thread without changing its order.
+  Returns rd.'''
+  evs = list(evs)
+  mine = {0 : []}
+  for (i, ev) in enumerate(evs):
+    mine[ev[1]].append(i)
+    if ev[0] == 'fork':
+      mine[ev[2]] = []
+  locks = {}
+  threads = {}
+  errors = []
+  turn = [0]
+  cond = threading.Condition()
+
+  def step(i):
+    ev = evs[i]
+    if ordered:
+      with cond:
+        cond.wait_for(lambda: turn[0] in [i, -1])
+      assert(turn[0] == i)
+    if ev[0] == 'acq':
+      locks.setdefault(ev[2], threading.Lock()).acquire()
+    elif ev[0] == 'join':
+      threads[ev[2]].join()
+    getattr(rd, ev[0])(*ev[1:])
+    if ev[0] == 'fork':
+      threads[ev[2]] = threading.Thread(target=proc, args=(ev[2],))
+      threads[ev[2]].start()
+    elif ev[0] == 'rel':
+      locks[ev[2]].release()
+    if ordered:
+      with cond:
+        turn[0] += 1
+        cond.notify_all()
+
+  def proc(pid):
+    try:
+      for i in mine[pid]:
+        step(i)
+    except BaseException as e:
+      errors.append(e)
+      if ordered:
+        with cond:
+          turn[0] = -1
+          cond.notify_all()
+
+  proc(0)
+  while len([t.join() for t in list(threads.values())]) != len(threads):
+    pass
+  if errors:
+    raise errors[0]
+  return rd
+
+
+def main(argv):
+  '''Replays a synthetic workload with a thread per goroutine'''
+  import synth
+  steps = int(argv[1]) if len(argv) > 1 else 100000
+  evs = list(synth.events(steps=steps))
+  start = time.time()
+  ft = run(MTFT(stats_interval=None), evs)
+  secs = time.time() - start
+  print("MTFT: events=%d, races=%d, vars=%d, secs=%.2f" % (len(evs), ft.reporter.total, len(ft.vars), secs))
+
+
+if __name__ == "__main__":
+  sys.exit(main(sys.argv))
@@ -10,13 +10,41 @@
 See https://github.com/dfava/paper.go.mm.drd
 '''
 
+import time
+import struct
 from abc import abstractmethod
 
 class DataRace():
-  def __init__(self, message, drType=None):
+  '''A race between an access by pid to addr and an earlier access by
+  other.  drType names the earlier and the later access: 'wr' is a write
+  then a read, 'rw' a read then a write, 'ww' two writes.
+
+  message may be given as a callable, which is only called the first time
+  the message is needed; races that are never printed are never formatted.'''
+
+  def __init__(self, message, drType=None, addr=None, pid=None, other=None):
     assert(drType == None or drType in ['rw', 'ww', 'wr'])
     self.drType = drType
-    self.message = message
+    self.text = message
+    self.addr = addr
+    self.pid = pid
+    self.other = other
+    self.count = 1 # Occurrences, see RaceReporter
+
+  @property
+  def message(self):
+    if callable(self.text):
+      self.text = self.text()
+    return self.text
+
+  def key(self):
+    return (self.addr, self.other, self.pid, self.drType)
+
+  def __getstate__(self):
+    # The formatter may refer to the whole detector; ship the text instead
+    state = dict(self.__dict__)
+    state['text'] = self.message
+    return state
 
   def isRW(self):
     assert(self.drType in ['rw', 'ww', 'wr'])
@@ -31,6 +59,112 @@ class DataRace():
     return self.drType == 'wr'
 
 
+class RaceReporter():
+  '''Collects the data races found by a detector.
+
+  Races are deduplicated by key, (address, pid pair, kind): the first race
+  with a key is kept and printed, later ones only count.  Printing is
+  rate-limited to `rate` reports per second after a burst of `burst`; the
+  reports that do not make it are counted as suppressed.'''
+
+  def __init__(self, rate=10, burst=100):
+    self.races = {} # key : first DataRace with that key
+    self.kinds = {'rw' : 0, 'ww' : 0, 'wr' : 0} # Occurrences by kind
+    self.total = 0
+    self.printed = 0
+    self.suppressed = 0
+    self.rate = rate
+    self.burst = burst
+    self.tokens = burst
+    self.last = time.monotonic()
+
+  def repeat(self, key):
+    '''If a race with key was seen, counts it and returns the first one'''
+    race = self.races.get(key)
+    if race is not None:
+      race.count += 1
+      self.total += 1
+      self.kinds[key[3]] += 1
+    return race
+
+  def add(self, race, show=True):
+    '''Records a race whose key was not seen before, printing it if show'''
+    key = race.key()
+    assert(key not in self.races)
+    self.races[key] = race
+    self.total += race.count
+    self.kinds[race.drType] += race.count
+    if show:
+      self.show(race)
+    return race
+
+  def collect(self, race, show=True):
+    '''Merges in a race, with its count, reported by another reporter,
+    e.g. that of a shard; returns the first race with its key'''
+    first = self.races.get(race.key())
+    if first is None:
+      return self.add(race, show)
+    first.count += race.count
+    self.total += race.count
+    self.kinds[race.drType] += race.count
+    return first
+
+  def show(self, race):
+    now = time.monotonic()
+    self.tokens = min(self.burst, self.tokens + (now - self.last) * self.rate)
+    self.last = now
+    if self.tokens >= 1:
+      self.tokens -= 1
+      self.printed += 1
+      print(race.message)
+    else:
+      self.suppressed += 1
+
+  def summary(self):
+    ret = {'total'      : self.total,
+           'unique'     : len(self.races),
+           'printed'    : self.printed,
+           'suppressed' : self.suppressed,
+          }
+    ret.update(self.kinds)
+    return ret
+
+  def top(self, n=None):
+    '''Unique races, most frequent first'''
+    return sorted(self.races.values(), key=lambda race: -race.count)[:n]
+
+  def unique(self, kind=None, addr=None):
+    '''Unique races in the order found, optionally of one kind or address'''
+    return [race for race in self.races.values() if \
+        (kind == None or race.drType == kind) and (addr == None or race.addr == addr)]
+
+  def printSummary(self, name='races'):
+    print("%s, total=%d, unique=%d, rw=%d, ww=%d, wr=%d, printed=%d, suppressed=%d" % (\
+        name, self.total, len(self.races), self.kinds['rw'], self.kinds['ww'], self.kinds['wr'],\
+        self.printed, self.suppressed))
+
+
+class Event():
+  '''Fixed-size binary event records, as consumed by process_batch.
+
+  A record is (op, tid, addr, size), little-endian, 24 bytes.  fork puts
+  the child's tid in addr and the number of joins it expects in size; join
+  puts the joined tid in addr; free carries no tid; size is otherwise only
+  used by the range ops and free.'''
+  READ, WRITE, READ_RANGE, WRITE_RANGE, ACQ, REL, REM, REA, FORK, END, FREE, JOIN = range(12)
+  names = ['read', 'write', 'rrange', 'wrange', 'acq', 'rel', 'rem', 'rea', 'fork', 'end', 'free', 'join']
+  fmt = struct.Struct('<B3xiQQ')
+  size = fmt.size
+
+  @classmethod
+  def pack(cls, op, tid=0, addr=0, size=0):
+    return cls.fmt.pack(op, tid, addr, size)
+
+  @classmethod
+  def unpack(cls, buffer):
+    return cls.fmt.iter_unpack(buffer)
+
+
 class RaceDetector():
 
   @abstractmethod
@@ -50,16 +184,67 @@ class RaceDetector():
     pass
 
   @abstractmethod
-  def fork(self, pid, oid):
+  def fork(self, pid, oid, joiners=0):
     pass
 
-  def range(self, pid, addr, length, access_type):
+  def join(self, pid, oid):
+    assert(0)
+
+  def process_batch(self, buffer):
+    '''Processes a buffer of packed Event records in order.  Lets a caller
+    such as the TSan runtime hand over thousands of events per call.
+    Returns the list of data races found.'''
+    assert(len(buffer) % Event.size == 0)
+    races = []
+    read, write = self.read, self.write
+    READ, WRITE, WRITE_RANGE = Event.READ, Event.WRITE, Event.WRITE_RANGE
+    for (op, tid, addr, size) in Event.fmt.iter_unpack(buffer):
+      if op == READ:
+        ret = read(tid, addr)
+      elif op == WRITE:
+        ret = write(tid, addr)
+      else:
+        if op <= WRITE_RANGE:
+          races += self.range(tid, addr, size, op - Event.READ_RANGE)
+        elif op == Event.ACQ:
+          self.acq(tid, addr)
+        elif op == Event.REL:
+          self.rel(tid, addr)
+        elif op == Event.REM:
+          self.rem(tid, addr)
+        elif op == Event.REA:
+          self.rea(tid, addr)
+        elif op == Event.FORK:
+          self.fork(tid, addr, size)
+        elif op == Event.END:
+          self.end(tid)
+        elif op == Event.FREE:
+          self.free(addr, size)
+        elif op == Event.JOIN:
+          self.join(tid, addr)
+        else:
+          assert(0)
+        continue
+      if ret is not None:
+        races.append(ret)
+    return races
+
+  def range(self, pid, addr, length, access_type, read=None, write=None):
+    '''Checks the words of [addr, addr+length) one at a time, through
+    read and write, by default self.read and self.write'''
     if self.verbose:
       print("%s: %s %s %s %s %s" % (self.__class__.__name__, 'rg ', pid, hex(addr), hex(length), 'w' if access_type else 'r'))
     step = 0x8
     assert(access_type in [0,1])
+    check = (read or self.read) if access_type == 0 else (write or self.write)
+    races = []
     for v in range(addr, addr+length, step):
-      if access_type == 0:
-        self.read(pid, v)
-      else:
-        self.write(pid, v)
+      ret = check(pid, v)
+      if ret is not None:
+        races.append(ret)
+    return races
+
+
+def fmtAddr(addr):
+  '''Addresses are kept as ints and only turned into hex for reporting'''
+  return hex(addr) if type(addr) == int else addr
@@ -0,0 +1,544 @@
+#!/usr/bin/env python3
+#
+# Binary traces of the events seen by a RaceDetector.
+#
+# A trace is a 16-byte header followed by Event records (see race.py),
+# optionally as a single zlib stream.  Recorder writes traces, either
+# standing in for the detector inside the patched TSan runtime or from
+# any other event source.  Trace memory-maps a trace, or reads it from a
+# pipe, and hands it out in batches of records for
+# RaceDetector.process_batch.  Pipeline does the reading and decompressing
+# on a thread of its own, so that it overlaps with detection.
+#
+#   python3 rdtrace.py sortnp OUT [--sz SZ] [--fix]   record sortnp's events
+#   python3 rdtrace.py replay TRACE [--rd ft:FT]      replay into a detector
+#   python3 rdtrace.py replay TRACE --jobs N          same, sharded over N processes
+#   python3 rdtrace.py replay TRACE --snapshot-every N   snapshot every N events
+#   python3 rdtrace.py replay TRACE --resume SNAPSHOT    resume from a snapshot
+#   python3 rdtrace.py replay TRACE --pipeline [N]    decode on another thread, N batches ahead
+#   cat TRACE | python3 rdtrace.py replay -           replay from a pipe
+#   python3 rdtrace.py dump TRACE                     print events as text
+
+'''
+@author:    Daniel S. Fava
+@email:     danielsf@ifi.uio.no
+@contact:   www.danielfava.com
+@copyright: CC BY 4.0, https://creativecommons.org/licenses/by/4.0/
+@date:      April 2020
+
+See https://github.com/dfava/paper.go.mm.drd
+'''
+
+import os
+import sys
+import mmap
+import stat
+import time
+import zlib
+import queue
+import atexit
+import struct
+import argparse
+import importlib
+import threading
+import contextlib
+import multiprocessing
+
+from race import *
+
+MAGIC = b'RDTRACE\0'
+VERSION = 1
+COMPRESSED = 0x1
+HEADER = struct.Struct('<8sHHI') # magic, version, flags, reserved
+
+
+class Recorder(RaceDetector):
+  '''Writes every event it receives to a trace file.
+
+  With no file name, as when loaded by the TSan runtime, the trace goes
+  to $RDTRACE or 'trace.rdt'.  If rd is given, events are also passed on
+  to that detector.'''
+
+  def __init__(self, fname=None, compress=True, rd=None, bufsize=1 << 16):
+    self.fname = fname if fname != None else os.environ.get('RDTRACE', 'trace.rdt')
+    self.rd = rd
+    self.verbose = False
+    self.nevents = 0
+    self.bufsize = bufsize * Event.size
+    self.buf = bytearray()
+    self.zobj = zlib.compressobj() if compress else None
+    self.fhandle = open(self.fname, 'wb')
+    self.fhandle.write(HEADER.pack(MAGIC, VERSION, COMPRESSED if compress else 0, 0))
+    atexit.register(self.close)
+
+  def record(self, op, tid=0, addr=0, size=0):
+    self.buf += Event.fmt.pack(op, tid, addr, size)
+    self.nevents += 1
+    if len(self.buf) >= self.bufsize:
+      self.flush()
+
+  def flush(self):
+    data = bytes(self.buf)
+    self.buf = bytearray()
+    if self.zobj != None:
+      data = self.zobj.compress(data)
+    self.fhandle.write(data)
+
+  def close(self):
+    if self.fhandle.closed:
+      return
+    self.flush()
+    if self.zobj != None:
+      self.fhandle.write(self.zobj.flush())
+    self.fhandle.close()
+    atexit.unregister(self.close)
+
+  def read(self, pid, var):
+    self.record(Event.READ, pid, var)
+    if self.rd != None:
+      return self.rd.read(pid, var)
+
+  def write(self, pid, var):
+    self.record(Event.WRITE, pid, var)
+    if self.rd != None:
+      return self.rd.write(pid, var)
+
+  def range(self, pid, addr, length, access_type):
+    assert(access_type in [0,1])
+    self.record(Event.READ_RANGE + access_type, pid, addr, length)
+    if self.rd != None:
+      return self.rd.range(pid, addr, length, access_type)
+    return []
+
+  def acq(self, pid, lock):
+    self.record(Event.ACQ, pid, lock)
+    if self.rd != None:
+      self.rd.acq(pid, lock)
+
+  def rel(self, pid, lock):
+    self.record(Event.REL, pid, lock)
+    if self.rd != None:
+      self.rd.rel(pid, lock)
+
+  def rem(self, pid, lock):
+    self.record(Event.REM, pid, lock)
+    if self.rd != None:
+      self.rd.rem(pid, lock)
+
+  def rea(self, pid, lock):
+    self.record(Event.REA, pid, lock)
+    if self.rd != None:
+      self.rd.rea(pid, lock)
+
+  def fork(self, pid, oid, joiners=0):
+    self.record(Event.FORK, pid, oid, joiners)
+    if self.rd != None:
+      self.rd.fork(pid, oid, joiners)
+
+  def join(self, pid, oid):
+    self.record(Event.JOIN, pid, oid)
+    if self.rd != None:
+      self.rd.join(pid, oid)
+
+  def end(self, pid):
+    self.record(Event.END, pid)
+    if self.rd != None:
+      self.rd.end(pid)
+
+  def free(self, addr, size):
+    self.record(Event.FREE, 0, addr, size)
+    if self.rd != None:
+      self.rd.free(addr, size)
+
+
+class Trace():
+  '''A trace file, memory-mapped, or read as a stream when it is a pipe.
+  The file name '-' stands for stdin.'''
+
+  def __init__(self, fname):
+    self.fname = fname
+    self.fhandle = sys.stdin.buffer if fname == '-' else open(fname, 'rb')
+    self.mm = None
+    if stat.S_ISREG(os.fstat(self.fhandle.fileno()).st_mode):
+      self.mm = mmap.mmap(self.fhandle.fileno(), 0, access=mmap.ACCESS_READ)
+      header = self.mm[:HEADER.size]
+    else:
+      header = self.fhandle.read(HEADER.size)
+    (magic, version, flags, _) = HEADER.unpack(header)
+    assert(magic == MAGIC)
+    assert(version == VERSION)
+    self.compressed = bool(flags & COMPRESSED)
+
+  def close(self):
+    if self.mm != None:
+      self.mm.close()
+    if self.fhandle != sys.stdin.buffer:
+      self.fhandle.close()
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, *args):
+    self.close()
+
+  def chunks(self, size):
+    '''Yields the bytes past the header, size at a time'''
+    if self.mm != None:
+      for pos in range(HEADER.size, len(self.mm), size):
+        yield self.mm[pos:pos+size]
+      return
+    while True:
+      data = self.fhandle.read(size)
+      if not data:
+        return
+      yield data
+
+  def batches(self, nevents=1 << 14):
+    '''Yields buffers holding up to nevents whole records each'''
+    size = nevents * Event.size
+    if not self.compressed and self.mm == None:
+      for batch in self.chunks(size):
+        assert(len(batch) % Event.size == 0)
+        yield batch
+      return
+    if not self.compressed:
+      view = memoryview(self.mm)[HEADER.size:]
+      assert(len(view) % Event.size == 0)
+      try:
+        for start in range(0, len(view), size):
+          batch = view[start:start+size]
+          try:
+            yield batch
+          finally:
+            batch.release()
+      finally:
+        view.release()
+      return
+    zobj = zlib.decompressobj()
+    pending = b''
+    for data in self.chunks(1 << 16):
+      pending += zobj.decompress(data)
+      cut = len(pending) - len(pending) % size
+      for start in range(0, cut, size):
+        yield pending[start:start+size]
+      pending = pending[cut:]
+    pending += zobj.flush()
+    assert(zobj.eof and len(pending) % Event.size == 0)
+    for start in range(0, len(pending), size):
+      yield pending[start:start+size]
+
+  def events(self):
+    '''Yields (op, tid, addr, size) tuples'''
+    for batch in self.batches():
+      yield from Event.unpack(batch)
+
+
+class Pipeline():
+  '''Batches of a trace, read and decompressed by a producer thread while
+  the caller runs the detector on earlier ones.
+
+  The producer copies each batch into one of depth buffers, allocated up
+  front, and queues it; the caller hands a buffer back once done with it.
+  With all buffers queued, the producer waits for one to come back: it
+  runs at most depth batches ahead, and the memory held stays bounded
+  whatever the relative speed of the two.  Time spent waiting is kept in
+  stalls: the producer's, on the detector, and the consumer's, on decode.
+
+  Unpacking records stays with the consumer, as process_batch dispatches
+  them as it unpacks.  Under the GIL, what overlaps with detection is
+  I/O and zlib, which release it; on a free-threaded build, all of it.'''
+
+  def __init__(self, trace, nevents=1 << 14, depth=4):
+    assert(depth > 0)
+    self.trace = trace
+    self.nevents = nevents
+    self.free = queue.Queue()
+    for _ in range(depth):
+      self.free.put(bytearray(nevents * Event.size))
+    self.full = queue.Queue() # Bounded by the buffers in free
+    self.error = None
+    self.stalls = {'producer' : 0.0, 'consumer' : 0.0}
+    self.thread = threading.Thread(target=self.produce, daemon=True)
+    self.thread.start()
+
+  def produce(self):
+    batches = self.trace.batches(self.nevents)
+    try:
+      for batch in batches:
+        start = time.perf_counter()
+        buf = self.free.get()
+        self.stalls['producer'] += time.perf_counter() - start
+        if buf is None: # Closed by the consumer
+          break
+        n = len(batch)
+        buf[:n] = batch
+        self.full.put((buf, n))
+    except BaseException as e:
+      self.error = e
+    finally:
+      batches.close()
+      self.full.put(None)
+
+  def __iter__(self):
+    try:
+      while True:
+        start = time.perf_counter()
+        item = self.full.get()
+        self.stalls['consumer'] += time.perf_counter() - start
+        if item is None:
+          break
+        (buf, n) = item
+        batch = memoryview(buf)[:n]
+        try:
+          yield batch
+        finally:
+          batch.release()
+          self.free.put(buf)
+    finally:
+      self.close()
+    if self.error != None:
+      raise self.error
+
+  def close(self):
+    '''Stops the producer and waits for it'''
+    self.free.put(None)
+    self.thread.join()
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, *args):
+    self.close()
+
+
+def replay(fname, rd, nevents=1 << 14, start=0, every=None, snapshot=None, pipeline=0, stalls=None):
+  '''Streams a trace into rd.  Returns (events processed, races found)
+
+  The first start events are skipped, as when rd was restored from a
+  snapshot taken at that offset (see snapshot.py).  With every, rd is
+  snapshotted to the file snapshot, in the background, whenever another
+  every events have been processed.  With pipeline, the trace is decoded
+  on another thread, up to pipeline batches ahead, and the time each side
+  waited on the other is added to the dict stalls (see Pipeline).'''
+  assert(every == None or snapshot != None)
+  if every != None:
+    import snapshot as snap # Needs ft
+  count = 0
+  races = []
+  pending = None # Pid of the background save
+  mark = start
+  with Trace(fname) as trace, contextlib.ExitStack() as stack:
+    batches = trace.batches(nevents)
+    if pipeline:
+      batches = stack.enter_context(Pipeline(trace, nevents, pipeline))
+      if stalls != None:
+        stack.callback(lambda: stalls.update(batches.stalls))
+    for batch in batches:
+      n = len(batch) // Event.size
+      if count + n <= start:
+        count += n
+        continue
+      if count < start:
+        batch = batch[(start - count) * Event.size:]
+        (n, count) = (n - start + count, start)
+      races += rd.process_batch(batch)
+      count += n
+      if every != None and count - mark >= every:
+        snap.wait(pending)
+        pending = snap.save(rd, snapshot, count, background=True)
+        mark = count
+  if pending != None:
+    snap.wait(pending)
+  return (count, races)
+
+
+RECORD = {'names' : ['op', 'tid', 'addr', 'size'], 'formats' : ['u1', '<i4', '<u8', '<u8'],
+          'offsets' : [0, 4, 8, 16], 'itemsize' : Event.size} # Event.fmt, as a NumPy dtype
+
+
+def pieces(addr, size, shard, nshards, bits):
+  '''The [lo, hi) pieces of a range whose words start in shard'''
+  end = addr + size
+  block = 1 << bits
+  for b in range((addr >> bits) << bits, end, block):
+    if (b >> bits) % nshards != shard:
+      continue
+    lo = addr + ((max(b, addr) - addr + 7) // 8) * 8
+    hi = min(end, b + block)
+    if lo < hi:
+      yield (lo, hi)
+
+
+def shardEvents(batch, base, shard, nshards, bits, np=None):
+  '''The (event index, record) pairs of a batch, whose first event has
+  index base, that shard replays: the sync events and the memory events
+  in the shard, with ranges clipped to their pieces.  With NumPy as np,
+  the batch is partitioned in bulk, so only these records go through
+  Python.'''
+  if np == None:
+    for (i, (op, tid, addr, size)) in enumerate(Event.unpack(batch), base):
+      if op > Event.WRITE_RANGE:
+        yield (i, (op, tid, addr, size))
+      elif op <= Event.WRITE:
+        if (addr >> bits) % nshards == shard:
+          yield (i, (op, tid, addr, size))
+      else:
+        for (lo, hi) in pieces(addr, size, shard, nshards, bits):
+          yield (i, (op, tid, lo, hi - lo))
+    return
+  recs = np.frombuffer(batch, dtype=np.dtype(RECORD))
+  (op, addr, size) = (recs['op'], recs['addr'], recs['size'])
+  first = addr >> bits
+  mem = op <= Event.WRITE_RANGE
+  # Reads, writes and nonempty ranges within a block are kept whole, if in
+  # shard; the other ranges are split as without NumPy
+  whole = (op <= Event.WRITE) | ((size > 0) & (first == (addr + size - 1) >> bits))
+  keep = ~mem | (whole & (first % nshards == shard))
+  idx = np.nonzero(keep)[0]
+  out = recs[idx]
+  split = [(i, pieces(int(addr[i]), int(size[i]), shard, nshards, bits)) \
+           for i in np.nonzero(mem & ~whole)[0].tolist()]
+  split = [(i, lo, hi) for (i, parts) in split for (lo, hi) in parts]
+  if split:
+    extra = np.array([(op[i], recs['tid'][i], lo, hi - lo) for (i, lo, hi) in split], dtype=np.dtype(RECORD))
+    idx = np.concatenate([idx, np.array([i for (i, lo, hi) in split], dtype=idx.dtype)])
+    order = np.argsort(idx, kind='stable')
+    (idx, out) = (idx[order], np.concatenate([out, extra])[order])
+  yield from zip((idx + base).tolist(), out.tolist())
+
+
+def replayShard(args):
+  '''Replays all sync events plus the memory events of one address shard.
+
+  Address a belongs to shard (a >> bits) % nshards.  Ranges are clipped to
+  the words that start inside the shard.  Returns the number of events
+  and a list of (event index, address of the range piece or 0, data race)
+  triples.  Output is discarded: races are collected, and per-shard stats
+  would be meaningless.
+
+  Each batch is partitioned by shardEvents(), with NumPy if installed.'''
+  (fname, spec, shard, nshards, bits) = args
+  try:
+    import numpy as np
+  except ImportError:
+    np = None
+  rd = detector(spec)
+  sync = {Event.ACQ : rd.acq, Event.REL : rd.rel, Event.REM : rd.rem,
+          Event.REA : rd.rea, Event.JOIN : rd.join}
+  races = []
+  count = 0
+  with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+    with Trace(fname) as trace:
+      for batch in trace.batches():
+        for (idx, (op, tid, addr, size)) in shardEvents(batch, count, shard, nshards, bits, np):
+          if op <= Event.WRITE:
+            ret = rd.read(tid, addr) if op == Event.READ else rd.write(tid, addr)
+            if ret != None:
+              races.append((idx, 0, ret))
+          elif op <= Event.WRITE_RANGE:
+            for ret in rd.range(tid, addr, size, op - Event.READ_RANGE):
+              races.append((idx, addr, ret))
+          elif op in sync:
+            sync[op](tid, addr)
+          elif op == Event.FORK:
+            rd.fork(tid, addr, size)
+          elif op == Event.END:
+            rd.end(tid)
+          elif op == Event.FREE:
+            rd.free(addr, size)
+          else:
+            assert(0)
+        count += len(batch) // Event.size
+  return (count, races)
+
+
+def replaySharded(fname, spec, nshards, bits=6):
+  '''Replays a trace over nshards processes, partitioning memory events by
+  address in blocks of 2**bits bytes; blocks of cache lines, rather than
+  pages, spread even a small footprint over the shards.  Every process
+  replays the full stream of sync events, so clocks evolve exactly as in
+  a serial replay.
+  Returns (events processed, races found) like replay(), with the races
+  in trace order.'''
+  assert(bits >= 3)
+  args = [(fname, spec, shard, nshards, bits) for shard in range(nshards)]
+  with multiprocessing.Pool(nshards) as pool:
+    results = pool.map(replayShard, args)
+  count = results[0][0]
+  merged = []
+  for (_, races) in results:
+    merged += [(idx, lo, n, race) for (n, (idx, lo, race)) in enumerate(races)]
+  merged.sort(key=lambda item: item[:3])
+  return (count, [item[3] for item in merged])
+
+
+def detector(spec):
+  '''Instantiates a detector given as module:Class, e.g. ft:FT'''
+  (module, cls) = spec.split(':')
+  return getattr(importlib.import_module(module), cls)()
+
+
+def main(argv):
+  parser = argparse.ArgumentParser(prog=argv[0])
+  sub = parser.add_subparsers(dest='cmd', required=True)
+  p = sub.add_parser('sortnp', help='record the events of sortnp.go')
+  p.add_argument('out')
+  p.add_argument('--sz', type=int, default=10000)
+  p.add_argument('--fix', action='store_true', help='channels use rea instead of acq/rel')
+  p.add_argument('--raw', action='store_true', help='do not compress')
+  p = sub.add_parser('replay', help='replay a trace into a detector')
+  p.add_argument('trace')
+  p.add_argument('--rd', default='ft:FT', help='detector as module:Class')
+  p.add_argument('--jobs', type=int, default=1, help='shard memory events over JOBS processes')
+  p.add_argument('--snapshot', help='file for --snapshot-every, default TRACE.snap')
+  p.add_argument('--snapshot-every', type=int, help='snapshot the detector every N events')
+  p.add_argument('--resume', help='restore the detector from a snapshot and replay from its offset')
+  p.add_argument('--pipeline', type=int, nargs='?', const=4, default=0, metavar='N',
+                 help='read and decompress on another thread, up to N batches ahead (default 4)')
+  p = sub.add_parser('dump', help='print the events of a trace')
+  p.add_argument('trace')
+  args = parser.parse_args(argv[1:])
+
+  if args.cmd == 'sortnp':
+    import sortnp
+    rec = Recorder(args.out, compress=not args.raw)
+    sortnp.run(rec, sortnp.events(args.sz, fix=args.fix))
+    rec.close()
+    print("%s: %d events" % (args.out, rec.nevents))
+  elif args.cmd == 'replay':
+    start = time.time()
+    offset = 0
+    stalls = {}
+    if args.jobs > 1 and args.trace == '-':
+      parser.error("--jobs needs a trace file, not a pipe")
+    if args.jobs > 1:
+      (count, races) = replaySharded(args.trace, args.rd, args.jobs)
+      # A shard returns its first race with a key for every repeat
+      reporter = RaceReporter()
+      for race in {id(race) : race for race in races}.values():
+        reporter.collect(race)
+    else:
+      rd = detector(args.rd)
+      if args.resume:
+        import snapshot
+        offset = snapshot.load(rd, args.resume)
+      fsnap = args.snapshot if args.snapshot else args.trace + '.snap'
+      (count, races) = replay(args.trace, rd, start=offset, every=args.snapshot_every, snapshot=fsnap,
+                              pipeline=args.pipeline, stalls=stalls)
+      reporter = getattr(rd, 'reporter', None)
+    secs = time.time() - start
+    print("%s: events=%d, races=%d, secs=%.2f, events/sec=%d" % (\
+        args.rd, count, len(races), secs, (count - offset) / secs if secs else 0))
+    if stalls:
+      print("pipeline: depth=%d, decode waited %.2fs, detector waited %.2fs" % (\
+          args.pipeline, stalls['producer'], stalls['consumer']))
+    if reporter:
+      reporter.printSummary(args.rd)
+  elif args.cmd == 'dump':
+    with Trace(args.trace) as trace:
+      for (op, tid, addr, size) in trace.events():
+        print("%s %s %s %s" % (Event.names[op], tid, hex(addr), hex(size)))
+
+
+if __name__ == "__main__":
+  sys.exit(main(sys.argv))
@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+#
+# Sampling of memory accesses for the data-race detectors, in the style of
+# LiteRace and Pacer.  A detector with a sampler checks only the reads and
+# writes the sampler picks; sync operations are always processed, so the
+# happens-before relation stays exact and every race reported is a race of
+# the program.  Races whose accesses were not both sampled are missed.
+#
+#   AddrSampler    a fixed fraction of addresses, every access to them
+#   WindowSampler  every access in a fraction of windows of accesses
+#
+# sampler(spec) parses 'addr:RATE[:BITS]' or 'window:RATE[:SIZE]', e.g.
+# from $FT_SAMPLE when TSan constructs the detector.
+
+'''
+@author:    Daniel S. Fava
+@email:     danielsf@ifi.uio.no
+@contact:   www.danielfava.com
+@copyright: CC BY 4.0, https://creativecommons.org/licenses/by/4.0/
+@date:      April 2020
+
+See https://github.com/dfava/paper.go.mm.drd
+'''
+
+import sys
+import random
+from abc import ABC, abstractmethod
+
+HASH = 0x9E3779B1 # Knuth's multiplicative hash
+HASH_BITS = 32
+
+
+class Sampler(ABC):
+  '''Picks the accesses to check.  seen and checked count the accesses
+  offered and picked; a subclass defines sample() and coverage().'''
+
+  def __init__(self, rate):
+    assert(0 < rate <= 1)
+    self.rate = rate
+    self.seen = 0
+    self.checked = 0
+
+  @abstractmethod
+  def sample(self, pid, addr):
+    '''Whether to check an access of pid to addr; counts it'''
+    pass
+
+  @abstractmethod
+  def coverage(self):
+    '''Expected fraction of the races of a run that are reported'''
+    pass
+
+  def stats(self):
+    return {'smp_seen'     : self.seen,
+            'smp_checked'  : self.checked,
+            'smp_rate'     : self.checked / self.seen if self.seen else 0.0,
+            'smp_coverage' : self.coverage(),
+           }
+
+
+class AddrSampler(Sampler):
+  '''Checks every access to a fixed subset of the addresses: those whose
+  block of 2**bits bytes hashes below rate.  Since all accesses to a
+  sampled address are checked, a race on it is found exactly as without
+  sampling, and a race on any address is found with probability rate.
+  Non-integer names are always sampled.'''
+
+  def __init__(self, rate, bits=3, seed=0):
+    Sampler.__init__(self, rate)
+    self.bits = bits
+    self.threshold = int(rate * (1 << HASH_BITS))
+    self.salt = random.Random(seed).getrandbits(HASH_BITS)
+
+  def sample(self, pid, addr):
+    self.seen += 1
+    if type(addr) != int or \
+        (((addr >> self.bits) ^ self.salt) * HASH) & ((1 << HASH_BITS) - 1) < self.threshold:
+      self.checked += 1
+      return True
+    return False
+
+  def coverage(self):
+    return self.rate
+
+
+class WindowSampler(Sampler):
+  '''Divides the stream of accesses into windows of size accesses and
+  checks every access of a random fraction rate of the windows.  A race
+  whose two accesses are in one window is found with probability rate,
+  one across two windows with probability rate**2.'''
+
+  def __init__(self, rate, size=10000, seed=0):
+    Sampler.__init__(self, rate)
+    self.size = size
+    self.rnd = random.Random(seed)
+    self.left = size # Accesses left in the current window
+    self.on = self.rnd.random() < rate
+    self.windows = 1
+    self.sampled = int(self.on)
+
+  def sample(self, pid, addr):
+    self.seen += 1
+    if not self.left:
+      self.left = self.size
+      self.on = self.rnd.random() < self.rate
+      self.windows += 1
+      self.sampled += self.on
+    self.left -= 1
+    if self.on:
+      self.checked += 1
+    return self.on
+
+  def coverage(self):
+    return self.rate * self.rate # Races across windows; within one, rate
+
+
+def sampler(spec):
+  '''A sampler given as KIND:RATE[:ARG], or None for no spec'''
+  if not spec:
+    return None
+  fields = spec.split(':')
+  assert(fields[0] in ['addr', 'window'] and len(fields) in [2, 3])
+  rate = float(fields[1])
+  if fields[0] == 'addr':
+    return AddrSampler(rate, *[int(arg) for arg in fields[2:]])
+  return WindowSampler(rate, *[int(arg) for arg in fields[2:]])
+
+
+def main(argv):
+  '''Prints the sampling stats of a sampler over a range of addresses'''
+  assert(len(argv) == 3)
+  smp = sampler(argv[1])
+  for addr in range(0, 8 * int(argv[2]), 8):
+    smp.sample(0, addr)
+  print(smp.stats())
+
+
+if __name__ == "__main__":
+  sys.exit(main(sys.argv))
@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+#
+# Shadow memory for the data-race detectors.
+#
+# Shadow state is keyed by integer address.  Word-aligned addresses are
+# kept in page-granular slot arrays indexed by addr >> 3, so that a memory
+# access costs one dict lookup on the page number plus a list index.
+# Unaligned addresses, and non-integer names (as used in the unit tests),
+# fall back to a plain dict; unaligned addresses are also kept in a sorted
+# list so that free() costs time proportional to the freed region.
+
+'''
+@author:    Daniel S. Fava
+@email:     danielsf@ifi.uio.no
+@contact:   www.danielfava.com
+@copyright: CC BY 4.0, https://creativecommons.org/licenses/by/4.0/
+@date:      April 2020
+
+See https://github.com/dfava/paper.go.mm.drd
+'''
+
+from bisect import bisect_left, insort
+
+PAGE_BITS = 12                      # 4KB of address space per page
+WORD_BITS = 3                       # One slot per 8-byte word
+SLOT_BITS = PAGE_BITS - WORD_BITS
+PAGE_SLOTS = 1 << SLOT_BITS
+SLOT_MASK = PAGE_SLOTS - 1
+WORD_MASK = (1 << WORD_BITS) - 1
+
+
+class Shadow():
+  def __init__(self):
+    self.pages = {}
+    self.other = {}
+    self.odd = []   # Sorted unaligned integer addresses in self.other
+    self.size = 0
+
+  def get(self, addr):
+    if type(addr) == int and not addr & WORD_MASK:
+      page = self.pages.get(addr >> PAGE_BITS)
+      if page is None:
+        return None
+      return page[(addr >> WORD_BITS) & SLOT_MASK]
+    return self.other.get(addr)
+
+  def __getitem__(self, addr):
+    state = self.get(addr)
+    if state is None:
+      raise KeyError(addr)
+    return state
+
+  def __contains__(self, addr):
+    return self.get(addr) is not None
+
+  def __setitem__(self, addr, state):
+    assert(state is not None)
+    if type(addr) == int and not addr & WORD_MASK:
+      page = self.pages.get(addr >> PAGE_BITS)
+      if page is None:
+        page = self.pages[addr >> PAGE_BITS] = [None] * PAGE_SLOTS
+      slot = (addr >> WORD_BITS) & SLOT_MASK
+      if page[slot] is None:
+        self.size += 1
+      page[slot] = state
+      return
+    if addr not in self.other:
+      self.size += 1
+      if type(addr) == int:
+        insort(self.odd, addr)
+    self.other[addr] = state
+
+  def free(self, addr, end, each=None):
+    '''Removes the state of all addresses in [addr, end); returns how many
+    entries were removed.  each, if given, is called on every removed state.'''
+    ret = 0
+    first, last = addr >> PAGE_BITS, (end - 1) >> PAGE_BITS
+    if last - first < len(self.pages):
+      pnums = [pnum for pnum in range(first, last + 1) if pnum in self.pages]
+    else:
+      pnums = [pnum for pnum in self.pages.keys() if first <= pnum <= last]
+    for pnum in pnums:
+      page = self.pages[pnum]
+      base = pnum << PAGE_BITS
+      lo = max(0, (addr - base + WORD_MASK) >> WORD_BITS)
+      hi = min(PAGE_SLOTS, (end - base + WORD_MASK) >> WORD_BITS)
+      if each != None:
+        for state in page[lo:hi]:
+          if state is not None:
+            each(state)
+      if lo == 0 and hi == PAGE_SLOTS:
+        n = PAGE_SLOTS - page.count(None)
+        del(self.pages[pnum])
+      else:
+        n = hi - lo - page[lo:hi].count(None)
+        page[lo:hi] = [None] * (hi - lo)
+        if n and page.count(None) == PAGE_SLOTS:
+          del(self.pages[pnum])
+      ret += n
+    lo, hi = bisect_left(self.odd, addr), bisect_left(self.odd, end)
+    for a in self.odd[lo:hi]:
+      if each != None:
+        each(self.other[a])
+      del(self.other[a])
+    del(self.odd[lo:hi])
+    ret += hi - lo
+    self.size -= ret
+    return ret
+
+  def __len__(self):
+    return self.size
+
+  def span(self, addr, end, new):
+    '''Yields (base, page, lo, hi) for the words in [addr, end), where addr
+    is word-aligned and the words are page[lo:hi], with page[i] standing
+    for address base + (i << WORD_BITS).  Missing state is filled with new().'''
+    assert(type(addr) == int and not addr & WORD_MASK)
+    while addr < end:
+      pnum = addr >> PAGE_BITS
+      page = self.pages.get(pnum)
+      if page is None:
+        page = self.pages[pnum] = [None] * PAGE_SLOTS
+      lo = (addr >> WORD_BITS) & SLOT_MASK
+      hi = min(PAGE_SLOTS, lo + ((end - addr + WORD_MASK) >> WORD_BITS))
+      for i in range(lo, hi):
+        if page[i] is None:
+          page[i] = new()
+          self.size += 1
+      yield (pnum << PAGE_BITS, page, lo, hi)
+      addr = (pnum + 1) << PAGE_BITS
+
+  def keys(self):
+    '''Aligned addresses in increasing order, followed by everything else'''
+    for pnum in sorted(self.pages.keys()):
+      base = pnum << PAGE_BITS
+      for (slot, state) in enumerate(self.pages[pnum]):
+        if state is not None:
+          yield base + (slot << WORD_BITS)
+    for addr in self.other.keys():
+      yield addr
+
+  def __iter__(self):
+    return self.keys()
+
+  def values(self):
+    for addr in self.keys():
+      yield self.get(addr)
+
+  def items(self):
+    for addr in self.keys():
+      yield (addr, self.get(addr))
@@ -0,0 +1,243 @@
+#!/usr/bin/env python3
+#
+# Snapshots of the state of an FT detector, so that a long replay can be
+# resumed from the nearest snapshot instead of from the first event.
+#
+# A snapshot is a 24-byte header followed by sections, each a tag, a
+# length and a zlib-compressed pickle:
+#
+#   STATE  procs, locks, pids and counters; clocks as plain dicts
+#   VARS   up to CHUNK variables.  Word-aligned variables with a single
+#          read epoch are packed into three arrays of addresses, write and
+#          read epochs; the rest are (addr, w, r) triples
+#   END    the number of variables, as a check
+#
+# Sections are written as they are produced, so saving takes memory for
+# one chunk of variables only.  save(..., background=True) writes from a
+# forked child, which sees the state as of the fork while the parent goes
+# on detecting.
+#
+#   python3 snapshot.py SNAPSHOT      print the header and section sizes
+
+'''
+@author:    Daniel S. Fava
+@email:     danielsf@ifi.uio.no
+@contact:   www.danielfava.com
+@copyright: CC BY 4.0, https://creativecommons.org/licenses/by/4.0/
+@date:      April 2020
+
+See https://github.com/dfava/paper.go.mm.drd
+'''
+
+import os
+import sys
+import zlib
+import pickle
+import struct
+from array import array
+
+from ft import *
+
+MAGIC = b'FTSNAP\0\0'
+VERSION = 2
+HEADER = struct.Struct('<8sHHIQ') # magic, version, reserved, reserved, event offset
+SECTION = struct.Struct('<BI')     # tag, length
+(STATE, VARS, END) = (1, 2, 3)
+CHUNK = 1 << 16 # Variables per VARS section
+
+
+def clock(vc):
+  return dict(vc.vc)
+
+
+def state(ft):
+  '''Everything in ft but its variables, as builtin types'''
+  return {'cls'            : ft.__class__.__name__,
+          'vc'             : ft.VC.__name__,
+          'pids'           : list(ft.pidmap.pids),
+          'procs'          : [(p.id, p.slot, clock(p.vc), p.dirty) for p in ft.procs.values()],
+          'locks'          : [(l.id, clock(l.vc), None if l.known is None else set(l.known)) \
+                              for l in ft.locks.values()],
+          'deleted_pids'   : set(ft.deleted_pids),
+          'joiners'        : dict(ft.joiners),
+          'finals'         : {pid : clock(vc) for (pid, vc) in ft.finals.items()},
+          'dead'           : dict(ft.dead),
+          'retired'        : set(ft.retired),
+          'gcCountdown'    : ft.gcCountdown,
+          'gcStats'        : dict(ft.gcStats),
+          'readStats'      : dict(ft.readStats),
+          'pruneCountdown' : ft.pruneCountdown,
+          'acqSkipped'     : ft.acqSkipped,
+          'cacheHits'      : dict(ft.cacheHits),
+          'numOps'         : dict(ft.numOps),
+          'countdown'      : ft.countdown,
+          'reporter'       : ft.reporter,
+         }
+
+
+def chunks(ft):
+  '''Yields the variables of ft as VARS payloads'''
+  (addrs, ws, rs, other) = (array('Q'), array('Q'), array('Q'), [])
+  for (addr, v) in ft.vars.items():
+    r = v.r
+    if type(addr) == int and type(r) == int and addr >= 0:
+      addrs.append(addr)
+      ws.append(v.w)
+      rs.append(r)
+    else:
+      other.append((addr, v.w, r if type(r) in [int, tuple] else clock(r)))
+    if len(addrs) + len(other) == CHUNK:
+      yield (addrs.tobytes(), ws.tobytes(), rs.tobytes(), other)
+      (addrs, ws, rs, other) = (array('Q'), array('Q'), array('Q'), [])
+  if addrs or other:
+    yield (addrs.tobytes(), ws.tobytes(), rs.tobytes(), other)
+
+
+def section(fhandle, tag, payload):
+  data = zlib.compress(pickle.dumps(payload, pickle.HIGHEST_PROTOCOL), 1)
+  fhandle.write(SECTION.pack(tag, len(data)))
+  fhandle.write(data)
+
+
+def write(ft, fname, offset):
+  '''Writes the snapshot to fname.tmp and renames it to fname, so that an
+  interrupted save leaves any previous snapshot in place'''
+  tmp = fname + '.tmp'
+  with open(tmp, 'wb') as fhandle:
+    fhandle.write(HEADER.pack(MAGIC, VERSION, 0, 0, offset))
+    section(fhandle, STATE, state(ft))
+    for payload in chunks(ft):
+      section(fhandle, VARS, payload)
+    section(fhandle, END, len(ft.vars))
+  os.replace(tmp, fname)
+
+
+def save(ft, fname, offset, background=False):
+  '''Snapshots ft, which has processed the first offset events of a trace.
+  With background, writes from a forked child and returns its pid, to be
+  passed to wait(); otherwise returns None.'''
+  assert(isinstance(ft, FT))
+  if not background or not hasattr(os, 'fork'):
+    write(ft, fname, offset)
+    return None
+  pid = os.fork()
+  if pid:
+    return pid
+  status = 1
+  try:
+    write(ft, fname, offset)
+    status = 0
+  finally:
+    os._exit(status) # Skip atexit handlers, e.g. of stats sinks
+
+
+def wait(pid):
+  '''Waits for a background save; asserts that it succeeded'''
+  if pid != None:
+    (_, status) = os.waitpid(pid, 0)
+    assert(status == 0)
+
+
+def sections(fname):
+  '''Yields (event offset, None, None) and then (tag, size, payload) for
+  every section of a snapshot'''
+  with open(fname, 'rb') as fhandle:
+    (magic, version, _, _, offset) = HEADER.unpack(fhandle.read(HEADER.size))
+    assert(magic == MAGIC)
+    assert(version == VERSION)
+    yield (offset, None, None)
+    while True:
+      head = fhandle.read(SECTION.size)
+      if not head:
+        return
+      (tag, size) = SECTION.unpack(head)
+      data = fhandle.read(size)
+      assert(len(data) == size)
+      yield (tag, size, pickle.loads(zlib.decompress(data)))
+
+
+def restore(ft, st):
+  assert(st['cls'] == ft.__class__.__name__)
+  assert(st['vc'] == ft.VC.__name__)
+  assert(len(ft.procs) == 1 and not ft.locks and not len(ft.vars)) # A fresh detector
+  for pid in st['pids']:
+    ft.pidmap.slot(pid)
+  assert(ft.pidmap.pids == st['pids'])
+  mkclock = lambda entries: ft.VC.new(mkdict(entries))
+  ft.procs = {}
+  for (pid, slot, entries, dirty) in st['procs']:
+    p = Proc.__new__(Proc)
+    (p.id, p.slot, p.vc) = (pid, slot, mkclock(entries))
+    p.ep = pack(p.vc[pid], slot)
+    p.dirty = dirty
+    (p.reads, p.writes) = (set(), set()) # Caches start cold
+    ft.procs[pid] = p
+  ft.locks = {}
+  for (lid, entries, known) in st['locks']:
+    l = Lock(lid, ft.VC)
+    (l.vc, l.known) = (mkclock(entries), known)
+    ft.locks[lid] = l
+  ft.lockAddrs = sorted(lid for lid in ft.locks if type(lid) == int)
+  ft.finals = {pid : mkclock(entries) for (pid, entries) in st['finals'].items()}
+  for key in ['deleted_pids', 'joiners', 'dead', 'retired', 'gcCountdown', 'gcStats', 'readStats',\
+              'pruneCountdown', 'acqSkipped', 'cacheHits', 'numOps', 'countdown', 'reporter']:
+    setattr(ft, key, st[key])
+  if ft.census:
+    ft.census = {'procs' : ft.mkcensus(), 'locks' : ft.mkcensus()}
+    for p in ft.procs.values():
+      ft.census['procs'].add(p.vc, ft.deleted_pids)
+    for l in ft.locks.values():
+      ft.census['locks'].add(l.vc, ft.deleted_pids)
+
+
+def mkdict(entries):
+  ret = VC()
+  ret.vc = dict(entries)
+  return ret
+
+
+def load(ft, fname):
+  '''Restores a snapshot into ft, a freshly constructed detector of the
+  same class and clock backend as the one saved.  Returns the number of
+  trace events the saved detector had processed.'''
+  assert(isinstance(ft, FT))
+  secs = sections(fname)
+  (offset, _, _) = next(secs)
+  (tag, _, st) = next(secs)
+  assert(tag == STATE)
+  restore(ft, st)
+  shadow = ft.vars
+  for (tag, _, payload) in secs:
+    if tag == END:
+      assert(payload == len(shadow))
+      return offset
+    assert(tag == VARS)
+    (addrs, ws, rs, other) = payload
+    (addrs, ws, rs) = (array('Q', addrs), array('Q', ws), array('Q', rs))
+    for i in range(len(addrs)):
+      v = Var()
+      (v.w, v.r) = (ws[i], rs[i])
+      shadow[addrs[i]] = v
+    for (addr, w, r) in other:
+      v = Var()
+      (v.w, v.r) = (w, r if type(r) in [int, tuple] else ft.VC.new(mkdict(r)))
+      shadow[addr] = v
+  assert(0) # Truncated
+
+
+def main(argv):
+  assert(len(argv) == 2)
+  secs = sections(argv[1])
+  (offset, _, _) = next(secs)
+  print("%s: version=%d, offset=%d" % (argv[1], VERSION, offset))
+  for (tag, size, payload) in secs:
+    if tag == STATE:
+      print("  state, bytes=%d, procs=%d, locks=%d" % (size, len(payload['procs']), len(payload['locks'])))
+    elif tag == VARS:
+      print("  vars, bytes=%d, packed=%d, other=%d" % (size, len(payload[0]) // 8, len(payload[3])))
+    else:
+      print("  end, vars=%d" % payload)
+
+
+if __name__ == "__main__":
+  sys.exit(main(sys.argv))
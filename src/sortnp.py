@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+#
+# Event stream of sortnp.go as seen by a RaceDetector.
+#
+# The generator replays the goroutine structure of sortnp.go (split,
+# parMerge, merge, bubble) on a sequential schedule: every child
+# goroutine runs to completion before its sibling starts.  Channel
+# operations follow the Go runtime: before the fix, a send or receive on
+# a buffered channel is an acquire followed by a release on the buffer
+# slot; with the fix, it is a single release-acquire.
+
+'''
+@author:    Daniel S. Fava
+@email:     danielsf@ifi.uio.no
+@contact:   www.danielfava.com
+@copyright: CC BY 4.0, https://creativecommons.org/licenses/by/4.0/
+@date:      April 2020
+
+See https://github.com/dfava/paper.go.mm.drd
+'''
+
+import sys
+import random
+
+SLICE_BASE = 0xc000100000
+CHAN_BASE = 0xc000800000
+CHAN_SIZE = 0x60
+WORD = 8
+
+
+class SortNP():
+  def __init__(self, sz=10000, N=40, fix=False, seed=0):
+    self.sz = sz
+    self.N = N
+    self.fix = fix
+    rnd = random.Random(seed)
+    self.a = [rnd.randrange(1 << 62) for i in range(sz)]
+    self.npids = 1
+    self.nchans = 0
+
+  def newpid(self):
+    self.npids += 1
+    return self.npids - 1
+
+  def newchan(self):
+    self.nchans += 1
+    return {'addr' : CHAN_BASE + (self.nchans - 1) * CHAN_SIZE,
+            'sendx' : 0, 'recvx' : 0}
+
+  def addr(self, i):
+    return SLICE_BASE + i * WORD
+
+  def chanop(self, pid, chan, idx):
+    slot = chan['addr'] + chan[idx]
+    chan[idx] = (chan[idx] + 1) % 2
+    if self.fix:
+      yield ('rea', pid, slot)
+    else:
+      yield ('acq', pid, slot)
+      yield ('rel', pid, slot)
+
+  def send(self, pid, chan):
+    return self.chanop(pid, chan, 'sendx')
+
+  def recv(self, pid, chan):
+    return self.chanop(pid, chan, 'recvx')
+
+  def bubble(self, pid, fst, snd):
+    a = self.a
+    yield ('read', pid, self.addr(snd))
+    tmp = a[snd]
+    for top in range(snd, fst, -1):
+      yield ('read', pid, self.addr(top-1))
+      yield ('write', pid, self.addr(top))
+      a[top] = a[top-1]
+    yield ('write', pid, self.addr(fst))
+    a[fst] = tmp
+
+  def merge(self, pid, fst, snd, lng):
+    a = self.a
+    while fst < snd and snd < lng:
+      yield ('read', pid, self.addr(fst))
+      yield ('read', pid, self.addr(snd))
+      if a[fst] > a[snd]:
+        yield from self.bubble(pid, fst, snd)
+        fst += 1
+        snd += 1
+        continue
+      fst += 1
+
+  def sort(self, pid, fst, lng):
+    '''Insertion sort, standing in for sort.Slice on short slices'''
+    a = self.a
+    for i in range(fst+1, lng):
+      j = i
+      while j > fst:
+        yield ('read', pid, self.addr(j-1))
+        yield ('read', pid, self.addr(j))
+        if a[j-1] <= a[j]:
+          break
+        yield ('write', pid, self.addr(j-1))
+        yield ('write', pid, self.addr(j))
+        a[j-1], a[j] = a[j], a[j-1]
+        j -= 1
+
+  def parMerge(self, pid, fst, snd, lng, c, done):
+    yield from self.recv(pid, c)
+    yield from self.recv(pid, c)
+    yield from self.merge(pid, fst, snd, lng)
+    yield from self.send(pid, done)
+
+  def split(self, pid, fst, lng, done):
+    if lng-fst > self.N+1:
+      cdone = self.newchan()
+      mid = (fst + lng) // 2
+      for (lo, hi) in [(fst, mid), (mid, lng)]:
+        child = self.newpid()
+        yield ('fork', pid, child)
+        yield from self.split(child, lo, hi, cdone)
+        yield ('end', child)
+      yield from self.parMerge(pid, fst, mid, lng, cdone, done)
+    else:
+      yield from self.sort(pid, fst, lng)
+      yield from self.send(pid, done)
+
+  def events(self):
+    pid = 0
+    for i in range(self.sz):
+      yield ('write', pid, self.addr(i))
+    c = self.newchan()
+    yield from self.split(pid, 0, self.sz, c)
+    yield from self.recv(pid, c)
+
+
+def events(sz=10000, N=40, fix=False, seed=0):
+  return SortNP(sz, N, fix, seed).events()
+
+
+def run(rd, evs):
+  '''Feeds an event stream into a RaceDetector'''
+  for ev in evs:
+    getattr(rd, ev[0])(*ev[1:])
+  return rd
+
+
+def main(argv):
+  sz = int(argv[1]) if len(argv) > 1 else 10000
+  for ev in events(sz):
+    print(' '.join([ev[0]] + [hex(i) for i in ev[1:]]))
+
+
+if __name__ == "__main__":
+  sys.exit(main(sys.argv))
@@ -0,0 +1,403 @@
+#!/usr/bin/env python3
+#
+# Destinations for the periodic records of FT.stats().
+#
+# A record is a flat dict of numbers, e.g. {'ops' : 10000, 'procs' : 6, ...},
+# written together with the name of the detector class.  Histograms, e.g.
+# 'sizes_procs' : {size : count}, are kept by the text and JSON sinks and
+# left out by the CSV and columnar ones; the legacy .out files carry
+# 'hist_procs' instead, keyed by a pair of entry counts per clock.  Sinks
+# buffer records and write them out `bufsize` at a time, so that a run
+# under TSan does not do I/O while holding the TSan mutex at every
+# interval.
+#
+#   TextSink     the "FT, ops=..." lines FT.stats() has always printed
+#   CSVSink      one header line, then one line per record
+#   JSONSink     one JSON object per line
+#   ColumnSink   binary, one block of columns per flush (see below)
+#
+# sink(spec) picks a sink by file extension: .csv, .jsonl, .rds (columnar),
+# anything else is text.  FT uses sink($FT_STATS) by default, i.e. text on
+# stdout when FT_STATS is not set.
+#
+# read(fname) yields (name, record) pairs back from any of these, and from
+# the legacy .out files in ../data.  load(fname) returns NumPy arrays.
+#
+# Columnar layout, little endian:
+#   header:  MAGIC, u16 version
+#   block:   u16 nfields, u32 nrows, u16 len + class name,
+#            per field: u16 len + field name, 1 byte array typecode ('q' or 'd'),
+#            per field: nrows values of that type
+
+'''
+@author:    Daniel S. Fava
+@email:     danielsf@ifi.uio.no
+@contact:   www.danielfava.com
+@copyright: CC BY 4.0, https://creativecommons.org/licenses/by/4.0/
+@date:      April 2020
+
+See https://github.com/dfava/paper.go.mm.drd
+'''
+
+import re
+import os
+import ast
+import sys
+import csv
+import json
+import array
+import atexit
+import itertools
+import struct
+from abc import ABC, abstractmethod
+
+MAGIC = b'RDSTATS\0'
+VERSION = 1
+HEADER = struct.Struct('<8sH')
+BLOCK = struct.Struct('<HI')
+LEN = struct.Struct('<H')
+
+# The main line of TextSink, as printed by FT.stats() since the beginning
+TEXT_RE = r'(\S*), ops=(\d+), procs=(\d+)/(\d+), locks=(\d+), VC procs=(\d+)/(\d+), VC locks=(\d+)/(\d+)'
+TEXT_FIELDS = ['ops', 'procs', 'procs_all', 'locks', 'vc_procs_live', 'vc_procs', 'vc_locks_live', 'vc_locks']
+GC_RE = r'(\S*), ops=(\d+), gc, passes=(\d+), dead=(\d+), retired=(\d+), dropped=(\d+)'
+GC_FIELDS = ['ops', 'gc_passes', 'gc_dead', 'gc_retired', 'gc_dropped']
+READS_RE = r'(\S*), ops=(\d+), reads, small=(\d+), vcs=(\d+), entries=(\d+), shrunk=(\d+)'
+READS_FIELDS = ['ops', 'rd_small', 'rd_vcs', 'rd_entries', 'rd_shrunk']
+SAMPLE_RE = r'(\S*), ops=(\d+), sampling, seen=(\d+), checked=(\d+), rate=([\d.]+), coverage=([\d.]+), races=(\d+)'
+SAMPLE_FIELDS = ['ops', 'smp_seen', 'smp_checked', 'smp_rate', 'smp_coverage', 'smp_races']
+CACHE_RE = r'(\S*), ops=(\d+), cache, rd hits=(\d+), wr hits=(\d+), rd rate=([\d.]+), wr rate=([\d.]+)'
+CACHE_FIELDS = ['ops', 'cache_rd_hits', 'cache_wr_hits', 'cache_rd_rate', 'cache_wr_rate']
+FOOTPRINT_RE = r'(\S*), ops=(\d+), footprint, procs=(\d+), locks=(\d+), vars=(\d+), reads=(\d+), races=(\d+), total=(\d+)(?:, traced=(\d+))?'
+FOOTPRINT_FIELDS = ['ops', 'fp_procs', 'fp_locks', 'fp_vars', 'fp_reads', 'fp_races', 'fp_total', 'fp_traced']
+HIST_RE = r'(\S*), ops=(\d+), (hist|sizes), (\w+)= (\{.*\})'
+HISTS = ['hist_procs', 'hist_locks', 'sizes_procs', 'sizes_locks']
+LOAD_LINES = 1 << 16 # Lines of a text file that load() parses at a time
+
+
+def numeric(rec):
+  return {field : val for (field, val) in rec.items() if type(val) != dict}
+
+
+class Sink(ABC):
+  '''Buffers records and hands them to emit() bufsize at a time'''
+  mode = 'w'
+
+  def __init__(self, fname=None, bufsize=1024):
+    assert(fname == None or type(fname) == str)
+    assert(type(bufsize) == int and bufsize > 0)
+    self.fname = fname
+    self.bufsize = bufsize
+    self.rows = []
+    self.fhandle = None
+    if fname != None:
+      atexit.register(self.close)
+
+  def write(self, name, rec):
+    self.rows.append((name, rec))
+    if len(self.rows) >= self.bufsize:
+      self.flush()
+
+  def flush(self):
+    if not self.rows:
+      return
+    if self.fname == None:
+      fhandle = sys.stdout # Looked up late, for redirect_stdout
+    else:
+      if self.fhandle == None:
+        self.fhandle = open(self.fname, self.mode)
+        self.start(self.fhandle)
+      fhandle = self.fhandle
+    self.emit(fhandle, self.rows)
+    self.rows = []
+    fhandle.flush()
+
+  def close(self):
+    self.flush()
+    if self.fhandle != None:
+      self.fhandle.close()
+      self.fhandle = None
+
+  def start(self, fhandle):
+    pass
+
+  @abstractmethod
+  def emit(self, fhandle, rows):
+    pass
+
+
+class TextSink(Sink):
+  def __init__(self, fname=None, bufsize=None):
+    # Unbuffered on stdout, so output interleaves with race reports
+    if bufsize == None:
+      bufsize = 1 if fname == None else 1024
+    Sink.__init__(self, fname, bufsize)
+
+  @staticmethod
+  def format(name, rec):
+    ret = "%s, ops=%d, procs=%d/%d, locks=%d, VC procs=%d/%d, VC locks=%d/%d\n" % (\
+        name, rec['ops'], rec['procs'], rec['procs_all'], rec['locks'],\
+        rec['vc_procs_live'], rec['vc_procs'], rec['vc_locks_live'], rec['vc_locks'])
+    if 'gc_passes' in rec:
+      ret += "%s, ops=%d, gc, passes=%d, dead=%d, retired=%d, dropped=%d\n" % (\
+          name, rec['ops'], rec['gc_passes'], rec['gc_dead'], rec['gc_retired'], rec['gc_dropped'])
+    if any([rec.get(field) for field in READS_FIELDS[1:]]):
+      ret += "%s, ops=%d, reads, small=%d, vcs=%d, entries=%d, shrunk=%d\n" % (\
+          name, rec['ops'], rec['rd_small'], rec['rd_vcs'], rec['rd_entries'], rec['rd_shrunk'])
+    if 'smp_seen' in rec:
+      ret += "%s, ops=%d, sampling, seen=%d, checked=%d, rate=%.4f, coverage=%.4f, races=%d\n" % (\
+          name, rec['ops'], rec['smp_seen'], rec['smp_checked'], rec['smp_rate'],\
+          rec['smp_coverage'], rec['smp_races'])
+    if rec.get('cache_rd_hits') or rec.get('cache_wr_hits'):
+      ret += "%s, ops=%d, cache, rd hits=%d, wr hits=%d, rd rate=%.4f, wr rate=%.4f\n" % (\
+          name, rec['ops'], rec['cache_rd_hits'], rec['cache_wr_hits'], rec['cache_rd_rate'],\
+          rec['cache_wr_rate'])
+    if 'fp_total' in rec:
+      ret += "%s, ops=%d, footprint, procs=%d, locks=%d, vars=%d, reads=%d, races=%d, total=%d%s\n" % (\
+          name, rec['ops'], rec['fp_procs'], rec['fp_locks'], rec['fp_vars'], rec['fp_reads'],\
+          rec['fp_races'], rec['fp_total'], ", traced=%d" % rec['fp_traced'] if 'fp_traced' in rec else '')
+    for field in HISTS:
+      if field in rec:
+        ret += "%s, ops=%d, %s, %s= %s\n" % ((name, rec['ops']) + tuple(field.split('_')) + (rec[field],))
+    return ret
+
+  def emit(self, fhandle, rows):
+    fhandle.write(''.join([self.format(name, rec) for (name, rec) in rows]))
+
+
+class CSVSink(Sink):
+  def __init__(self, fname=None, bufsize=1024):
+    Sink.__init__(self, fname, bufsize)
+    self.fields = None
+
+  def emit(self, fhandle, rows):
+    out = csv.writer(fhandle)
+    rows = [(name, numeric(rec)) for (name, rec) in rows]
+    if self.fields == None:
+      self.fields = list(rows[0][1].keys())
+      out.writerow(['name'] + self.fields)
+    for (name, rec) in rows:
+      assert(list(rec.keys()) == self.fields)
+      out.writerow([name] + list(rec.values()))
+
+
+class JSONSink(Sink):
+  @staticmethod
+  def encode(val):
+    # JSON keys are strings; histogram keys are read back with literal_eval
+    return {str(k) : v for (k, v) in val.items()} if type(val) == dict else val
+
+  def emit(self, fhandle, rows):
+    fhandle.write(''.join([json.dumps(dict(name=name, \
+        **{field : self.encode(val) for (field, val) in rec.items()})) + '\n' for (name, rec) in rows]))
+
+
+class ColumnSink(Sink):
+  mode = 'wb'
+
+  def start(self, fhandle):
+    fhandle.write(HEADER.pack(MAGIC, VERSION))
+
+  def emit(self, fhandle, rows):
+    # One block per run of rows with the same class name and fields
+    rows = [(name, numeric(rec)) for (name, rec) in rows]
+    start = 0
+    for i in range(1, len(rows) + 1):
+      if i == len(rows) or rows[i][0] != rows[start][0] or \
+          rows[i][1].keys() != rows[start][1].keys():
+        self.block(fhandle, rows[start:i])
+        start = i
+
+  @staticmethod
+  def block(fhandle, rows):
+    (name, first) = rows[0]
+    buf = bytearray(BLOCK.pack(len(first), len(rows)))
+    buf += LEN.pack(len(name)) + name.encode()
+    cols = []
+    for (field, val) in first.items():
+      code = 'd' if type(val) == float else 'q'
+      buf += LEN.pack(len(field)) + field.encode() + code.encode()
+      cols.append(array.array(code, [rec[field] for (_, rec) in rows]))
+    if sys.byteorder != 'little':
+      for col in cols:
+        col.byteswap()
+    for col in cols:
+      buf += col.tobytes()
+    fhandle.write(buf)
+
+
+def sink(spec=None, bufsize=None):
+  '''A sink for spec: None or '-' for text on stdout, otherwise a file
+  whose extension picks the format'''
+  if spec == None or spec == '-':
+    return TextSink(None, bufsize)
+  ext = os.path.splitext(spec)[1]
+  if ext == '.csv':
+    cls = CSVSink
+  elif ext == '.jsonl':
+    cls = JSONSink
+  elif ext == '.rds':
+    cls = ColumnSink
+  else:
+    return TextSink(spec, bufsize)
+  return cls(spec) if bufsize == None else cls(spec, bufsize)
+
+
+def blocks(fname):
+  '''Yields (name, {field : array}) for each block of a columnar file'''
+  with open(fname, 'rb') as fhandle:
+    buf = fhandle.read()
+  (magic, version) = HEADER.unpack_from(buf, 0)
+  assert(magic == MAGIC and version == VERSION)
+  pos = HEADER.size
+  while pos < len(buf):
+    (nfields, nrows) = BLOCK.unpack_from(buf, pos)
+    pos += BLOCK.size
+    (n,) = LEN.unpack_from(buf, pos)
+    name = buf[pos + LEN.size:pos + LEN.size + n].decode()
+    pos += LEN.size + n
+    fields = []
+    for i in range(nfields):
+      (n,) = LEN.unpack_from(buf, pos)
+      fields.append((buf[pos + LEN.size:pos + LEN.size + n].decode(), chr(buf[pos + LEN.size + n])))
+      pos += LEN.size + n + 1
+    cols = {}
+    for (field, code) in fields:
+      col = array.array(code)
+      col.frombytes(buf[pos:pos + nrows * col.itemsize])
+      if sys.byteorder != 'little':
+        col.byteswap()
+      pos += nrows * col.itemsize
+      cols[field] = col
+    yield (name, cols)
+
+
+def number(s):
+  try:
+    return int(s)
+  except ValueError:
+    return float(s)
+
+
+def isColumnar(fname):
+  with open(fname, 'rb') as fhandle:
+    return fhandle.read(len(MAGIC)) == MAGIC
+
+
+def read(fname):
+  '''Yields (name, record) pairs from a file written by any sink, or from
+  the output of FT.stats() before there were sinks'''
+  ext = os.path.splitext(fname)[1]
+  if isColumnar(fname):
+    for (name, cols) in blocks(fname):
+      fields = list(cols.keys())
+      for row in zip(*cols.values()):
+        yield (name, dict(zip(fields, row)))
+  elif ext == '.csv':
+    with open(fname, newline='') as fhandle:
+      for row in csv.DictReader(fhandle):
+        name = row.pop('name')
+        yield (name, {field : number(val) for (field, val) in row.items()})
+  elif ext == '.jsonl':
+    with open(fname) as fhandle:
+      for line in fhandle:
+        rec = json.loads(line)
+        for (field, val) in rec.items():
+          if type(val) == dict:
+            rec[field] = {ast.literal_eval(k) : v for (k, v) in val.items()}
+        yield (rec.pop('name'), rec)
+  else:
+    main = re.compile(TEXT_RE)
+    gc = re.compile(GC_RE)
+    reads = re.compile(READS_RE)
+    sample = re.compile(SAMPLE_RE)
+    cache = re.compile(CACHE_RE)
+    footprint = re.compile(FOOTPRINT_RE)
+    hist = re.compile(HIST_RE)
+    last = None
+    with open(fname) as fhandle:
+      for line in fhandle:
+        m = main.match(line)
+        if m:
+          if last != None:
+            yield last
+          last = (m.group(1), dict(zip(TEXT_FIELDS, map(int, m.groups()[1:]))))
+          continue
+        m = gc.match(line)
+        if m and last != None and int(m.group(2)) == last[1]['ops']:
+          last[1].update(zip(GC_FIELDS[1:], map(int, m.groups()[2:])))
+          continue
+        m = reads.match(line)
+        if m and last != None and int(m.group(2)) == last[1]['ops']:
+          last[1].update(zip(READS_FIELDS[1:], map(int, m.groups()[2:])))
+          continue
+        m = sample.match(line)
+        if m and last != None and int(m.group(2)) == last[1]['ops']:
+          last[1].update(zip(SAMPLE_FIELDS[1:], map(ast.literal_eval, m.groups()[2:])))
+          continue
+        m = cache.match(line)
+        if m and last != None and int(m.group(2)) == last[1]['ops']:
+          last[1].update(zip(CACHE_FIELDS[1:], map(ast.literal_eval, m.groups()[2:])))
+          continue
+        m = footprint.match(line)
+        if m and last != None and int(m.group(2)) == last[1]['ops']:
+          last[1].update([(field, int(val)) for (field, val) in \
+              zip(FOOTPRINT_FIELDS[1:], m.groups()[2:]) if val != None])
+          continue
+        m = hist.match(line)
+        if m and last != None and int(m.group(2)) == last[1]['ops']:
+          last[1][m.group(3) + '_' + m.group(4)] = ast.literal_eval(m.group(5))
+    if last != None:
+      yield last
+
+
+def load(fname):
+  '''Returns {field : NumPy array} with the records in fname.  Columnar
+  files are mapped with np.frombuffer, without Python objects per record.
+  Text files are scanned LOAD_LINES lines at a time into an array that
+  doubles as it fills, so that a long log is never held in memory whole.'''
+  import numpy as np
+  if isColumnar(fname):
+    cols = {}
+    for (name, block) in blocks(fname):
+      for (field, col) in block.items():
+        cols.setdefault(field, []).append(np.frombuffer(col, dtype=np.dtype(col.typecode)))
+    return {field : np.concatenate(parts) for (field, parts) in cols.items()}
+  ext = os.path.splitext(fname)[1]
+  if ext == '.csv':
+    data = np.genfromtxt(fname, delimiter=',', names=True, dtype=None, encoding=None)
+    return {field : data[field] for field in data.dtype.names if field != 'name'}
+  if ext == '.jsonl':
+    rows = [rec for (name, rec) in read(fname)]
+    return {field : np.array([rec[field] for rec in rows]) for field in (rows[0].keys() if rows else [])}
+  main = re.compile(TEXT_RE)
+  data = np.empty((1024, len(TEXT_FIELDS)), dtype=np.int64)
+  n = 0
+  with open(fname) as fhandle:
+    while True:
+      text = ''.join(itertools.islice(fhandle, LOAD_LINES))
+      if not text:
+        break
+      rows = main.findall(text)
+      if not rows:
+        continue
+      while n + len(rows) > len(data):
+        data = np.concatenate([data, np.empty_like(data)])
+      data[n:n + len(rows)] = np.array([row[1:] for row in rows], dtype=np.int64)
+      n += len(rows)
+  return {field : data[:n, i].copy() for (i, field) in enumerate(TEXT_FIELDS)}
+
+
+def main(argv):
+  '''Converts between formats: statsink.py IN OUT'''
+  if len(argv) != 3:
+    print("usage: %s IN OUT" % argv[0])
+    return 1
+  out = sink(argv[2])
+  for (name, rec) in read(argv[1]):
+    out.write(name, rec)
+  out.close()
+
+
+if __name__ == "__main__":
+  sys.exit(main(sys.argv))
@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+#
+# Synthetic event streams for benchmarking the data-race detectors.
+#
+# Procs are forked in a tree of the given depth and then take random
+# steps.  A step is a private access, to the proc's own slice of the
+# address footprint, or with probability `sharing` a shared access: the
+# proc acquires one of the locks, accesses a word guarded by that lock and
+# releases it.  So the stream is race free and exercises the read, write,
+# acq and rel paths in proportions set by the parameters.  At the end,
+# every child ends and is joined by its parent.
+
+'''
+@author:    Daniel S. Fava
+@email:     danielsf@ifi.uio.no
+@contact:   www.danielfava.com
+@copyright: CC BY 4.0, https://creativecommons.org/licenses/by/4.0/
+@date:      April 2020
+
+See https://github.com/dfava/paper.go.mm.drd
+'''
+
+import sys
+import random
+
+PRIVATE_BASE = 0xc000000000
+SHARED_BASE = 0xc800000000
+LOCK_BASE = 0xd000000000
+WORD = 8
+
+DEFAULTS = {'procs'     : 8,        # Goroutines, besides proc 0
+            'locks'     : 4,        # Locks/channels guarding shared data
+            'footprint' : 1 << 20,  # Bytes of address space touched
+            'reads'     : 0.8,      # Fraction of accesses that are reads
+            'sharing'   : 0.1,      # Fraction of accesses to shared data
+            'depth'     : 2,        # Depth of the fork tree
+            'steps'     : 100000,   # Random steps taken by the procs
+            'seed'      : 0,
+           }
+
+
+def params(**kwargs):
+  ret = dict(DEFAULTS)
+  for key in kwargs.keys():
+    assert(key in DEFAULTS)
+  ret.update(kwargs)
+  return ret
+
+
+def events(**kwargs):
+  '''Yields events as tuples (method name, args...) for a RaceDetector'''
+  p = params(**kwargs)
+  rnd = random.Random(p['seed'])
+  nprocs = p['procs']
+  assert(nprocs >= 1 and p['depth'] >= 1 and p['locks'] >= 1)
+
+  # Fork tree: level k holds about nprocs/depth procs forked from level k-1
+  levels = [[0]]
+  parent = {}
+  pid = 1
+  for k in range(p['depth']):
+    n = nprocs // p['depth'] + (1 if k < nprocs % p['depth'] else 0)
+    levels.append([])
+    for i in range(n):
+      parent[pid] = rnd.choice(levels[k])
+      levels[k+1].append(pid)
+      yield ('fork', parent[pid], pid, 1)
+      pid += 1
+    if not levels[-1]:
+      break
+  pids = list(parent.keys())
+
+  private = max(1, p['footprint'] // 2 // WORD // nprocs)
+  shared = max(1, p['footprint'] // 2 // WORD // p['locks'])
+  for step in range(p['steps']):
+    pid = rnd.choice(pids)
+    op = 'read' if rnd.random() < p['reads'] else 'write'
+    if rnd.random() < p['sharing']:
+      lock = rnd.randrange(p['locks'])
+      yield ('acq', pid, LOCK_BASE + lock * WORD)
+      yield (op, pid, SHARED_BASE + (lock * shared + rnd.randrange(shared)) * WORD)
+      yield ('rel', pid, LOCK_BASE + lock * WORD)
+    else:
+      yield (op, pid, PRIVATE_BASE + (pid * private + rnd.randrange(private)) * WORD)
+
+  for pid in reversed(pids):
+    yield ('end', pid)
+    yield ('join', parent[pid], pid)
+
+
+def main(argv):
+  for ev in events():
+    print(' '.join([ev[0]] + [hex(i) for i in ev[1:]]))
+
+
+if __name__ == "__main__":
+  sys.exit(main(sys.argv))
@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+
+'''
+@author:    Daniel S. Fava
+@email:     danielsf@ifi.uio.no
+@contact:   www.danielfava.com
+@copyright: CC BY 4.0, https://creativecommons.org/licenses/by/4.0/
+@date:      April 2020
+
+See https://github.com/dfava/paper.go.mm.drd
+'''
+
+import io
+import sys
+import unittest
+import contextlib
+
+import bench
+import sortnp
+from ft import *
+from djit import *
+from treeclock import TreeClock
+from testutil import randomOps
+
+
+class TestDjit(unittest.TestCase):
+
+  def test_races(self):
+    dj = Djit(stats_interval=None)
+    dj.race = False
+    dj.fork(0, 1)
+    dj.write(0, 'x')
+    race = dj.read(1, 'x')
+    assert(race.drType == 'wr' and (race.pid, race.other) == (1, 0))
+    assert(race.message.startswith("Djit: (ERR) Data race on read 1 x"))
+    dj.read(0, 'y')
+    dj.read(1, 'y')          # Concurrent reads are fine
+    assert(dj.write(1, 'y').drType == 'rw')
+    assert(dj.write(1, 'x').drType == 'ww')
+    dj.rel(0, 'l')
+    dj.acq(1, 'l')
+    assert(dj.write(1, 'x') is None and dj.write(1, 'y') is None)
+    assert(dj.vars['y'].r.vc == {0 : 2, 1 : 1} and dj.vars['x'].w.vc == {0 : 2, 1 : 1})
+    assert(dj.reporter.summary()['total'] == 3)
+
+  def test_lazy(self):
+    '''The message shows the proc's clock at the time of the race, even
+    if it has since been updated in place'''
+    for vc in [VC, TreeClock]:
+      dj = Djit(stats_interval=None, vc=vc)
+      dj.race = False
+      dj.fork(0, 1)
+      dj.write(0, 'x')
+      race = dj.read(1, 'x')
+      dj.rel(0, 'l')
+      dj.acq(1, 'l')
+      assert(dj.procs[1].vc[0] == 2)
+      assert(race.message.split('\n')[1] == '  proc[1]: %s' % VC(Epoch(1, 1), Epoch(1, 0)))
+
+  def test_range(self):
+    dj = Djit(stats_interval=None)
+    dj.race = False
+    dj.fork(0, 1)
+    assert(dj.range(0, 0x100, 32, 1) == [])
+    races = dj.range(1, 0x108, 16, 0)
+    assert([race.addr for race in races] == [0x108, 0x110])
+
+  def test_same_verdicts(self):
+    '''The same races on every op as FT, also with gc retiring pids'''
+    for seed in range(20):
+      for kwargs in [{}, {'gc_interval' : 2}]:
+        (ft, dj) = (FT(stats_interval=None, **kwargs), Djit(stats_interval=None, **kwargs))
+        ft.race = dj.race = False
+        for op in randomOps(seed):
+          want = getattr(ft, op[0])(*op[1:])
+          got = getattr(dj, op[0])(*op[1:])
+          assert(bench.verdict(got) == bench.verdict(want))
+        assert(ft.reporter.kinds == dj.reporter.kinds)
+        assert(dj.retired == ft.retired)
+
+  def test_shadow(self):
+    evs = list(sortnp.events(200, N=20))
+    (ft, dj) = (sortnp.run(FT(stats_interval=None), evs), sortnp.run(Djit(stats_interval=None), evs))
+    assert(len(dj.vars) == len(ft.vars))
+    assert(shadowEntries(ft) == 2 * len(ft.vars))
+    assert(shadowEntries(dj) > shadowEntries(ft))
+
+
+class TestCompare(unittest.TestCase):
+
+  def test_calls(self):
+    evs = [('fork', 0, 1, 2), ('read', 1, 0x10), ('write', 0, 0x18), ('acq', 0, 0x20),
+           ('rel', 0, 0x20), ('rem', 1, 0x20), ('rea', 1, 0x20), ('end', 1), ('join', 0, 1)]
+    assert(list(bench.calls(Event.unpack(bench.pack(evs)))) == evs)
+    recs = [(Event.WRITE_RANGE, 0, 0x10, 16), (Event.FREE, 0, 0x10, 16)]
+    assert(list(bench.calls(recs)) == [('range', 0, 0x10, 16, 1), ('free', 0x10, 16)])
+
+  def test_compare(self):
+    evs = [('fork', 0, 1, 0), ('write', 0, 'x'), ('read', 1, 'x'), ('read', 0, 'y')]
+    out = io.StringIO()
+    with contextlib.redirect_stdout(out):
+      ret = bench.compare(evs, mem=True)
+    assert(ret['diffs'] == [])
+    assert(ret['ops']['read']['Djit'][0] == 2)
+    assert(ret['shadow']['FT']['vars'] == ret['shadow']['Djit']['vars'] == 2)
+    assert(ret['shadow']['Djit']['bytes'] > 0)
+    assert("differing verdicts=0" in out.getvalue())
+
+
+def main(argv):
+  unittest.main()
+
+if __name__ == "__main__":
+  sys.exit(main(sys.argv))
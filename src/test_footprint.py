@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+
+'''
+@author:    Daniel S. Fava
+@email:     danielsf@ifi.uio.no
+@contact:   www.danielfava.com
+@copyright: CC BY 4.0, https://creativecommons.org/licenses/by/4.0/
+@date:      April 2020
+
+See https://github.com/dfava/paper.go.mm.drd
+'''
+
+import os
+import sys
+import tempfile
+import unittest
+import tracemalloc
+
+import synth
+import sortnp
+import statsink
+from ft import *
+from footprint import *
+from treeclock import TreeClock
+from testutil import serial, racy, randomOps
+
+
+class TestFootprint(unittest.TestCase):
+
+  def tearDown(self):
+    if tracemalloc.is_tracing():
+      tracemalloc.stop()
+
+  def test_sizeof(self):
+    assert(sizeof(1) == 0 and sizeof('x') == 0)
+    lst = [(), ()]
+    assert(sizeof(lst) == sys.getsizeof(lst) + sys.getsizeof(()))
+    v = Var()
+    assert(sizeof(v) == sys.getsizeof(v))
+    vc = VC(Epoch(1, 0))
+    assert(sizeof([vc, vc]) == sys.getsizeof([vc, vc]) + sys.getsizeof(vc) + sys.getsizeof(vc.vc))
+
+  def test_bucket(self):
+    assert([bucket(n) for n in [0, 64, 65, 100, 1000]] == [0, 64, 68, 100, 1024])
+    assert(all([bucket(n) >= n and bucket(n) < n * 1.07 for n in range(1, 5000)]))
+
+  def test_traced(self):
+    '''The bytes accounted for are those tracemalloc finds'''
+    for params in [{}, {'sharing' : 0.5, 'procs' : 32}]:
+      for vc in [VC, TreeClock]:
+        fp = Footprint(trace=True)
+        rd = serial(FT(stats_interval=None, vc=vc), synth.events(steps=5000, **params))
+        got = fp.measure(rd)
+        assert(got['fp_total'] == sum([got[key] for key in ['fp_procs', 'fp_locks', 'fp_vars', 'fp_reads', 'fp_races']]))
+        assert(0.8 < got['fp_total'] / got['fp_traced'] < 1.2)
+        tracemalloc.stop()
+
+  def test_reads(self):
+    ft = serial(FT(stats_interval=None), randomOps(0))
+    assert(ft.readStats['small'] or ft.readStats['vcs'])
+    fp = Footprint().measure(ft)
+    assert(fp['fp_reads'] > 0)
+    ft.free(0, 1 << 20)
+    assert(Footprint().measure(ft)['fp_reads'] == 0)
+
+  def test_walk(self):
+    '''The read stats and packed epochs found by a walk, as under -O, are
+    those FT keeps, and no more epochs than are estimated'''
+    ft = serial(FT(stats_interval=None), randomOps(3, 2000))
+    (stats, epochs) = Footprint.walk(ft)
+    assert(stats == {key : ft.readStats[key] for key in stats})
+    assert(0 < epochs <= 2 * len(ft.vars) + stats['small_entries'])
+
+  def test_ended(self):
+    '''Final clocks and the tables of ended pids count with the procs'''
+    ops = [('fork', 0, 1), ('write', 1, 0x10), ('end', 1)]
+    kept = serial(FT(stats_interval=None, gc_interval=1000), ops)
+    gone = serial(FT(stats_interval=None), ops)
+    assert(kept.finals and kept.dead and not gone.finals)
+    fp = Footprint()
+    assert(fp.measure(kept)['fp_procs'] > fp.measure(gone)['fp_procs'])
+
+  def test_races(self):
+    ft = FT(stats_interval=None)
+    fp = Footprint()
+    assert(fp.measure(ft)['fp_races'] == fp.dictBytes(0))
+    serial(ft, racy(0))
+    assert(fp.measure(ft)['fp_races'] >= len(ft.reporter.races) * fp.raceBytes() > 0)
+
+  def test_census(self):
+    '''Clocks are counted the same with stats off'''
+    ops = randomOps(1)
+    on = serial(FT(stats_interval=100, stats_sink=statsink.sink(os.devnull)), ops)
+    off = serial(FT(stats_interval=None), ops)
+    fp = Footprint()
+    assert(fp.measure(on) == fp.measure(off))
+
+  def test_stats(self):
+    with tempfile.TemporaryDirectory() as tmp:
+      for (spec, ext) in [('count', '.out'), ('trace', '.out'), ('count', '.csv')]:
+        fname = os.path.join(tmp, 'stats' + ext)
+        sink = statsink.sink(fname)
+        serial(FT(stats_interval=500, stats_sink=sink, footprint=footprint(spec)), randomOps(2, 2000))
+        sink.close()
+        recs = [rec for (_, rec) in statsink.read(fname)]
+        assert(len(recs) == 3)
+        assert(all([rec['fp_total'] > 0 and rec['fp_vars'] > 0 for rec in recs]))
+        assert(('fp_traced' in recs[-1]) == (spec == 'trace'))
+        tracemalloc.stop()
+
+  def test_env(self):
+    os.environ['FT_FOOTPRINT'] = 'count'
+    try:
+      ft = FT(stats_interval=None)
+    finally:
+      del(os.environ['FT_FOOTPRINT'])
+    assert(type(ft.footprint) == Footprint and not ft.footprint.trace)
+    assert(FT(stats_interval=None).footprint == None)
+
+
+def main(argv):
+  unittest.main()
+
+if __name__ == "__main__":
+  sys.exit(main(sys.argv))
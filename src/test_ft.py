@@ -10,9 +10,17 @@
 See https://github.com/dfava/paper.go.mm.drd
 '''
 
+import io
 import os
 import sys
+import pickle
+import tempfile
+import contextlib
+import sortnp
+import statsink
 from ft import *
+from treeclock import TreeClock
+from testutil import randomOps
 import unittest
 
 class TestEpoch(unittest.TestCase):
@@ -54,14 +62,16 @@ class TestEpoch(unittest.TestCase):
 
 
 class TestVC(unittest.TestCase):
+  VC = VC # The backend under test, see the subclasses
+
   def test_empty(self):
-    vc = VC()
+    vc = self.VC()
     assert(list(vc.vc.keys()) == [])
     assert(vc['a'] == 0)
     assert(vc[1] == 0)
 
   def test_from_epochs(self):
-    vc = VC(Epoch(4, 'a'), Epoch(1, 'b'))
+    vc = self.VC(Epoch(4, 'a'), Epoch(1, 'b'))
     assert(len(list(vc.vc.keys())) == 2)
     assert(vc['z'] == 0)
     assert(vc[1] == 0)
@@ -70,7 +80,7 @@ class TestVC(unittest.TestCase):
 
 
   def test_inc(self):
-    vc = VC()
+    vc = self.VC()
     assert(vc['a'] == 0)
     vc.inc('a')
     assert(vc['a'] == 1)
@@ -82,7 +92,7 @@ class TestVC(unittest.TestCase):
     assert(vc['c'] == 0)
 
   def test_le_fail(self):
-    vc = VC()
+    vc = self.VC()
     try:
       vc <= 10
     except AssertionError:
@@ -90,9 +100,9 @@ class TestVC(unittest.TestCase):
     assert(0)
 
   def test_le(self):
-    vc = VC()
+    vc = self.VC()
     assert(vc <= vc)
-    vc2 = VC()
+    vc2 = self.VC()
     assert(vc <= vc2)
     assert(vc2 <= vc)
     vc2.inc('a')
@@ -107,47 +117,72 @@ class TestVC(unittest.TestCase):
     assert(not vc2 <= vc)
 
   def test_lub_trivial(self):
-    vc1 = VC()
-    vc2 = VC() 
-    lub = VC.lub(vc1, vc2)
+    vc1 = self.VC()
+    vc2 = self.VC() 
+    lub = self.VC.lub(vc1, vc2)
     assert(vc1 <= lub)
     assert(vc2 <= lub)
 
   def test_lub_self(self):
-    vc1 = VC()
-    vc2 = VC() 
+    vc1 = self.VC()
+    vc2 = self.VC() 
     vc1.inc('a')
     vc2.inc('a')
     vc2.inc('a')
     assert(vc1 <= vc2)
-    lub = VC.lub(vc1, vc2)
+    lub = self.VC.lub(vc1, vc2)
     assert(vc1 <= lub)
     assert(vc2 <= lub)
     assert(lub <= vc2)
 
   def test_lub(self):
-    vc1 = VC()
-    vc2 = VC() 
+    vc1 = self.VC()
+    vc2 = self.VC() 
     vc1.inc('a')
     vc2.inc('b')
     vc2.inc('b')
     assert(not vc1 <= vc2)
     assert(not vc2 <= vc1)
-    lub = VC.lub(vc1, vc2)
+    lub = self.VC.lub(vc1, vc2)
     assert(vc1 <= lub)
     assert(vc2 <= lub)
 
 
   def test_new(self):
-    vc1 = VC()
+    vc1 = self.VC()
     vc1.inc('a')
     vc1.inc('b')
     vc1.inc('b')
-    vc2 = VC.new(vc1)
+    vc2 = self.VC.new(vc1)
     assert(vc1 <= vc2)
     assert(vc2 <= vc1)
+    vc1.inc('a') # A copy, not a view of vc1
+    assert(vc2['a'] == 1 and vc1['a'] == 2)
+
+
+class TestTreeClockVC(TestVC):
+  VC = TreeClock
 
 
+class TestVCView(unittest.TestCase):
+  def test_view(self):
+    base = VC(Epoch(1, 'a'), Epoch(2, 'b'))
+    view = VCView(base, 'a', 5)
+    assert(view['a'] == 5 and view['b'] == 2 and view['c'] == 0)
+    assert(view.vc == {'a' : 5, 'b' : 2})
+    assert(base.vc == {'a' : 1, 'b' : 2})
+    self.assertRaises(AssertionError, view.inc, 'a')
+
+  def test_lub(self):
+    base = VC(Epoch(1, 'a'), Epoch(2, 'b'))
+    other = VC(Epoch(3, 'a'), Epoch(1, 'c'))
+    view = VCView(base, 'b', 4)
+    assert(VC.lub(view, other).vc == {'a' : 3, 'b' : 4, 'c' : 1})
+    assert(VC.lub(other, view).vc == {'a' : 3, 'b' : 4, 'c' : 1})
+    assert(VC.lub(view, VCView(other, 'b', 7)).vc == {'a' : 3, 'b' : 7, 'c' : 1})
+    assert(other <= VC.lub(view, other))
+    assert(not (other <= view))
+
 
 class TestProc(unittest.TestCase):
   def test_new(self):
@@ -182,9 +217,10 @@ class TestLock(unittest.TestCase):
 
 
 class TestFT(unittest.TestCase):
+  VC = VC # The backend under test, see the subclasses
  
   def test_fork(self):
-    ft = FT(verbose=False)
+    ft = FT(verbose=False, vc=self.VC)
     assert(0 in ft.procs)
     assert(ft.procs[0].vc[0] == 1)  # Every process starts with its VC at 1
     assert(ft.procs[0].vc[1] == 0)
@@ -209,7 +245,7 @@ class TestFT(unittest.TestCase):
     assert(ft.procs[2].vc[42] == 0)
 
   def test_fork2(self):
-    ft = FT(verbose=False)
+    ft = FT(verbose=False, vc=self.VC)
     assert(1 not in ft.procs.keys())
     assert(1 not in ft.deleted_pids)
     ft.fork(0,1)
@@ -225,12 +261,12 @@ class TestFT(unittest.TestCase):
     assert(False)
     
   def test_range(self):
-    rd = FT(verbose=False)
+    rd = FT(verbose=False, vc=self.VC)
     base = 0x0
     size = 0x100
     step = 8
     rd.range(0, base, size, 0)
-    vs = [hex(i) for i in range(base, base+size, step)]
+    vs = list(range(base, base+size, step))
     #print(list(rd.vars.keys()))
     #print(vs)
     assert(list(rd.vars.keys()) == vs)
@@ -238,11 +274,530 @@ class TestFT(unittest.TestCase):
     base = 0x180
     size = 0x20
     rd.range(0, base, size, 1)
-    vs += [hex(i) for i in range(base, base+size, step)] 
+    vs += list(range(base, base+size, step))
     #print(list(rd.vars.keys()))
     #print(vs)
     assert(list(rd.vars.keys()) == vs)
-    
+
+  def range_ops(self, ft, rng):
+    ft.fork(0,1)
+    ft.fork(0,2)
+    rng(ft, 0, 0x1ff0, 0x40, 1)    # Spans two pages
+    ft.rel(0, 'l')
+    ft.acq(1, 'l')
+    rng(ft, 1, 0x1ff0, 0x20, 0)
+    rng(ft, 2, 0x2000, 0x28, 0)    # Races with proc 0's writes
+    ft.read(2, 0x2040)
+    rng(ft, 1, 0x2020, 0x30, 0)    # Read share
+    rng(ft, 0, 0x2000, 0x61, 1)    # Partial last word
+
+  def test_range_bulk(self):
+    def bulk(ft, pid, addr, length, access_type):
+      return ft.range(pid, addr, length, access_type)
+    def words(ft, pid, addr, length, access_type):
+      return RaceDetector.range(ft, pid, addr, length, access_type)
+    reports = []
+    for rng in [bulk, words]:
+      ft = FT(verbose=False, vc=self.VC)
+      out = io.StringIO()
+      with contextlib.redirect_stdout(out):
+        self.range_ops(ft, rng)
+      state = [v.str(var, ft.pidmap.pids) for (var, v) in ft.vars.items()]
+      reports.append((out.getvalue(), state, dict(ft.numOps)))
+    assert(reports[0][0].count('Data race') == 13)
+    assert(reports[0] == reports[1])
+
+  def test_process_batch(self):
+    evs = [(Event.FORK, 0, 1), (Event.WRITE, 0, 0x10), (Event.REL, 0, 0x100),
+           (Event.ACQ, 1, 0x100), (Event.READ, 1, 0x10),
+           (Event.WRITE_RANGE, 1, 0x20, 0x18), (Event.READ_RANGE, 0, 0x20, 0x10),
+           (Event.FORK, 1, 2), (Event.REA, 2, 0x100), (Event.REM, 1, 0x108),
+           (Event.WRITE, 2, 0x10), (Event.END, 2)]
+    buf = b''.join([Event.pack(*ev) for ev in evs])
+    assert(len(buf) == len(evs) * Event.size)
+    ft = FT(verbose=False, vc=self.VC)
+    ft.race = False
+    races = ft.process_batch(buf)
+    assert(len(races) == 2)     # Proc 0 reads the two words proc 1 wrote
+    ref = FT(verbose=False, vc=self.VC)
+    ref.race = False
+    for (op, tid, addr, size) in Event.unpack(buf):
+      if op in [Event.READ_RANGE, Event.WRITE_RANGE]:
+        ref.range(tid, addr, size, op - Event.READ_RANGE)
+      elif op == Event.END:
+        ref.end(tid)
+      else:
+        getattr(ref, Event.names[op])(tid, addr)
+    for rd in [ft, ref]:
+      rd.state = ([v.str(var, rd.pidmap.pids) for (var, v) in rd.vars.items()],
+                  [str(rd.procs[pid]) for pid in rd.procs],
+                  [str(rd.locks[lid]) for lid in rd.locks])
+    assert(ft.state == ref.state)
+    assert(ft.numOps == ref.numOps)
+
+  def test_shared_clocks(self):
+    ft = FT(verbose=False, vc=self.VC)
+    ft.fork(0, 1)
+    p = ft.procs[0]
+    vc = p.vc
+    ft.rel(0, 'l')
+    if not self.VC.inplace:          # Tree clocks are copied instead
+      assert(ft.locks['l'].vc is vc) # Shared, not copied
+      assert(p.vc.base is vc.base)   # inc made a new view over the same base
+    assert(ft.locks['l'].vc[0] == 2 and p.vc[0] == 3)
+    ft.acq(0, 'l')
+    assert(ft.acqSkipped == 1)     # proc 0 already knows the lock's clock
+    ft.acq(1, 'l')
+    assert(ft.acqSkipped == 1)
+    assert(ft.procs[1].vc[0] == 2)
+    ft.acq(1, 'l')
+    assert(ft.acqSkipped == 2)
+    ft.rel(1, 'm')
+    ft.rem(0, 'm')                 # Merges what proc 1 released
+    assert(ft.locks['m'].vc.vc == {0 : 3, 1 : 1})
+    ft.acq(0, 'm')
+    assert(ft.acqSkipped == 2 and ft.procs[0].vc[1] == 1)
+
+  def test_read_shrink(self):
+    ft = FT(verbose=False, vc=self.VC)
+    ft.write(0, 0x10)
+    for pid in range(1, 7):
+      ft.fork(0, pid)
+    for pid in range(1, 4):
+      ft.read(pid, 0x10)
+    assert(type(ft.vars[0x10].r) == tuple and len(ft.vars[0x10].r) == 3)
+    for pid in range(4, 7):
+      ft.read(pid, 0x10)
+    assert(isinstance(ft.vars[0x10].r, VC)) # More than SMALL_READS readers
+    # Every reader hands its clock to proc 1, whose read covers all others
+    for pid in range(2, 7):
+      ft.rel(pid, 'l')
+      ft.acq(1, 'l')
+    ft.rel(1, 'm')
+    ft.pruneCountdown = 1 # Read VCs are only pruned now and then
+    ft.read(1, 0x10)
+    assert(ft.vars[0x10].r == ft.procs[1].ep)
+    # A write resets read state to an epoch
+    ft.read(2, 0x10)
+    assert(type(ft.vars[0x10].r) == tuple)
+    ft.rel(2, 'l')
+    ft.acq(1, 'l')
+    ft.write(1, 0x10)
+    assert(ft.vars[0x10].r == 0)
+
+  def test_read_shrink_races(self):
+    ft = FT(verbose=False, vc=self.VC)
+    ft.race = False
+    ft.fork(0, 1)
+    ft.fork(0, 2)
+    ft.read(1, 0x10)
+    ft.read(2, 0x10)
+    ft.rel(1, 'l')
+    ft.acq(2, 'l')
+    ft.rel(2, 'm')
+    ft.read(2, 0x10) # Drops the read of proc 1, which is ordered before
+    assert(ft.vars[0x10].r == ft.procs[2].ep)
+    assert(isinstance(ft.write(0, 0x10), DataRace))
+
+  def test_free(self):
+    ft = FT(verbose=False, vc=self.VC)
+    ft.race = False
+    ft.fork(0,1)
+    ft.range(0, 0x1000, 0x100, 1)
+    ft.write(0, 0x1101)
+    ft.rel(0, 0x1010)
+    ft.rel(0, 0x2000)
+    ft.rel(0, 'l')
+    ft.free(0x1000, 0x101)  # Up to but excluding 0x1101
+    assert(list(ft.vars.keys()) == [0x1101])
+    assert(list(ft.locks.keys()) == [0x2000, 'l'])
+    # Reused memory starts out fresh, so no race is reported
+    assert(ft.write(1, 0x1000) == None)
+    assert(isinstance(ft.write(1, 0x1101), DataRace))
+
+  def test_cache(self):
+    ft = FT(verbose=False, vc=self.VC, stats_interval=None)
+    ft.race = False
+    ft.fork(0, 1)
+    ft.write(0, 0x10)
+    ft.read(0, 0x10)
+    ft.read(0, 0x10)
+    ft.write(0, 0x10)
+    assert(ft.cacheHits == {'read' : 1, 'write' : 1})
+    assert(ft.procs[0].reads == {0x10} and ft.procs[0].writes == {0x10})
+    # Races are checked, and counted, every time
+    assert(ft.read(1, 0x10) is ft.read(1, 0x10))
+    assert(ft.reporter.total == 2 and not ft.procs[1].reads)
+    # A write that clears the reads takes the read out of the cache
+    ft.read(1, 0x18)
+    ft.read(0, 0x18)
+    ft.rel(1, 'l')
+    ft.acq(0, 'l')
+    assert(0x18 in ft.procs[0].reads)
+    ft.write(0, 0x18)
+    assert(ft.vars[0x18].r == 0 and 0x18 not in ft.procs[0].reads)
+    ft.read(0, 0x18)
+    assert(ft.vars[0x18].r == ft.procs[0].ep)
+    # A new epoch, or a free, starts over
+    ft.rel(0, 'l')
+    assert(not ft.procs[0].reads and not ft.procs[0].writes)
+    ft.write(0, 0x20)
+    ft.free(0x20, 8)
+    assert(not ft.procs[0].writes)
+    ft.write(0, 0x20)
+    assert(0x20 in ft.vars)
+    # Bounded
+    ft = FT(verbose=False, vc=self.VC, stats_interval=None, cache_size=2)
+    for addr in range(0, 80, 8):
+      ft.read(0, addr)
+    assert(len(ft.procs[0].reads) == 2)
+
+  def test_cache_same_races(self):
+    '''Repeats hit the cache without changing any verdict'''
+    for seed in range(20):
+      ops = []
+      for op in randomOps(seed):
+        ops += [op, op] if op[0] in ['read', 'write'] else [op]
+      ref = FT(verbose=False, vc=self.VC, stats_interval=None, cache_size=0)
+      ft = FT(verbose=False, vc=self.VC, stats_interval=None)
+      ref.race = ft.race = False
+      for op in ops:
+        want = getattr(ref, op[0])(*op[1:])
+        got = getattr(ft, op[0])(*op[1:])
+        assert((want and want.drType) == (got and got.drType))
+      assert(ft.reporter.kinds == ref.reporter.kinds)
+      assert(sum(ft.cacheHits.values()) > 0 and ref.cacheHits == {'read' : 0, 'write' : 0})
+
+  def test_lock_known(self):
+    '''An acquire by a proc that knows the lock's clock joins nothing'''
+    ft = FT(verbose=False, vc=self.VC, stats_interval=None)
+    ft.fork(0, 1)
+    ft.acq(0, 'l') # Empty clock
+    assert(ft.acqSkipped == 1 and ft.locks['l'].known == None)
+    ft.rel(0, 'l')
+    assert(ft.locks['l'].known == {0})
+    ft.acq(1, 'l')
+    ft.acq(1, 'l')
+    assert(ft.acqSkipped == 2 and ft.locks['l'].known == {0, 1})
+    ft.rem(1, 'l')
+    assert(ft.locks['l'].known == {1})
+    ft.rem(0, 'l') # 0 does not know 1's release
+    assert(ft.locks['l'].known == set())
+    ft.acq(0, 'l')
+    assert(ft.acqSkipped == 2 and ft.locks['l'].known == {0})
+    assert(ft.procs[0].vc[1] == ft.locks['l'].vc[1])
+
+  def test_join(self):
+    ft = FT(verbose=False, vc=self.VC, stats_interval=None)
+    ft.race = False
+    ft.fork(0, 1, joiners=1)
+    ft.fork(0, 2)
+    ft.write(1, 'x')
+    ft.write(2, 'y')
+    final = ft.procs[1].vc
+    ft.end(1)
+    ft.end(2)
+    # Without gc, only clocks with joins announced are kept
+    assert(ft.finals.keys() == {1} and ft.joiners == {1 : 1} and ft.dead == {})
+    # Published without a copy, but for an inplace backend
+    assert((ft.finals[1] is final) != self.VC.inplace and ft.finals[1].vc == final.vc)
+    ft.join(0, 1)
+    assert(ft.procs[0].vc[1] == final[1])
+    assert(ft.finals == {} and ft.joiners == {})
+    assert(ft.read(0, 'x') == None)
+    assert(isinstance(ft.read(0, 'y'), DataRace))
+    with self.assertRaises(ValueError):
+      ft.join(0, 1) # Beyond the one join announced
+    with self.assertRaises(ValueError):
+      ft.join(0, 2) # None announced
+    with self.assertRaises(ValueError):
+      ft.join(0, 3) # Not ended
+
+  def test_join_uncounted(self):
+    '''With gc, procs forked without a number of joins, e.g. waited for by
+    a wait group, can be joined any number of times'''
+    ft = FT(verbose=False, vc=self.VC, stats_interval=None, gc_interval=100)
+    ft.race = False
+    ft.fork(0, 2)
+    ft.fork(0, 3)
+    ft.write(2, 'y')
+    ft.end(2)
+    assert(ft.finals.keys() == {2} and ft.dead.keys() == {2})
+    ft.join(0, 2)
+    ft.join(3, 2)
+    assert(ft.finals.keys() == {2})
+    assert(ft.read(0, 'y') == None and ft.read(3, 'y') == None)
+
+  def test_join_many(self):
+    '''A final clock is kept until the last expected join'''
+    ft = FT(verbose=False, vc=self.VC, stats_interval=None, gc_interval=1)
+    ft.race = False
+    ft.fork(0, 1)
+    ft.fork(0, 2)
+    ft.fork(0, 3, joiners=2)
+    ft.write(3, 'x')
+    ft.end(3)
+    ft.join(1, 3)
+    assert(3 in ft.finals)
+    ft.acq(1, 'l') # gc pass: 3 is not retired while 0 and 2 do not know it
+    assert(3 in ft.dead)
+    assert(ft.read(1, 'x') == None)
+    ft.join(2, 3)
+    assert(ft.finals == {} and ft.joiners == {})
+    assert(ft.read(2, 'x') == None)
+    assert(isinstance(ft.write(0, 'x'), DataRace))
+
+  def test_int_keys(self):
+    ft = FT(verbose=False, vc=self.VC)
+    ft.race = False
+    ft.fork(0,1)
+    ft.write(0, 0xc000010000)
+    ft.write(0, 0xc000010003) # Unaligned addresses are tracked separately
+    assert(0xc000010000 in ft.vars)
+    assert(0xc000010003 in ft.vars)
+    assert(len(ft.vars) == 2)
+    race = ft.read(1, 0xc000010000)
+    assert(isinstance(race, DataRace))
+    assert('var[0xc000010000]: 2@0 0@0' in race.message)
+
+  def test_packed_epochs(self):
+    ft = FT(verbose=False, vc=self.VC)
+    ft.fork(0,7)
+    p = ft.procs[7]
+    assert(p.ep == pack(1, ft.pidmap.slot(7)))
+    ft.write(7, 0x10)
+    ft.read(7, 0x10)
+    assert(ft.vars[0x10].w == p.ep)
+    assert(ft.vars[0x10].r == p.ep)
+    ft.rel(7, 'l')
+    assert(p.ep == pack(2, ft.pidmap.slot(7)))
+    ft.acq(0, 'l')
+    ft.read(0, 0x10)
+    assert(ft.vars[0x10].r == ft.procs[0].ep) # Read exclusive
+    ft.fork(0,8)
+    ft.read(8, 0x10)
+    ft.read(7, 0x10)
+    assert(ft.vars[0x10].r == (pack(1, ft.pidmap.slot(8)), pack(2, ft.pidmap.slot(7)))) # Read share
+
+
+def raceLines(ft, ops):
+  '''First line of every race report: access, pid and address'''
+  ft.race = False
+  ret = []
+  for op in ops:
+    race = getattr(ft, op[0])(*op[1:])
+    if isinstance(race, DataRace):
+      ret.append(race.message.split('\n')[0])
+  return ret
+
+
+class Unpublished(TreeClock):
+  '''A clock that checks that no proc, lock or final holds it when
+  entries are dropped from it'''
+  __slots__ = ()
+  ft = None
+
+  def drop(self, pids):
+    ft = Unpublished.ft
+    assert(all([obj.vc is not self for obj in list(ft.procs.values()) + list(ft.locks.values())]))
+    assert(all([vc is not self for vc in ft.finals.values()]))
+    return TreeClock.drop(self, pids)
+
+
+class TestGC(unittest.TestCase):
+
+  def test_retire(self):
+    ft = FT(verbose=False, stats_interval=None, gc_interval=1)
+    ft.fork(0,1)
+    ft.write(1, 0x10)
+    ft.rel(1, 'c')
+    ft.end(1)
+    assert(ft.dead == {1 : 1})
+    ft.acq(0, 'c')  # Proc 0 learns everything proc 1 did, gc kicks in
+    assert(ft.dead == {})
+    assert(ft.retired == set([ft.pidmap.slot(1)]))
+    assert(1 not in ft.procs[0].vc.vc)
+    assert(1 not in ft.locks['c'].vc.vc)
+    assert(ft.write(0, 0x10) == None)
+    assert(ft.gcStats == {'passes' : 1, 'retired' : 1, 'dropped' : 2})
+
+  def test_drop_unpublished(self):
+    '''Entries are dropped from a copy before it replaces a clock, so
+    that readers without locks never see a clock half dropped'''
+    ft = FT(verbose=False, stats_interval=None, gc_interval=1, vc=Unpublished)
+    Unpublished.ft = ft
+    ft.fork(0, 1)
+    ft.fork(0, 2, joiners=1)
+    ft.write(1, 0x10)
+    ft.rel(1, 'c')
+    ft.end(1)
+    ft.end(2)
+    ft.acq(0, 'c')
+    assert(ft.gcStats['retired'] == 2 and ft.gcStats['dropped'] == 3)
+
+  def test_join_retired(self):
+    '''The final clock of a proc forked without a number of joins is kept
+    until every proc knows it; later joins have nothing to add'''
+    ft = FT(verbose=False, stats_interval=None, gc_interval=1)
+    ft.race = False
+    ft.fork(0, 1)
+    ft.fork(0, 2)
+    ft.rel(2, 'k')
+    ft.end(2)
+    ft.acq(1, 'k')
+    ft.write(1, 'x')
+    ft.rel(1, 'm')
+    ft.end(1)
+    ft.acq(0, 'm') # 0 knows all that 1 and 2 did
+    assert(ft.dead == {} and ft.finals == {})
+    ft.join(0, 1)
+    ft.join(0, 2)
+    assert(ft.write(0, 'x') == None)
+    ft.fork(0, 3)
+    ft.fork(0, 4)
+    ft.write(4, 'y')
+    ft.rel(4, 'j')
+    ft.acq(3, 'j')
+    ft.end(3)
+    ft.acq(0, 'n') # 3 is retired, but 0 does not know what 3 learned
+    assert(ft.pidmap.slot(3) in ft.retired and 3 in ft.finals)
+    ft.join(0, 3)
+    assert(ft.write(0, 'y') == None)
+    ft.gc()
+    assert(ft.finals == {})
+    ft.join(0, 3)
+
+  def test_no_retire_while_unknown(self):
+    ft = FT(verbose=False, stats_interval=None, gc_interval=1)
+    ft.race = False
+    ft.fork(0,1)
+    ft.fork(0,2)
+    ft.write(1, 0x10)
+    ft.rel(1, 'c')
+    ft.write(1, 0x18)   # After the release, nobody can learn about this
+    ft.end(1)
+    assert(ft.dead == {1 : 2})
+    ft.acq(0, 'c')
+    assert(ft.dead == {1 : 2})
+    assert(isinstance(ft.write(2, 0x10), DataRace))
+    assert(isinstance(ft.write(0, 0x18), DataRace))
+
+  def test_same_races(self):
+    for seed in range(40):
+      ops = randomOps(seed)
+      for vc in [VC, TreeClock]:
+        ref = raceLines(FT(verbose=False, stats_interval=None, vc=vc), ops)
+        got = raceLines(FT(verbose=False, stats_interval=None, vc=vc, gc_interval=1), ops)
+        assert(ref == got)
+
+  def test_sortnp(self):
+    ft = sortnp.run(FT(verbose=False, stats_interval=None), sortnp.events(400, N=20))
+    gc = sortnp.run(FT(verbose=False, stats_interval=None, gc_threshold=4), sortnp.events(400, N=20))
+    assert(len(gc.dead) < 4)
+    assert(gc.gcStats['dropped'] > 0)
+    assert(Stats.getNumVcEntries(gc, 'locks') < Stats.getNumVcEntries(ft, 'locks'))
+
+
+class TestRaces(unittest.TestCase):
+
+  def racy(self, vc=VC):
+    ft = FT(verbose=False, stats_interval=None, vc=vc)
+    ft.race = False
+    ft.fork(0,1)
+    ft.write(0, 0x10)
+    ft.read(0, 0x18)
+    return ft
+
+  def test_kinds(self):
+    ft = self.racy()
+    assert(ft.read(1, 0x10).drType == 'wr')
+    assert(ft.write(1, 0x10).drType == 'ww')
+    race = ft.write(1, 0x18)
+    assert(race.drType == 'rw')
+    assert((race.addr, race.pid, race.other) == (0x18, 1, 0))
+
+  def test_dedup(self):
+    ft = self.racy()
+    first = ft.read(1, 0x10)
+    for i in range(10):
+      assert(ft.read(1, 0x10) is first)
+    assert(first.count == 11)
+    ft.write(1, 0x18)
+    summary = ft.reporter.summary()
+    assert(summary['total'] == 12 and summary['unique'] == 2)
+    assert((summary['wr'], summary['rw'], summary['ww']) == (11, 1, 0))
+    assert(ft.reporter.top(1) == [first])
+    assert(ft.reporter.unique('rw')[0].addr == 0x18)
+
+  def test_lazy(self):
+    ft = self.racy()
+    race = ft.read(1, 0x10)
+    assert(callable(race.text))
+    ft.write(0, 0x10) # The message is that of the time of the race
+    assert(race.message.split('\n') == ['FT: (ERR) Data race on read 1 0x10',
+        '  proc[1]: {1: 1, 0: 1}', '  var[0x10]: 2@0 0@0'])
+    assert(not callable(race.text))
+    clone = pickle.loads(pickle.dumps(race))
+    assert(clone.message == race.message and clone.key() == race.key())
+    # Also when the proc's clock has since been updated in place
+    for vc in [VC, TreeClock]:
+      ft = self.racy(vc)
+      race = ft.read(1, 0x10)
+      vc1 = ft.procs[1].vc
+      ft.release(0, 'l')
+      ft.acq(1, 'l')
+      assert((ft.procs[1].vc is vc1) == vc.inplace and ft.procs[1].vc[0] == 2)
+      assert(race.message.split('\n')[1] == '  proc[1]: %s' % VC(Epoch(1, 1), Epoch(1, 0)))
+
+  def test_rate(self):
+    reporter = RaceReporter(rate=0, burst=2)
+    out = io.StringIO()
+    with contextlib.redirect_stdout(out):
+      for addr in range(5):
+        reporter.add(DataRace(lambda: 'race', 'ww', addr, 1, 0))
+    assert(out.getvalue() == 'race\nrace\n')
+    assert(reporter.printed == 2 and reporter.suppressed == 3)
+    assert(reporter.summary()['unique'] == 5)
+
+  def test_collect(self):
+    reporter = RaceReporter()
+    race = DataRace('race', 'wr', 0x10, 1, 0)
+    race.count = 3
+    reporter.collect(race, False)
+    reporter.collect(DataRace('race', 'wr', 0x10, 1, 0), False)
+    assert(reporter.summary()['total'] == 4 and reporter.top()[0].count == 4)
+
+
+class TestFTTree(TestFT):
+  VC = TreeClock
+
+  def run_ops(self, ft):
+    ft.fork(0,1)
+    ft.fork(0,2)
+    ft.acq(0,'l')
+    ft.write(0, 'z')
+    ft.rel(0,'l')
+    ft.write(1, 'x')
+    ft.acq(2,'l')
+    ft.write(2, 'z')
+    ft.rem(2,'l')
+    ft.read(1, 'z')
+    ft.rea(1,'l')
+    ft.read(0, 'z')
+    ft.read(2, 'z')
+    ft.write(1, 'z')
+    return ft
+
+  def test_same_as_dict(self):
+    ft = self.run_ops(FT(verbose=False))
+    tree = self.run_ops(FT(verbose=False, vc=self.VC))
+    assert(Stats.getNumVcEntries(ft, 'procs') == Stats.getNumVcEntries(tree, 'procs'))
+    for pid in ft.procs.keys():
+      assert(ft.procs[pid].vc.vc == tree.procs[pid].vc.vc)
+    for lid in ft.locks.keys():
+      assert(ft.locks[lid].vc.vc == tree.locks[lid].vc.vc)
+
+
 
 class TestStats(unittest.TestCase):
 
@@ -276,6 +831,126 @@ class TestStats(unittest.TestCase):
     assert(Stats.getNumVcEntries(ft, 'procs') == 6)
 
 
+  def test_stats_interval(self):
+    ft = FT(verbose=False, stats_interval=4)
+    out = io.StringIO()
+    with contextlib.redirect_stdout(out):
+      ft.fork(0,1)
+      ft.write(0, 'x')
+      ft.rel(0, 'l')
+      ft.acq(1, 'l')
+      ft.read(1, 'x') # 4th op
+      ft.end(1)
+      for i in range(4):
+        ft.write(0, 'y')
+    lines = out.getvalue().splitlines()
+    assert(ft.numOps['write'] == 5)
+    assert(ft.getTotalOps() == 8)
+    assert(lines == [
+        "FT, ops=4, procs=2/2, locks=1, VC procs=3/3, VC locks=1/1",
+        "FT, ops=8, procs=1/2, locks=1, VC procs=1/1, VC locks=1/1",
+        "FT, ops=8, cache, rd hits=0, wr hits=2, rd rate=0.0000, wr rate=0.4000"])
+
+  def checkCensus(self, ft):
+    for where in ['procs', 'locks']:
+      census = ft.census[where]
+      clocks = Stats.getVcEntries(ft, where)
+      hist = {}
+      for vc in clocks.values():
+        hist[len(vc.vc)] = hist.get(len(vc.vc), 0) + 1
+      assert(census.hist == hist)
+      pids = {}
+      for vc in clocks.values():
+        for pid in vc.vc:
+          pids[pid] = pids.get(pid, 0) + 1
+      assert(census.pids == pids)
+      assert(census.total == Stats.countVcEntries(clocks))
+      assert(census.total - census.dead == \
+          Stats.countVcEntries(Stats.getVcEntries(ft, where, live=True)))
+
+  def test_census(self):
+    for seed in range(20):
+      ops = randomOps(seed)
+      for vc in [VC, TreeClock]:
+        for gc in [None, 1]:
+          ft = FT(verbose=False, stats_interval=1 << 30, vc=vc, gc_interval=gc)
+          ft.race = False
+          for (i, op) in enumerate(ops):
+            getattr(ft, op[0])(*op[1:])
+            if i % 50 == 49:
+              ft.free(0, 16)
+            self.checkCensus(ft)
+
+  def test_census_views(self):
+    '''Clocks shared as views are counted without building their dicts'''
+    ft = FT(verbose=False, stats_interval=1 << 30)
+    ft.fork(0, 1)
+    ft.rel(1, 'l')
+    vc = VCView.vc
+    VCView.vc = property(lambda view: self.fail('materialised'))
+    try:
+      for i in range(3):
+        ft.acq(0, 'l')
+        ft.rel(0, 'l')
+        ft.acq(1, 'l')
+        ft.rel(1, 'l')
+    finally:
+      VCView.vc = vc
+    self.checkCensus(ft)
+
+  def test_read_stats(self):
+    for seed in range(20):
+      ft = FT(verbose=False, stats_interval=None)
+      ft.race = False
+      for (i, op) in enumerate(randomOps(seed, 600)):
+        if op[0] in ['read', 'write']:
+          op = (op[0], op[1], op[2] % 16)
+        getattr(ft, op[0])(*op[1:])
+        if i % 100 == 99:
+          ft.free(0, 8)
+      small = [v.r for v in ft.vars.values() if type(v.r) == tuple]
+      vcs = [v.r for v in ft.vars.values() if isinstance(v.r, VC)]
+      assert(ft.readStats['small'] == len(small))
+      assert(ft.readStats['vcs'] == len(vcs))
+      assert(ft.readStats['entries'] == sum([len(r) for r in small] + [len(r.vc) for r in vcs]))
+      assert(ft.readStats['small_entries'] == sum([len(r) for r in small]))
+
+  def test_cache_stats(self):
+    with tempfile.TemporaryDirectory() as tmp:
+      fname = os.path.join(tmp, 'stats.out')
+      sink = statsink.sink(fname)
+      ft = sortnp.run(FT(stats_interval=1000, stats_sink=sink), sortnp.events(100, N=10))
+      sink.close()
+      recs = [rec for (_, rec) in statsink.read(fname)]
+    rec = recs[-1]
+    assert(0 < rec['cache_rd_hits'] <= ft.cacheHits['read'])
+    assert(0 < rec['cache_wr_hits'] <= ft.cacheHits['write'])
+    assert(0 < rec['cache_rd_rate'] < 1 and 0 < rec['cache_wr_rate'] < 1)
+    rec = FT(stats_interval=1, cache_size=0, stats_sink=statsink.sink(os.devnull))
+    rec.write(0, 'x')
+    assert('cache_rd_hits' not in rec.sink.rows[-1][1])
+
+  def test_stats_hist(self):
+    ft = FT(verbose=False, stats_interval=2, stats_hist=True)
+    out = io.StringIO()
+    with contextlib.redirect_stdout(out):
+      ft.fork(0,1)
+      ft.rel(0, 'l')
+      ft.acq(1, 'l')
+    assert(out.getvalue().splitlines() == [
+        "FT, ops=2, procs=2/2, locks=1, VC procs=3/3, VC locks=1/1",
+        "FT, ops=2, sizes, procs= {1: 1, 2: 1}",
+        "FT, ops=2, sizes, locks= {1: 1}"])
+
+  def test_stats_off(self):
+    ft = FT(verbose=False, stats_interval=None)
+    out = io.StringIO()
+    with contextlib.redirect_stdout(out):
+      for i in range(10):
+        ft.write(0, 'x')
+    assert(out.getvalue() == '')
+    assert(ft.numOps['write'] == 10)
+
   def est_stats(self):
     ft = FT(verbose=False, stats_interval=1)
     ft.fork(0,1)
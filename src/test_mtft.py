@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+
+'''
+@author:    Daniel S. Fava
+@email:     danielsf@ifi.uio.no
+@contact:   www.danielfava.com
+@copyright: CC BY 4.0, https://creativecommons.org/licenses/by/4.0/
+@date:      April 2020
+
+See https://github.com/dfava/paper.go.mm.drd
+'''
+
+import io
+import os
+import sys
+import unittest
+import contextlib
+
+import synth
+import statsink
+from ft import *
+from mtft import *
+from treeclock import TreeClock
+from testutil import serial, state, racy
+
+
+def threaded(rd, ops, ordered=False):
+  rd.race = False
+  return run(rd, ops, ordered)
+
+
+class TestMTFT(unittest.TestCase):
+
+  def setUp(self):
+    self.interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6) # Switch threads as often as possible
+
+  def tearDown(self):
+    sys.setswitchinterval(self.interval)
+
+  def test_ordered(self):
+    '''Same order, many threads: same state and race reports'''
+    for kwargs in [{}, {'gc_interval' : 3}, {'vc' : TreeClock}]:
+      ops = racy(0)
+      ref = serial(FT(stats_interval=None, **kwargs), ops)
+      ft = threaded(MTFT(stats_interval=None, **kwargs), ops, ordered=True)
+      assert(state(ft, ops=False) == state(ref, ops=False))
+      assert(ft.reporter.summary() == ref.reporter.summary())
+      assert([race.message[2:] for race in ft.reporter.unique()] == \
+             [race.message for race in ref.reporter.unique()]) # 'MTFT: ...'
+
+  def test_race_free(self):
+    '''Race-free workloads stay race free in any interleaving'''
+    for params in [{}, {'sharing' : 0.5, 'locks' : 2}, {'procs' : 16, 'depth' : 3}]:
+      ops = list(synth.events(steps=5000, footprint=1 << 14, **params))
+      ref = serial(FT(stats_interval=None), ops)
+      for kwargs in [{}, {'gc_interval' : 1}]:
+        ft = threaded(MTFT(stats_interval=None, **kwargs), ops)
+        assert(ft.reporter.total == 0)
+        assert(len(ft.vars) == len(ref.vars))
+        assert(list(ft.vars.keys()) == list(ref.vars.keys()))
+
+  def test_stress(self):
+    '''In any interleaving, the words written before any sync race'''
+    for seed in range(4):
+      ops = racy(seed)
+      ref = serial(FT(stats_interval=None), ops)
+      for i in range(3):
+        ft = threaded(MTFT(stats_interval=None, gc_interval=2), ops)
+        got = set([race.addr for race in ft.reporter.unique() if race.addr < 0x200000])
+        want = set([race.addr for race in ref.reporter.unique() if race.addr < 0x200000])
+        assert(got == want)
+        assert(len(ft.vars) == len(ref.vars))
+        assert(ft.procs.keys() == ref.procs.keys() and ft.finals == {})
+
+  def test_census(self):
+    '''Clock sizes are exact under concurrency'''
+    ops = list(synth.events(steps=5000, footprint=1 << 14, sharing=0.5))
+    out = io.StringIO()
+    with contextlib.redirect_stdout(out):
+      ft = threaded(MTFT(stats_interval=500, stats_sink=statsink.sink(os.devnull)), ops)
+    for (kind, dct) in [('procs', ft.procs), ('locks', ft.locks)]:
+      sizes = [len(obj.vc.vc) for obj in dct.values()]
+      assert(ft.census[kind].total == sum(sizes))
+      assert(sum(ft.census[kind].hist.values()) == len(sizes))
+
+  def test_range(self):
+    '''Ranges, aligned or not, over one page, several, or more pages than
+    stripes, verbose or not, find the races FT finds, without deadlock'''
+    page = 1 << PAGE_BITS
+    cases = [(0x1000, 0x10), (0x1004, 0x10), (2 * page - 8, 0x20), \
+             (2 * page + 4, 3 * page), (page, (NSTRIPES + 2) * page)]
+    for (addr, length) in cases:
+      for verbose in [False, True]:
+        got = []
+        ops = [('fork', 0, 1), ('range', 1, addr, length, 1), ('range', 0, addr, length, 0)]
+        out = io.StringIO()
+        with contextlib.redirect_stdout(out):
+          ref = serial(FT(stats_interval=None, verbose=verbose), ops)
+          ft = MTFT(stats_interval=None, verbose=verbose)
+          ft.race = False
+          thread = threading.Thread(target=lambda: got.extend([getattr(ft, op[0])(*op[1:]) for op in ops]), daemon=True)
+          thread.start()
+          thread.join(10)
+        assert(not thread.is_alive()) # Deadlocked
+        assert(len(got[2]) == (length + 7) // 8)
+        assert([race.addr for race in ft.reporter.unique()] == \
+               [race.addr for race in ref.reporter.unique()])
+        assert(state(ft, ops=False) == state(ref, ops=False))
+
+  def test_stats(self):
+    '''stats() is called even if concurrent ops race past 0'''
+    sink = statsink.sink(os.devnull)
+    ft = MTFT(stats_interval=5, stats_sink=sink)
+    ft.countdown = -3
+    assert(ft.countdown == 0)
+    ft.write(0, 0x10)
+    assert(ft.countdown == 5 and len(sink.rows) == 1)
+    assert(MTFT(stats_interval=None).countdown < 0)
+
+
+def main(argv):
+  unittest.main()
+
+if __name__ == "__main__":
+  sys.exit(main(sys.argv))
@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+
+'''
+@author:    Daniel S. Fava
+@email:     danielsf@ifi.uio.no
+@contact:   www.danielfava.com
+@copyright: CC BY 4.0, https://creativecommons.org/licenses/by/4.0/
+@date:      April 2020
+
+See https://github.com/dfava/paper.go.mm.drd
+'''
+
+import os
+import sys
+import time
+import zlib
+import tempfile
+import unittest
+import threading
+
+import sortnp
+from ft import *
+from rdtrace import *
+from testutil import state, racy
+
+try:
+  import numpy
+except ImportError:
+  numpy = None
+
+
+def racyTrace():
+  '''racy(), after writes by proc 0 that a replay may start past'''
+  return [('write', 0, 8 * i) for i in range(64)] + racy(0, steps=300)
+
+
+class TestTrace(unittest.TestCase):
+  def setUp(self):
+    self.dir = tempfile.TemporaryDirectory()
+    self.fname = os.path.join(self.dir.name, 'trace.rdt')
+
+  def tearDown(self):
+    self.dir.cleanup()
+
+  def record(self, compress, evs):
+    rec = Recorder(self.fname, compress=compress, bufsize=100)
+    sortnp.run(rec, evs)
+    rec.close()
+    return rec
+
+  def test_roundtrip(self):
+    evs = list(sortnp.events(200, N=20))
+    evs.append(('range', 3, 0x1000, 0x40, 1))
+    for compress in [True, False]:
+      rec = self.record(compress, evs)
+      assert(rec.nevents == len(evs))
+      with Trace(self.fname) as trace:
+        assert(trace.compressed == compress)
+        got = list(trace.events())
+      assert(len(got) == len(evs))
+      assert(got[0] == (Event.WRITE, 0, sortnp.SLICE_BASE, 0))
+      assert(got[-1] == (Event.WRITE_RANGE, 3, 0x1000, 0x40))
+
+  def test_replay(self):
+    evs = list(sortnp.events(200, N=20, fix=True))
+    ref = sortnp.run(FT(stats_interval=None), evs)
+    for compress in [True, False]:
+      self.record(compress, evs)
+      ft = FT(stats_interval=None)
+      (count, races) = replay(self.fname, ft, nevents=64)
+      assert(count == len(evs))
+      assert(races == [])
+      assert(state(ft) == state(ref))
+
+  def test_join(self):
+    evs = [('fork', 0, 1, 1), ('write', 1, 0x10), ('end', 1), ('join', 0, 1), ('write', 0, 0x10)]
+    rec = Recorder(self.fname, rd=FT(stats_interval=None))
+    for ev in evs:
+      assert(getattr(rec, ev[0])(*ev[1:]) == None)
+    rec.close()
+    with Trace(self.fname) as trace:
+      got = list(trace.events())
+    assert(got[0] == (Event.FORK, 0, 1, 1) and got[3] == (Event.JOIN, 0, 1, 0))
+    (count, races) = replay(self.fname, FT(stats_interval=None))
+    assert(count == 5 and races == [])
+
+  def test_tee(self):
+    evs = [('fork', 0, 1), ('write', 0, 0x10), ('write', 1, 0x10)]
+    ft = FT(stats_interval=None)
+    ft.race = False
+    rec = Recorder(self.fname, rd=ft)
+    rets = [getattr(rec, ev[0])(*ev[1:]) for ev in evs]
+    rec.close()
+    assert(isinstance(rets[2], DataRace))
+    (count, races) = replay(self.fname, FT(stats_interval=None))
+    assert(count == 3 and len(races) == 1)
+
+  def test_sharded(self):
+    evs = [('fork', 0, 1), ('fork', 0, 2)]
+    for i in range(64):
+      evs.append(('write', i % 3, 0x10000 + i * 0x400))
+      evs.append(('read', (i + 1) % 3, 0x10000 + i * 0x400))
+    evs += [('range', 1, 0x10ff8, 0x3010, 1), ('rel', 1, 0x8),
+            ('acq', 2, 0x8), ('range', 2, 0x11000, 0x2000, 0), ('end', 1)]
+    self.record(True, evs)
+    ft = FT(stats_interval=None)
+    ft.race = False
+    (count, ref) = replay(self.fname, ft)
+    assert(len(ref) > 64)
+    for nshards in [2, 3]:
+      (count, races) = replaySharded(self.fname, 'ft:FT', nshards, bits=10)
+      assert(count == len(evs))
+      assert([race.message for race in races] == [race.message for race in ref])
+
+  @unittest.skipIf(numpy == None, 'needs numpy')
+  def test_shard_events(self):
+    '''Partitioning a batch in bulk keeps the same records'''
+    batch = b''.join([Event.pack(Event.FORK, 0, 1), Event.pack(Event.ACQ, 1, 0x8)] + \
+        [Event.pack(op, 1, 0x10000 + i * 0x3f8, size) for i in range(32) \
+         for (op, size) in [(Event.READ, 0), (Event.WRITE_RANGE, 0x10), (Event.READ_RANGE, 0x1800), \
+                            (Event.WRITE_RANGE, 0)]])
+    for (nshards, bits) in [(1, 10), (2, 10), (3, 12)]:
+      for shard in range(nshards):
+        want = list(shardEvents(batch, 5, shard, nshards, bits))
+        assert(list(shardEvents(batch, 5, shard, nshards, bits, numpy)) == want)
+        assert(len(want) > 2 and want[0] == (5, (Event.FORK, 0, 1, 0)))
+
+  def test_pipeline(self):
+    '''The same races and state as a serial replay, whatever the depth'''
+    evs = racyTrace()
+    for compress in [True, False]:
+      self.record(compress, evs)
+      for (depth, start) in [(1, 0), (3, 0), (2, 40)]:
+        (ref, ft) = (FT(stats_interval=None), FT(stats_interval=None))
+        ref.race = ft.race = False
+        (_, want) = replay(self.fname, ref, nevents=32, start=start)
+        stalls = {}
+        (count, races) = replay(self.fname, ft, nevents=32, start=start, pipeline=depth, stalls=stalls)
+        assert(count == len(evs) and want)
+        assert([race.message for race in races] == [race.message for race in want])
+        assert(state(ft) == state(ref))
+        assert(set(stalls) == set(['producer', 'consumer']))
+
+  def test_backpressure(self):
+    '''The producer stays depth batches ahead of a stopped consumer'''
+    self.record(False, racyTrace())
+    with Trace(self.fname) as trace:
+      pipe = Pipeline(trace, nevents=16, depth=2)
+      batches = iter(pipe)
+      first = bytes(next(batches))
+      while pipe.free.qsize():
+        time.sleep(0.001)
+      assert(pipe.full.qsize() == 1 and pipe.thread.is_alive())
+      batches.close()
+      assert(not pipe.thread.is_alive())
+      assert(first == trace.mm[HEADER.size:HEADER.size+16*Event.size])
+
+  def test_pipe(self):
+    '''A trace read from a pipe'''
+    evs = racyTrace()
+    for compress in [True, False]:
+      self.record(compress, evs)
+      with open(self.fname, 'rb') as fhandle:
+        data = fhandle.read()
+      ref = FT(stats_interval=None)
+      ref.race = False
+      (_, want) = replay(self.fname, ref)
+      for depth in [0, 2]:
+        (rfd, wfd) = os.pipe()
+        writer = threading.Thread(target=lambda: (os.write(wfd, data), os.close(wfd)))
+        writer.start()
+        ft = FT(stats_interval=None)
+        ft.race = False
+        (count, races) = replay('/dev/fd/%d' % rfd, ft, nevents=50, pipeline=depth)
+        writer.join()
+        os.close(rfd)
+        assert(count == len(evs) and len(races) == len(want))
+        assert(state(ft) == state(ref))
+
+  def test_pipeline_error(self):
+    '''Errors of the producer are raised in the consumer'''
+    self.record(True, racyTrace())
+    with open(self.fname, 'r+b') as fhandle:
+      fhandle.seek(HEADER.size + 100)
+      fhandle.write(b'\xff' * 64)
+    with self.assertRaises(zlib.error):
+      replay(self.fname, FT(stats_interval=None), nevents=16, pipeline=2)
+
+  def test_detector(self):
+    assert(isinstance(detector('ft:FT'), FT))
+
+
+def main(argv):
+  unittest.main()
+
+if __name__ == "__main__":
+  sys.exit(main(sys.argv))
@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+
+'''
+@author:    Daniel S. Fava
+@email:     danielsf@ifi.uio.no
+@contact:   www.danielfava.com
+@copyright: CC BY 4.0, https://creativecommons.org/licenses/by/4.0/
+@date:      April 2020
+
+See https://github.com/dfava/paper.go.mm.drd
+'''
+
+import io
+import os
+import sys
+import tempfile
+import unittest
+
+import statsink
+from ft import *
+from sampler import *
+from testutil import serial, racy
+
+
+class TestSampler(unittest.TestCase):
+
+  def test_addr(self):
+    smp = AddrSampler(0.25)
+    picked = [addr for addr in range(0, 8 * 10000, 8) if smp.sample(0, addr)]
+    assert(2000 < len(picked) < 3000)
+    assert(smp.seen == 10000 and smp.checked == len(picked))
+    # The same addresses every time, for every pid
+    assert(all([smp.sample(1, addr) for addr in picked]))
+    assert(smp.sample(0, 'x'))
+    # Whole pages with bits=12
+    smp = AddrSampler(0.5, bits=12)
+    for page in range(0, 1 << 20, 1 << 12):
+      assert(len(set([smp.sample(0, page + off) for off in range(0, 1 << 12, 512)])) == 1)
+
+  def test_window(self):
+    smp = WindowSampler(0.5, size=10)
+    picks = [smp.sample(0, addr) for addr in range(1000)]
+    for w in range(100):
+      assert(len(set(picks[10 * w : 10 * w + 10])) == 1)
+    assert(smp.windows == 100)
+    assert(sum(picks) == 10 * smp.sampled == smp.checked)
+    assert(20 < smp.sampled < 80)
+
+  def test_spec(self):
+    assert(sampler(None) == None)
+    assert(type(sampler('addr:0.5')) == AddrSampler)
+    assert(sampler('addr:0.5:12').bits == 12)
+    assert(sampler('window:0.1:100').size == 100)
+    self.assertRaises(TypeError, Sampler, 0.5) # Abstract
+
+
+class TestSampledFT(unittest.TestCase):
+
+  def test_sync(self):
+    '''Sync ops are processed whether or not accesses are sampled'''
+    ops = racy(0)
+    full = serial(FT(stats_interval=None), ops)
+    for smp in [AddrSampler(0.1), WindowSampler(0.1, size=50)]:
+      ft = serial(FT(stats_interval=None, sampler=smp), ops)
+      assert([str(p) for p in ft.procs.values()] == [str(p) for p in full.procs.values()])
+      assert([str(l) for l in ft.locks.values()] == [str(l) for l in full.locks.values()])
+      assert(smp.checked < smp.seen)
+
+  def test_addr_races(self):
+    '''Every race on a sampled address is found, and no other'''
+    ops = racy(1)
+    full = serial(FT(stats_interval=None), ops)
+    smp = AddrSampler(0.3)
+    ft = serial(FT(stats_interval=None, sampler=smp), ops)
+    keep = AddrSampler(0.3)
+    want = [race.key() for race in full.reporter.unique() if keep.sample(0, race.addr)]
+    assert(want and len(want) < len(full.reporter.races))
+    assert([race.key() for race in ft.reporter.unique()] == want)
+    assert(len(ft.vars) < len(full.vars))
+
+  def test_range(self):
+    '''Ranges are sampled word by word, as separate accesses would be'''
+    for addr in [0x1000, 0x1004]: # Aligned, and checked a word at a time
+      races = []
+      for words in [False, True]:
+        smp = AddrSampler(0.5)
+        ft = FT(stats_interval=None, sampler=smp)
+        ft.race = False
+        ft.fork(0, 1)
+        for pid in [0, 1]:
+          if words:
+            for v in range(addr, addr + 0x400, 8):
+              ft.write(pid, v)
+          else:
+            ft.range(pid, addr, 0x400, 1)
+        assert(smp.seen == 2 * 0x80 and 0 < smp.checked < smp.seen)
+        assert(ft.numOps['write'] == smp.checked) # Each word sampled once
+        races.append(sorted([race.addr for race in ft.reporter.unique()]))
+      assert(races[0] == races[1] and len(races[0]) == smp.checked // 2)
+
+  def test_window_races(self):
+    ops = racy(2)
+    full = serial(FT(stats_interval=None), ops)
+    ft = serial(FT(stats_interval=None, sampler=WindowSampler(1.0, size=7)), ops)
+    assert(ft.reporter.summary() == full.reporter.summary())
+    ft = serial(FT(stats_interval=None, sampler=WindowSampler(0.2, size=100)), ops)
+    assert(0 < len(ft.reporter.races) < len(full.reporter.races))
+
+  def test_stats(self):
+    with tempfile.TemporaryDirectory() as tmp:
+      fname = os.path.join(tmp, 'stats.out')
+      sink = statsink.sink(fname)
+      ft = serial(FT(stats_interval=100, stats_sink=sink, sampler=AddrSampler(0.5)), racy(3))
+      sink.close()
+      recs = [rec for (_, rec) in statsink.read(fname)]
+    assert(recs)
+    rec = recs[-1]
+    assert(rec['smp_seen'] > rec['smp_checked'] > 0)
+    assert(abs(rec['smp_rate'] - rec['smp_checked'] / rec['smp_seen']) < 1e-4)
+    assert(rec['smp_coverage'] == 0.5)
+    assert(0 < rec['smp_races'] <= len(ft.reporter.races))
+
+  def test_env(self):
+    os.environ['FT_SAMPLE'] = 'window:0.5:10'
+    try:
+      ft = FT(stats_interval=None)
+    finally:
+      del(os.environ['FT_SAMPLE'])
+    assert(type(ft.sampler) == WindowSampler)
+    assert(FT(stats_interval=None).sampler == None)
+
+
+def main(argv):
+  unittest.main()
+
+if __name__ == "__main__":
+  sys.exit(main(sys.argv))
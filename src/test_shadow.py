@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+
+'''
+@author:    Daniel S. Fava
+@email:     danielsf@ifi.uio.no
+@contact:   www.danielfava.com
+@copyright: CC BY 4.0, https://creativecommons.org/licenses/by/4.0/
+@date:      April 2020
+
+See https://github.com/dfava/paper.go.mm.drd
+'''
+
+import sys
+from shadow import *
+import unittest
+
+class TestShadow(unittest.TestCase):
+  def test_empty(self):
+    sh = Shadow()
+    assert(len(sh) == 0)
+    assert(sh.get(0x1000) == None)
+    assert(0x1000 not in sh)
+    assert(list(sh.keys()) == [])
+
+  def test_set_get(self):
+    sh = Shadow()
+    sh[0x1000] = 'a'
+    sh[0x1008] = 'b'
+    sh[0x1000] = 'c'
+    assert(len(sh) == 2)
+    assert(sh[0x1000] == 'c')
+    assert(sh.get(0x1008) == 'b')
+    assert(sh.get(0x1010) == None)
+    assert(len(sh.pages) == 1)
+
+  def test_unaligned_and_names(self):
+    sh = Shadow()
+    sh[0x1001] = 'a'
+    sh['x'] = 'b'
+    assert(len(sh) == 2)
+    assert(sh[0x1001] == 'a')
+    assert(sh['x'] == 'b')
+    assert(sh.get(0x1000) == None)
+    assert(len(sh.pages) == 0)
+
+  def test_keys_sorted(self):
+    sh = Shadow()
+    addrs = [0x5000, 0x1008, 0x1000, 0xc000000000]
+    for a in addrs:
+      sh[a] = a
+    sh['z'] = 'z'
+    assert(list(sh.keys()) == sorted(addrs) + ['z'])
+    assert(list(sh.values()) == sorted(addrs) + ['z'])
+
+  def test_span(self):
+    sh = Shadow()
+    sh[0x1ff8] = 'old'
+    spans = [(base, lo, hi) for (base, page, lo, hi) in sh.span(0x1ff0, 0x2011, lambda: 'new')]
+    assert(spans == [(0x1000, 510, 512), (0x2000, 0, 3)])
+    assert(list(sh.items()) == [(0x1ff0, 'new'), (0x1ff8, 'old'), (0x2000, 'new'),
+                                (0x2008, 'new'), (0x2010, 'new')])
+    assert(len(sh) == 5)
+
+  def test_free(self):
+    sh = Shadow()
+    for a in range(0x0ff0, 0x3010, 8):
+      sh[a] = a
+    sh[0x1003] = 'odd'
+    sh[0x2ffb] = 'odd'
+    sh[0x4000] = 'keep'
+    sh['x'] = 'keep'
+    n = len(sh)
+    assert(sh.free(0x0ffc, 0x3001) == (0x3008 - 0x1000) // 8 + 2)
+    assert(len(sh) == n - (0x3008 - 0x1000) // 8 - 2)
+    assert(list(sh.keys()) == [0x0ff0, 0x0ff8, 0x3008, 0x4000, 'x'])
+    assert(sorted(sh.pages.keys()) == [0, 3, 4])  # Page 1 and 2 are gone
+    assert(sh.odd == [])
+    assert(sh.free(0x10000000, 0x20000000) == 0)
+
+  def test_missing(self):
+    sh = Shadow()
+    try:
+      sh[0x1000]
+    except KeyError:
+      return
+    assert(0)
+
+
+def main(argv):
+  unittest.main()
+
+if __name__ == "__main__":
+  sys.exit(main(sys.argv))
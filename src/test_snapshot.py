@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+
+'''
+@author:    Daniel S. Fava
+@email:     danielsf@ifi.uio.no
+@contact:   www.danielfava.com
+@copyright: CC BY 4.0, https://creativecommons.org/licenses/by/4.0/
+@date:      April 2020
+
+See https://github.com/dfava/paper.go.mm.drd
+'''
+
+import os
+import sys
+import tempfile
+import unittest
+
+import sortnp
+import snapshot
+from ft import *
+from mtft import MTFT
+from rdtrace import Recorder, replay
+from treeclock import TreeClock
+from testutil import state
+
+
+def detectors():
+  return [lambda: FT(stats_interval=None),
+          lambda: FT(stats_interval=None, gc_interval=50),
+          lambda: FT(stats_interval=None, vc=TreeClock),
+          lambda: FT(stats_interval=1000, stats_sink=statsink.sink(os.devnull)),
+          lambda: MTFT(stats_interval=1000, stats_sink=statsink.sink(os.devnull))]
+
+
+class TestSnapshot(unittest.TestCase):
+  def setUp(self):
+    self.dir = tempfile.TemporaryDirectory()
+    self.fname = os.path.join(self.dir.name, 'ft.snap')
+    self.trace = os.path.join(self.dir.name, 'trace.rdt')
+
+  def tearDown(self):
+    self.dir.cleanup()
+
+  def test_roundtrip(self):
+    evs = list(sortnp.events(200, N=20))
+    evs += [('write', 0, 0x1003), ('read', 0, 'x'), ('fork', 0, 1000, 2), ('end', 1000)]
+    for mk in detectors():
+      ft = mk()
+      ft.race = False
+      sortnp.run(ft, evs)
+      snapshot.save(ft, self.fname, 42)
+      got = mk()
+      assert(snapshot.load(got, self.fname) == 42)
+      assert(state(got) == state(ft))
+      assert(got.joiners == {1000 : 2} and str(got.finals[1000]) == str(ft.finals[1000]))
+      assert(got.reporter.summary() == ft.reporter.summary())
+      if ft.census:
+        for kind in ['procs', 'locks']:
+          assert(type(got.census[kind]) == type(ft.census[kind])) # e.g. MTFT's LockedCensus
+          assert(got.census[kind].hist == ft.census[kind].hist)
+          assert(got.census[kind].total == ft.census[kind].total)
+
+  def test_chunks(self):
+    ft = FT(stats_interval=None)
+    ft.fork(0, 1)
+    for addr in range(0, 8 * 100, 8):
+      ft.write(0, addr)
+    ft.rel(0, 'l')
+    ft.acq(1, 'l')
+    ft.read(1, 0)
+    ft.read(0, 0) # Read shared
+    chunk = snapshot.CHUNK
+    snapshot.CHUNK = 30
+    try:
+      snapshot.save(ft, self.fname, 0)
+    finally:
+      snapshot.CHUNK = chunk
+    tags = [tag for (tag, _, _) in list(snapshot.sections(self.fname))[1:]]
+    assert(tags == [snapshot.STATE] + [snapshot.VARS] * 4 + [snapshot.END])
+    got = FT(stats_interval=None)
+    snapshot.load(got, self.fname)
+    assert(state(got) == state(ft))
+    assert(type(got.vars[0].r) == tuple)
+
+  def test_background(self):
+    ft = FT(stats_interval=None)
+    ft.write(0, 0x10)
+    pid = snapshot.save(ft, self.fname, 1, background=True)
+    ft.write(0, 0x18) # Not in the snapshot
+    snapshot.wait(pid)
+    got = FT(stats_interval=None)
+    assert(snapshot.load(got, self.fname) == 1)
+    assert(0x10 in got.vars and 0x18 not in got.vars)
+
+  def test_resume(self):
+    evs = list(sortnp.events(300, N=20)) + [('fork', 0, 100), ('fork', 0, 101)]
+    for i in range(64):
+      evs.append(('write', 100 + i % 2, 0x10000 + (i // 2 % 8) * 8))
+    rec = Recorder(self.trace, bufsize=100)
+    sortnp.run(rec, evs)
+    rec.close()
+    ref = FT(stats_interval=None)
+    ref.race = False
+    (count, races) = replay(self.trace, ref, nevents=64)
+    assert(races)
+    ft = FT(stats_interval=None)
+    ft.race = False
+    replay(self.trace, ft, nevents=64, every=1000, snapshot=self.fname)
+    got = FT(stats_interval=None)
+    got.race = False
+    start = snapshot.load(got, self.fname)
+    assert(start > 0 and start % 64 == 0)
+    # Resume with batches that straddle the offset
+    (n, tail) = replay(self.trace, got, nevents=100, start=start)
+    assert(n == count)
+    assert(state(got) == state(ref))
+    assert([race.message for race in tail] == [race.message for race in races[-len(tail):]])
+    assert(got.reporter.summary() == ref.reporter.summary())
+
+
+def main(argv):
+  unittest.main()
+
+if __name__ == "__main__":
+  main(sys.argv)
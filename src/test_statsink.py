@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+
+'''
+@author:    Daniel S. Fava
+@email:     danielsf@ifi.uio.no
+@contact:   www.danielfava.com
+@copyright: CC BY 4.0, https://creativecommons.org/licenses/by/4.0/
+@date:      April 2020
+
+See https://github.com/dfava/paper.go.mm.drd
+'''
+
+import io
+import os
+import sys
+import tempfile
+import contextlib
+import statsink
+from ft import *
+import unittest
+
+DATA = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'data')
+
+try:
+  import numpy
+except ImportError:
+  numpy = None
+
+def records(n, gc=False, reads=False):
+  ret = []
+  for i in range(n):
+    rec = {'ops' : (i+1) * 100, 'procs' : i, 'procs_all' : 2*i, 'locks' : 3,
+           'vc_procs_live' : i, 'vc_procs' : 2*i, 'vc_locks_live' : 1, 'vc_locks' : 5}
+    if gc:
+      rec.update({'gc_passes' : i, 'gc_dead' : 0, 'gc_retired' : i, 'gc_dropped' : 7})
+    if reads:
+      rec.update({'rd_small' : i+1, 'rd_vcs' : 1, 'rd_entries' : 3*i+5, 'rd_shrunk' : i})
+    ret.append(('FT', rec))
+  return ret
+
+class TestStatSink(unittest.TestCase):
+  def setUp(self):
+    self.dir = tempfile.TemporaryDirectory()
+
+  def tearDown(self):
+    self.dir.cleanup()
+
+  def roundtrip(self, ext, rows, bufsize=3):
+    fname = os.path.join(self.dir.name, 'stats' + ext)
+    out = statsink.sink(fname, bufsize)
+    for (name, rec) in rows:
+      out.write(name, rec)
+    out.close()
+    return (fname, list(statsink.read(fname)))
+
+  def test_formats(self):
+    for ext in ['.out', '.csv', '.jsonl', '.rds']:
+      for (gc, reads) in [(False, False), (True, False), (True, True)]:
+        rows = records(10, gc, reads)
+        (fname, got) = self.roundtrip(ext, rows)
+        assert(got == rows), ext
+
+  def test_sink_types(self):
+    assert(type(statsink.sink()) == statsink.TextSink)
+    assert(type(statsink.sink('-')) == statsink.TextSink)
+    assert(type(statsink.sink('x.csv')) == statsink.CSVSink)
+    assert(type(statsink.sink('x.jsonl')) == statsink.JSONSink)
+    assert(type(statsink.sink('x.rds')) == statsink.ColumnSink)
+    self.assertRaises(TypeError, statsink.Sink) # Abstract
+
+  def test_buffered(self):
+    fname = os.path.join(self.dir.name, 'stats.csv')
+    out = statsink.sink(fname, 4)
+    for (name, rec) in records(3):
+      out.write(name, rec)
+    assert(not os.path.exists(fname))
+    out.write(*records(1)[0])
+    assert(len(list(statsink.read(fname))) == 4)
+    out.close()
+
+  def test_hist(self):
+    rows = records(4)
+    for (i, (name, rec)) in enumerate(rows):
+      rec.update({'sizes_procs' : {1 : i, 3 : 1}, 'sizes_locks' : {},
+                  'hist_procs' : {(0, 1) : i}})
+    for ext in ['.out', '.jsonl']:
+      (fname, got) = self.roundtrip(ext, rows)
+      assert(got == rows), ext
+    for ext in ['.csv', '.rds']:
+      (fname, got) = self.roundtrip(ext, rows)
+      assert(got == [(name, statsink.numeric(rec)) for (name, rec) in rows]), ext
+
+  def test_column_floats(self):
+    rows = [('FT', {'ops' : i, 'rate' : i / 2}) for i in range(5)] + \
+           [('Other', {'ops' : 9, 'rate' : 0.5})]
+    (fname, got) = self.roundtrip('.rds', rows, bufsize=100)
+    assert(got == rows)
+    assert(len(list(statsink.blocks(fname))) == 2)
+
+  def test_legacy(self):
+    got = list(statsink.read(os.path.join(DATA, 'sortnp.ft.out')))
+    assert(len(got) > 100)
+    assert(got[0][0] == 'FT')
+    assert(statsink.numeric(got[0][1]) == {'ops' : 10000, 'procs' : 6, 'procs_all' : 6, 'locks' : 5,
+                                           'vc_procs_live' : 8, 'vc_procs' : 16,
+                                           'vc_locks_live' : 5, 'vc_locks' : 19})
+    assert(got[0][1]['hist_locks'] == {(0, 1) : 5})
+
+  @unittest.skipIf(numpy == None, 'needs numpy')
+  def test_load(self):
+    legacy = os.path.join(DATA, 'sortnp.ft.out')
+    ref = statsink.load(legacy)
+    rows = list(statsink.read(legacy))
+    assert(list(ref['vc_locks']) == [rec['vc_locks'] for (_, rec) in rows])
+    lines = statsink.LOAD_LINES
+    statsink.LOAD_LINES = 7 # Chunks that end mid-record, and arrays that grow
+    try:
+      got = statsink.load(legacy)
+    finally:
+      statsink.LOAD_LINES = lines
+    for field in statsink.TEXT_FIELDS:
+      assert(list(got[field]) == list(ref[field])), field
+    for ext in ['.csv', '.jsonl', '.rds']:
+      (fname, _) = self.roundtrip(ext, rows, bufsize=1000)
+      got = statsink.load(fname)
+      for field in statsink.TEXT_FIELDS:
+        assert(list(got[field]) == list(ref[field])), (ext, field)
+
+  def test_ft(self):
+    fname = os.path.join(self.dir.name, 'stats.jsonl')
+    ft = FT(stats_interval=2, stats_sink=statsink.sink(fname))
+    ft.fork(0, 1)
+    for i in range(6):
+      ft.write(1, 8*i)
+    ft.sink.close()
+    got = list(statsink.read(fname))
+    assert([rec['ops'] for (_, rec) in got] == [2, 4, 6])
+    assert(got[0][0] == 'FT')
+
+  def test_ft_text(self):
+    ft = FT(stats_interval=1, gc_interval=1)
+    out = io.StringIO()
+    with contextlib.redirect_stdout(out):
+      ft.write(0, 'x')
+    assert(out.getvalue().splitlines() == [
+        "FT, ops=1, procs=1/1, locks=0, VC procs=1/1, VC locks=0/0",
+        "FT, ops=1, gc, passes=0, dead=0, retired=0, dropped=0"])
+
+
+def main(argv):
+  unittest.main()
+
+if __name__ == "__main__":
+  sys.exit(main(sys.argv))
@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+
+'''
+@author:    Daniel S. Fava
+@email:     danielsf@ifi.uio.no
+@contact:   www.danielfava.com
+@copyright: CC BY 4.0, https://creativecommons.org/licenses/by/4.0/
+@date:      April 2020
+
+See https://github.com/dfava/paper.go.mm.drd
+'''
+
+import io
+import os
+import re
+import sys
+import tempfile
+import contextlib
+import synth
+import bench
+import sortnp
+import rdtrace
+from ft import *
+import unittest
+
+class TestSynth(unittest.TestCase):
+  def test_params(self):
+    p = synth.params(procs=3)
+    assert(p['procs'] == 3)
+    assert(p['locks'] == synth.DEFAULTS['locks'])
+    self.assertRaises(AssertionError, synth.params, nosuch=1)
+
+  def test_deterministic(self):
+    a = list(synth.events(steps=500, seed=1))
+    b = list(synth.events(steps=500, seed=1))
+    c = list(synth.events(steps=500, seed=2))
+    assert(a == b)
+    assert(a != c)
+
+  def test_shape(self):
+    evs = list(synth.events(procs=10, depth=3, steps=1000, sharing=0))
+    forks = [ev for ev in evs if ev[0] == 'fork']
+    ends = [ev for ev in evs if ev[0] == 'end']
+    assert(len(forks) == 10 and len(ends) == 10)
+    # Every parent exists before it forks
+    known = {0}
+    for (_, parent, child, joiners) in forks:
+      assert(parent in known and joiners == 1)
+      known.add(child)
+    # Every child is joined by its parent once it ended
+    joins = [ev for ev in evs if ev[0] == 'join']
+    assert(sorted([(ev[1], ev[2]) for ev in joins]) == sorted([ev[1:3] for ev in forks]))
+    for ev in joins:
+      assert(evs.index(('end', ev[2])) < evs.index(ev))
+    assert(len([ev for ev in evs if ev[0] in ['read', 'write']]) == 1000)
+    evs = list(synth.events(steps=1000, reads=1))
+    assert(not [ev for ev in evs if ev[0] == 'write'])
+
+  def test_race_free(self):
+    for params in bench.SUITE.values():
+      params = dict(params, steps=2000, footprint=1 << 14)
+      for (name, mkrd) in bench.DETECTORS.items():
+        rd = mkrd()
+        assert(rd.process_batch(bench.pack(synth.events(**params))) == [])
+
+  def test_measure(self):
+    ret = bench.measure(('ft', synth.params(steps=1000)))
+    assert(ret['events'] == len(list(synth.events(steps=1000))))
+    assert(ret['races'] == 0)
+    assert(ret['vc_procs'] > 0)
+    assert(ret['ops_per_sec'] > 0)
+
+  def test_clocks(self):
+    with tempfile.TemporaryDirectory() as tmp:
+      fname = os.path.join(tmp, 'sortnp.rdt')
+      rec = rdtrace.Recorder(fname)
+      sortnp.run(rec, sortnp.events(200, N=20))
+      rec.close()
+      sync = bench.syncEvents(fname)
+      assert(0 < len(sync) // Event.size < rec.nevents)
+      out = io.StringIO()
+      with contextlib.redirect_stdout(out):
+        bench.clocks(fname, full=True)
+    lines = out.getvalue().split('\n')[1:-1]
+    assert([line.split()[0] for line in lines] == list(bench.CLOCKS.keys()))
+    # Same clocks and races with every backend; the timings differ
+    counts = [tuple(re.findall(r'(?:vc procs|vc locks|races)=(\d+)', line)) for line in lines]
+    assert(len(counts[0]) == 3 and len(set(counts)) == 1)
+
+
+def main(argv):
+  unittest.main()
+
+if __name__ == "__main__":
+  sys.exit(main(sys.argv))
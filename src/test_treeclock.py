@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+
+'''
+@author:    Daniel S. Fava
+@email:     danielsf@ifi.uio.no
+@contact:   www.danielfava.com
+@copyright: CC BY 4.0, https://creativecommons.org/licenses/by/4.0/
+@date:      April 2020
+
+See https://github.com/dfava/paper.go.mm.drd
+'''
+
+import os
+import sys
+import pickle
+import unittest
+
+import sortnp
+import statsink
+from ft import *
+from treeclock import *
+from testutil import randomOps
+
+
+def check(tc):
+  '''Asserts that the tree of tc is well formed'''
+  seen = set()
+  todo = [tc.root]
+  while todo:
+    u = todo.pop()
+    assert(u not in seen)
+    seen.add(u)
+    kids = tc.kids.get(u, [])
+    aclks = [tc.aclk[v] for v in kids]
+    assert(aclks == sorted(aclks))
+    for v in kids:
+      assert(tc.prnt[v] == u)
+    todo += kids
+  assert(seen - set([None]) == set(tc.vc.keys()))
+  assert(set(tc.prnt.keys()) == set(tc.aclk.keys()) == seen - set([tc.root]))
+
+
+def clocks(ft):
+  return ({pid : p.vc.vc for (pid, p) in ft.procs.items()},
+          {lid : l.vc.vc for (lid, l) in ft.locks.items()},
+          {pid : vc.vc for (pid, vc) in ft.finals.items()})
+
+
+class TestTreeClock(unittest.TestCase):
+
+  def test_tick(self):
+    tc = TreeClock()
+    assert(tc.tick(3) is tc)
+    assert(tc.vc == {3 : 1} and tc.root == 3)
+    tc.tick(3)
+    assert(tc[3] == 2 and tc[4] == 0)
+    check(tc)
+
+  def test_join(self):
+    (t, u, w) = (TreeClock().tick(0), TreeClock().tick(1), TreeClock().tick(2))
+    TreeClock.join(u, t)         # 1 learns 0@1
+    u.tick(1)
+    TreeClock.join(w, u)         # 2 learns 1@2, and through it 0@1
+    assert(w.vc == {2 : 1, 1 : 2, 0 : 1})
+    assert(w.kids[2] == [1] and w.kids[1] == [0])
+    check(w)
+    # Nothing new: stops at the root
+    assert(w.absorb(u) == 0)
+    # 0 moves on; 2 learns only what changed, and 0 moves up to 2
+    t.tick(0)
+    assert(w.absorb(t) == 1)
+    assert(w.vc == {2 : 1, 1 : 2, 0 : 2} and w.kids[2] == [1, 0] and not w.kids[1])
+    check(w)
+
+  def test_join_stops(self):
+    '''A join visits the entries that change, not the whole clock'''
+    root = TreeClock().tick(0)
+    for pid in range(1, 200):
+      TreeClock.join(root, TreeClock().tick(pid))
+    l = TreeClock.copy(TreeClock(), root)
+    p = TreeClock().tick(500)
+    TreeClock.join(p, l)
+    root.tick(0)
+    TreeClock.join(root, TreeClock().tick(200))
+    assert(len(p.updated(root)) == 2) # 0, and 200 under it
+    assert(p.absorb(root) == 2)
+    want = dict(root.vc)
+    want[500] = 1
+    assert(p.vc == want)
+    check(p)
+
+  def test_copy(self):
+    (t, u) = (TreeClock().tick(0), TreeClock().tick(1))
+    l = TreeClock.copy(TreeClock(), t)
+    assert(l is not t and l.vc == t.vc and l.root == 0)
+    TreeClock.join(u, l)
+    u.tick(1)
+    # Known: updated in place
+    assert(TreeClock.copy(l, u, True) is l)
+    assert(l.vc == u.vc and l.root == 1 and l.kids[1] == [0])
+    check(l)
+    # Not known: a copy, leaving l as it was
+    t.tick(0)
+    got = TreeClock.copy(l, t)
+    assert(got is not l and got.vc == t.vc and l.vc == u.vc)
+
+  def test_virtual(self):
+    tc = TreeClock(Epoch(1, 'a'), Epoch(2, 'b'))
+    assert(tc.root == None and tc.kids[None] == ['a', 'b'])
+    tc['a'] = 3
+    tc.inc('c')
+    assert(tc.vc == {'a' : 3, 'b' : 2, 'c' : 1})
+    check(tc)
+    # lub of two proc clocks is no proc's clock
+    (t, u) = (TreeClock().tick(0), TreeClock().tick(1))
+    lub = TreeClock.lub(t, u)
+    assert(lub.root == None and lub.vc == {0 : 1, 1 : 1})
+    p = TreeClock().tick(0)
+    p.tick(0)
+    assert(p.absorb(lub) == 1)
+    # A proc restored from plain entries takes the root on its next tick
+    tc = TreeClock.new(VC(Epoch(4, 0), Epoch(1, 1)))
+    tc.tick(0)
+    assert(tc.root == 0 and tc.kids[0] == [1] and tc.aclk[1] == 5)
+    check(tc)
+
+  def test_drop(self):
+    (t, u, w) = (TreeClock().tick(0), TreeClock().tick(1), TreeClock().tick(2))
+    TreeClock.join(u, t)
+    TreeClock.join(w, u)
+    assert(TreeClock.new(w).drop([1, 3]) == 1)
+    dropped = TreeClock.new(w)
+    dropped.drop([1])
+    assert(dropped.vc == {2 : 1, 0 : 1} and dropped.kids[2] == [0])
+    check(dropped)
+    dropped.drop([2])
+    assert(dropped.root == None and dropped.kids[None] == [0])
+    check(dropped)
+    assert(w.vc == {2 : 1, 1 : 1, 0 : 1}) # new() copies
+
+  def test_pickle(self):
+    (t, u) = (TreeClock().tick(0), TreeClock().tick(1))
+    TreeClock.join(u, t)
+    clone = pickle.loads(pickle.dumps(u))
+    assert((clone.vc, clone.root, clone.kids) == (u.vc, u.root, u.kids))
+
+
+class TestTreeClockFT(unittest.TestCase):
+
+  def test_same_as_dict(self):
+    '''Same clocks after every op, and the same races, as with VC'''
+    for seed in range(30):
+      ops = randomOps(seed, 600)
+      for kwargs in [{}, {'gc_interval' : 2}]:
+        (ref, ft) = (FT(stats_interval=None, **kwargs), FT(stats_interval=None, vc=TreeClock, **kwargs))
+        ref.race = ft.race = False
+        for op in ops:
+          want = getattr(ref, op[0])(*op[1:])
+          got = getattr(ft, op[0])(*op[1:])
+          assert(clocks(ft) == clocks(ref))
+          assert(type(got) == type(want))
+        for p in ft.procs.values():
+          check(p.vc)
+          assert(p.vc.root == p.id)
+        for l in ft.locks.values():
+          check(l.vc)
+        assert(ref.reporter.summary() == ft.reporter.summary())
+
+  def test_census(self):
+    for seed in range(5):
+      ft = FT(stats_interval=50, stats_sink=statsink.sink(os.devnull), vc=TreeClock)
+      ft.race = False
+      for op in randomOps(seed, 600):
+        getattr(ft, op[0])(*op[1:])
+      for (kind, dct) in [('procs', ft.procs), ('locks', ft.locks)]:
+        assert(ft.census[kind].total == sum([len(obj.vc.vc) for obj in dct.values()]))
+
+  def test_sortnp(self):
+    evs = list(sortnp.events(400, N=20))
+    ref = sortnp.run(FT(stats_interval=None), evs)
+    ft = sortnp.run(FT(stats_interval=None, vc=TreeClock), evs)
+    assert(clocks(ft) == clocks(ref))
+    assert(Stats.getNumVcEntries(ft, 'locks') == Stats.getNumVcEntries(ref, 'locks'))
+
+
+def main(argv):
+  unittest.main()
+
+if __name__ == "__main__":
+  sys.exit(main(sys.argv))
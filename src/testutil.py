@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+#
+# Event streams and helpers shared by the unit tests.
+
+'''
+@author:    Daniel S. Fava
+@email:     danielsf@ifi.uio.no
+@contact:   www.danielfava.com
+@copyright: CC BY 4.0, https://creativecommons.org/licenses/by/4.0/
+@date:      April 2020
+
+See https://github.com/dfava/paper.go.mm.drd
+'''
+
+import random
+
+import sortnp
+
+
+def serial(rd, ops):
+  '''Feeds ops to rd, without printing races'''
+  rd.race = False
+  return sortnp.run(rd, ops)
+
+
+def state(ft, ops=True):
+  '''The state of a detector, for comparisons; with ops, the op counts,
+  which MTFT only keeps approximately'''
+  return ([v.str(var, ft.pidmap.pids) for (var, v) in ft.vars.items()],
+          sorted([str(p) for p in ft.procs.values()]),
+          sorted([str(l) for l in ft.locks.values()]),
+          ft.dead, ft.retired, ft.pidmap.pids, ft.numOps if ops else None)
+
+
+def racy(seed, nprocs=6, steps=3000, naddrs=64):
+  '''Procs that first write to a word no one else orders, then take
+  random steps, locked or not, over naddrs shared words; every proc ends
+  and is joined by proc 0'''
+  rnd = random.Random(seed)
+  pids = list(range(1, nprocs + 1))
+  ops = [('fork', 0, pid, 1) for pid in pids]
+  for pid in pids:
+    ops.append(('write', pid, 0x100000 + 8 * rnd.randrange(8)))
+  for i in range(steps):
+    pid = rnd.choice(pids)
+    addr = 0x200000 + 8 * rnd.randrange(naddrs)
+    access = rnd.choice(['read', 'write'])
+    lock = rnd.choice([0x8, 0x10, None])
+    if lock:
+      ops += [('acq', pid, lock), (access, pid, addr), ('rel', pid, lock)]
+    else:
+      ops.append((access, pid, addr))
+  for pid in pids:
+    ops += [('end', pid), ('join', 0, pid)]
+  return ops
+
+
+def randomOps(seed, n=400):
+  '''Procs that fork, end and are joined, and sync with every kind of
+  release on a few locks while accessing a few variables'''
+  rnd = random.Random(seed)
+  live = [0]
+  ended = []
+  npids = 1
+  ops = []
+  for i in range(n):
+    pid = rnd.choice(live)
+    k = rnd.random()
+    if k < 0.08:
+      ops.append(('fork', pid, npids, 1))
+      live.append(npids)
+      npids += 1
+    elif k < 0.12 and pid != 0:
+      ops.append(('end', pid))
+      live.remove(pid)
+      ended.append(pid)
+    elif k < 0.15 and ended:
+      ops.append(('join', pid, ended.pop(rnd.randrange(len(ended)))))
+    elif k < 0.5:
+      ops.append((rnd.choice(['acq', 'acq', 'rel', 'rem', 'rea']), pid, rnd.randrange(4)))
+    else:
+      ops.append((rnd.choice(['read', 'write']), pid, 8 * rnd.randrange(6)))
+  return ops
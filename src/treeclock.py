@@ -0,0 +1,254 @@
+#!/usr/bin/env python3
+#
+# Tree clocks, a vector clock backend for FT whose joins and copies take
+# time proportional to the entries they change rather than to the size of
+# the clocks, see Mathur et al., "A Tree Clock Data Structure for Causal
+# Orderings in Concurrent Executions", ASPLOS'22.
+#
+# The entries of a clock are the nodes of a tree.  A proc's clock is rooted
+# at the proc; a child v of node u, attached when u's entry was aclk, was
+# learned by u at that time.  So a clock that knows u@aclk knows all of v's
+# subtree, and one that knows v@c, with c v's entry, knows v's subtree too.
+# A join walks the other clock from its root and stops at the first such
+# known subtree; children are kept in the order they were attached, so the
+# walk over a node's children stops at the first child known through its
+# attach clock.
+#
+# Clocks that are not the clock of a single proc at some time, e.g. a lock
+# released with rem or a read VC, have a virtual root, None, whose
+# children are attached at INF: walks never stop at it, which is always
+# sound but visits every child of the root.
+#
+# See `python3 bench.py clocks` for a comparison with the other backends.
+
+'''
+@author:    Daniel S. Fava
+@email:     danielsf@ifi.uio.no
+@contact:   www.danielfava.com
+@copyright: CC BY 4.0, https://creativecommons.org/licenses/by/4.0/
+@date:      April 2020
+
+See https://github.com/dfava/paper.go.mm.drd
+'''
+
+from ft import *
+
+INF = float('inf') # Attach clock of the children of a virtual root
+
+
+class TreeClock(VC):
+  '''A vector clock kept as a tree; updated in place by join, copy and
+  tick.  vc maps pids to their entries, as for VC; prnt and aclk map the
+  pids but the root to their parent and attach clock; kids maps a pid, or
+  None for a virtual root, to its children in attach order.  fresh lists
+  the pids the last graft() added, see VC.inplace.'''
+  __slots__ = ('root', 'prnt', 'aclk', 'kids', 'fresh')
+  inplace = True
+
+  def __init__(self, *epochs):
+    VC.__init__(self)
+    self.root = None
+    self.prnt = {}
+    self.aclk = {}
+    self.kids = {}
+    self.fresh = []
+    for epoch in epochs:
+      assert(type(epoch) == Epoch)
+    assert(len(set([epoch.pid for epoch in epochs])) == len(epochs))
+    for epoch in epochs:
+      self[epoch.pid] = epoch.c
+
+  def attach(self, pid, parent, aclk):
+    self.prnt[pid] = parent
+    self.aclk[pid] = aclk
+    try:
+      self.kids[parent].append(pid)
+    except KeyError:
+      self.kids[parent] = [pid]
+
+  def detach(self, pid):
+    self.kids[self.prnt.pop(pid)].remove(pid)
+    del(self.aclk[pid])
+
+  def virtualize(self):
+    '''Hangs the root under a virtual root'''
+    if self.root != None:
+      self.attach(self.root, None, INF)
+      self.root = None
+
+  def __setitem__(self, key, c):
+    # The new entry is known to no other node: it goes under a virtual root
+    if self.prnt.get(key, key) != None:
+      self.virtualize()
+      if key in self.prnt:
+        self.detach(key)
+      self.attach(key, None, INF)
+    self.vc[key] = c
+
+  def inc(self, pid):
+    self[pid] = self[pid] + 1
+
+  def tick(self, pid):
+    if self.root != pid:
+      self.reroot(pid)
+    self.vc[pid] += 1
+    return self
+
+  def reroot(self, pid):
+    '''Makes pid, whose clock this is, the root.  The old root, or the
+    children of a virtual one, are attached under pid at its next entry,
+    see absorb().'''
+    if pid in self.prnt:
+      self.detach(pid)
+    c = self.vc.setdefault(pid, 0)
+    old = self.kids.pop(None, []) if self.root == None else [self.root]
+    self.root = pid
+    for u in old:
+      self.attach(u, pid, c + 1)
+
+  def drop(self, pids):
+    '''Removes the entries of pids; the children of a removed node take
+    its place.  Returns how many there were.'''
+    ret = 0
+    for pid in pids:
+      if pid not in self.vc:
+        continue
+      ret += 1
+      del(self.vc[pid])
+      kids = self.kids.pop(pid, [])
+      if pid == self.root:
+        (parent, aclk) = (None, INF)
+        self.root = None
+        self.kids.setdefault(None, []).extend(kids)
+      else:
+        (parent, aclk) = (self.prnt.pop(pid), self.aclk.pop(pid))
+        siblings = self.kids[parent]
+        i = siblings.index(pid)
+        siblings[i:i+1] = kids
+      for u in kids:
+        (self.prnt[u], self.aclk[u]) = (parent, aclk)
+    return ret
+
+  def updated(self, other):
+    '''The nodes of other whose entries are greater than in self, parents
+    first, starting with other's root'''
+    (vc, ovc, okids, oaclk) = (self.vc, other.vc, other.kids, other.aclk)
+    ret = []
+    todo = [other.root]
+    while todo:
+      u = todo.pop()
+      ret.append(u)
+      kids = okids.get(u)
+      if kids:
+        known = vc.get(u, 0)
+        for v in reversed(kids):
+          if vc.get(v, 0) < ovc[v]:
+            todo.append(v)
+          elif oaclk[v] <= known:
+            break
+    return ret
+
+  def graft(self, other, nodes, top, aclk):
+    '''Moves nodes, from updated(other), to where they are in other, with
+    other's entries; those directly under other's root go under top, at
+    aclk.  top itself becomes the root.'''
+    (vc, prnt, aclks, kids) = (self.vc, self.prnt, self.aclk, self.kids)
+    (ovc, oprnt, oaclk) = (other.vc, other.prnt, other.aclk)
+    self.fresh = fresh = []
+    for u in nodes: # Detached; their entries in prnt and aclk are replaced
+      if u in prnt:
+        kids[prnt[u]].remove(u)
+    for u in nodes:
+      if u == None:
+        continue
+      if u not in vc:
+        fresh.append(u)
+      vc[u] = ovc[u]
+      if u == top:
+        prnt.pop(u, None)
+        aclks.pop(u, None)
+        continue
+      parent = oprnt.get(u)
+      if parent == None:
+        (prnt[u], aclks[u]) = (top, aclk)
+        parent = top
+      else:
+        (prnt[u], aclks[u]) = (parent, oaclk[u])
+      try:
+        kids[parent].append(u)
+      except KeyError:
+        kids[parent] = [u]
+
+  def absorb(self, other):
+    '''self \\cup other, in place.  Returns the number of entries updated.
+
+    What the root learns is attached at the root's next entry: a clock
+    may already know its current one, e.g. the lock of a rea, which gets
+    the proc's clock from before the join.'''
+    if type(other) != type(self):
+      other = self.new(other)
+    (vc, ovc, root) = (self.vc, other.vc, other.root)
+    if root != None and ovc[root] <= vc.get(root, 0):
+      return 0 # Knows other's root, so all of other
+    if self.root != None and ovc.get(self.root, 0) > vc[self.root]:
+      self.virtualize() # No longer the clock of its root
+    nodes = self.updated(other)
+    self.graft(other, nodes, self.root, INF if self.root == None else vc[self.root] + 1)
+    return len(nodes) - (root == None)
+
+  @classmethod
+  def join(cls, vc, other):
+    vc.absorb(other)
+    return vc
+
+  @classmethod
+  def copy(cls, vc, other, known=False):
+    '''With known, vc <= other, so only the entries other has updated need
+    to move, and vc is updated in place.  Otherwise other is copied.'''
+    root = other.root
+    if not known or type(other) != type(vc) or root == None:
+      return cls.new(other)
+    if other.vc[root] <= vc.vc.get(root, 0):
+      return vc # Knows other, so is equal to it
+    old = vc.root
+    nodes = vc.updated(other)
+    vc.graft(other, nodes, root, None)
+    c = other.vc[root] + 1 # See absorb()
+    if old == None:
+      for u in vc.kids.pop(None, []):
+        vc.attach(u, root, c)
+    elif old != root and old not in vc.prnt:
+      vc.attach(old, root, c)
+    vc.root = root
+    return vc
+
+  @classmethod
+  def new(cls, other):
+    assert(isinstance(other, VC))
+    ret = cls()
+    if isinstance(other, TreeClock):
+      ret.vc = dict(other.vc)
+      ret.root = other.root
+      ret.prnt = dict(other.prnt)
+      ret.aclk = dict(other.aclk)
+      ret.kids = {u : list(kids) for (u, kids) in other.kids.items() if kids}
+    else:
+      for (pid, c) in other.vc.items():
+        ret[pid] = c
+    return ret
+
+  @classmethod
+  def lub(cls, vc1, vc2):
+    '''A new clock, with a virtual root'''
+    ret = cls.new(vc1)
+    ret.virtualize()
+    ret.absorb(vc2)
+    return ret
+
+
+class TreeFT(FT):
+  '''FT with tree clocks, e.g. for rdtrace.py replay --rd treeclock:TreeFT'''
+
+  def __init__(self, *args, **kwargs):
+    kwargs.setdefault('vc', TreeClock)
+    FT.__init__(self, *args, **kwargs)